@@ -0,0 +1,54 @@
+# DecoracionesMori/middleware.py
+"""
+Versiones async-capable de los middleware de terceros que solo son síncronos.
+
+Con un solo middleware síncrono en la cadena, Django adapta toda la pila a
+síncrona bajo ASGI y cada petición a una vista async (p. ej. las búsquedas de
+DNI/RUC) ocupa un hilo del pool de sync_to_async mientras espera a la API
+externa. Estas subclases hacen lo mismo que las originales, pero también
+pueden esperar a la vista dentro del event loop. allauth exige su propia ruta
+en MIDDLEWARE; INSTALLED_APPS usa accounts.apps.AllauthAccountConfig, que
+también acepta la de AccountMiddleware de este módulo.
+"""
+from allauth.account import middleware as allauth_middleware
+from allauth.core import context
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django_plotly_dash import middleware as dpd_middleware
+
+
+class AsyncCapableMixin:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        super().__init__(get_response)
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return super().__call__(request)
+
+
+class AccountMiddleware(AsyncCapableMixin, allauth_middleware.AccountMiddleware):
+    """allauth.account.middleware.AccountMiddleware, también para vistas async."""
+
+    async def __acall__(self, request):
+        with context.request_context(request):
+            response = await self.get_response(request)
+            if hasattr(request.session, '_session_cache'):
+                self._remove_dangling_login(request, response)
+            else:
+                # La sesión aún no se leyó: cargarla consulta la BD, fuera del event loop
+                await sync_to_async(self._remove_dangling_login)(request, response)
+            return response
+
+
+class PlotlyDashMiddleware(AsyncCapableMixin, dpd_middleware.BaseMiddleware):
+    """django_plotly_dash.middleware.BaseMiddleware, también para vistas async."""
+
+    async def __acall__(self, request):
+        request.dpd_content_handler = dpd_middleware.ContentCollector()
+        response = await self.get_response(request)
+        return request.dpd_content_handler.adjust_response(response)
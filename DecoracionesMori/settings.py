@@ -70,7 +70,8 @@ INSTALLED_APPS = [
     # Allauth
     'django.contrib.sites',
     'allauth',
-    'allauth.account',
+    # allauth.account con el chequeo de middleware que acepta la versión async-capable
+    'accounts.apps.AllauthAccountConfig',
     'allauth.socialaccount',
     'allauth.socialaccount.providers.google',
 
@@ -84,14 +85,48 @@ PLOTLY_DASH = {
     "access_without_dash": False,
 }
 
-CHANNEL_LAYERS = {
-    'default': {
-        'BACKEND': 'channels.layers.InMemoryChannelLayer'
+# Caché compartida entre procesos si hay Redis (candados de singleflight,
+# circuit breaker, versión del calendario); si no, la caché local por defecto
+# y la versión del calendario pasa a la BD (ver appointments/cache.py).
+if os.getenv('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django_redis.cache.RedisCache',
+            'LOCATION': os.getenv('REDIS_URL'),
+        }
+    }
+
+# Con REDIS_URL los cambios del calendario llegan a todos los procesos/nodos;
+# sin él, la capa en memoria solo sirve para un único proceso.
+if os.getenv('REDIS_URL'):
+    CHANNEL_LAYERS = {
+        'default': {
+            'BACKEND': 'channels_redis.core.RedisChannelLayer',
+            'CONFIG': {'hosts': [os.getenv('REDIS_URL')]},
+        }
+    }
+else:
+    CHANNEL_LAYERS = {
+        'default': {
+            'BACKEND': 'channels.layers.InMemoryChannelLayer'
+        }
     }
-}
 
 AUTH_USER_MODEL = 'accounts.User'
 
+# Cupo de citas por día cuando el ScheduledWorkDay no define uno propio
+APPOINTMENTS_DAILY_CAPACITY = 3
+# APIs de consulta DNI (apiperu.dev) y RUC (decolecta); ver appointments/identity.py
+APIPERU_TOKEN = os.getenv('APIPERU_TOKEN', '685c2d1a88c240a1482b75eed616a993e24e6bfb9b03739853046adf8dfb2863')
+DECOLECTA_API_KEY = os.getenv('DECOLECTA_API_KEY', 'sk_12062.BW7ZrmYioluxNOeo0nKnUQlO6Gs6yAUJ')
+# URLs base configurables (p. ej. apuntar al proveedor falso: manage.py fake_identity_provider)
+APIPERU_BASE_URL = os.getenv('APIPERU_BASE_URL', 'https://apiperu.dev')
+DECOLECTA_BASE_URL = os.getenv('DECOLECTA_BASE_URL', 'https://api.decolecta.com')
+IDENTITY_LOOKUP_TTL_DAYS = 30
+IDENTITY_LOOKUP_NEGATIVE_TTL_HOURS = 24
+# Minutos que se guarda el cupo de un día mientras el cliente completa el formulario
+APPOINTMENTS_HOLD_MINUTES = 10
+
 
 AUTHENTICATION_BACKENDS = [
     # Django's default authentication backend
@@ -277,8 +312,11 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
-    'allauth.account.middleware.AccountMiddleware',
-    'django_plotly_dash.middleware.BaseMiddleware',
+    # Versiones async-capable de allauth.account.middleware.AccountMiddleware y
+    # django_plotly_dash.middleware.BaseMiddleware (con middleware solo síncronos,
+    # toda la pila corre en un hilo bajo ASGI)
+    'DecoracionesMori.middleware.AccountMiddleware',
+    'DecoracionesMori.middleware.PlotlyDashMiddleware',
 
 
 ]
@@ -326,6 +364,7 @@ LOGGING = {
 }
 
 WSGI_APPLICATION = 'DecoracionesMori.wsgi.application'
+ASGI_APPLICATION = 'DecoracionesMori.asgi.application'
 
 
 # Database
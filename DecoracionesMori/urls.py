@@ -36,6 +36,7 @@ from clients.models import ClientProfile
 from django.views.generic import RedirectView
 from appointments import admin_views as appointments_api_views # Alias para claridad
 from inventory import admin_views as inventory_api_views # ¡Importa las vistas API de inventory!
+from inventory.alerts import below_minimum_statuses
 
 # Vista para el dashboard directamente en urls.py
 @staff_member_required
@@ -79,12 +80,18 @@ def dashboard_data(request):
             .order_by('-date')[:30]
         )
         
+        # 6. Productos bajo el stock mínimo (bandera indexada, la mantiene el registro de movimientos)
+        low_stock_products = list(
+            below_minimum_statuses().values('product_id', 'product__name', 'current_stock', 'product__stock_min')[:20]
+        )
+        
         data = {
             'appointments_by_status': appointments_by_status,
             'top_services': top_services,
             'appointments_by_month': appointments_by_month,
             'clients_by_type': clients_by_type,
-            'recent_appointments': recent_appointments
+            'recent_appointments': recent_appointments,
+            'low_stock_products': low_stock_products
         }
         
         return JsonResponse(data)
@@ -124,6 +131,7 @@ path('admin/reports/', include('reports.urls', namespace='reports')),
     path('admin_api/calendar-events/', appointments_api_views.calendar_events_api, name='admin_calendar_events_api'),
     path('admin_api/update-appointment/', appointments_api_views.update_appointment_api, name='admin_update_appointment_api'),
     path('admin_api/appointment-stats/', appointments_api_views.appointment_stats_api, name='admin_appointment_stats_api'),
+    path('admin_api/appointment-conflicts/', appointments_api_views.appointment_conflicts_api, name='admin_appointment_conflicts_api'),
     path('admin_api/workday-schedule/', appointments_api_views.workday_schedule_api, name='admin_workday_schedule_api'),
     path('admin_api/inventory-movement-events/', inventory_api_views.inventory_movement_events_api, name='admin_inventory_movement_events_api'),
     path('admin_api/export-inventory-report-pdf/', inventory_api_views.export_inventory_report_pdf, name='admin_export_inventory_report_pdf'),
@@ -1,7 +1,7 @@
 import random
 import string
 from allauth.socialaccount.adapter import DefaultSocialAccountAdapter
-from django.core.mail import EmailMultiAlternatives
+from appointments.outbox import enqueue_email
 from django.template.loader import render_to_string
 from django.conf import settings
 from django.urls import reverse
@@ -67,12 +67,8 @@ class CustomSocialAccountAdapter(DefaultSocialAccountAdapter):
         from_email = getattr(settings, 'DEFAULT_FROM_EMAIL', 'noreply@decoracionesmori.com')
         to_email = user.email
         
-        # Crea el objeto EmailMultiAlternatives para enviar tanto texto como HTML
-        msg = EmailMultiAlternatives(subject, text_content, from_email, [to_email])
-        msg.attach_alternative(html_content, "text/html")
-        
-        # Envía el correo
-        msg.send()
+        # Deja el correo (texto + HTML) en la cola de salida
+        enqueue_email(subject, text_content, [to_email], html_body=html_content, from_email=from_email)
     
     def send_welcome_email(self, request, user):
         """
@@ -97,9 +93,5 @@ class CustomSocialAccountAdapter(DefaultSocialAccountAdapter):
         from_email = getattr(settings, 'DEFAULT_FROM_EMAIL', 'noreply@decoracionesmori.com')
         to_email = user.email
         
-        # Crea el objeto EmailMultiAlternatives para enviar tanto texto como HTML
-        msg = EmailMultiAlternatives(subject, text_content, from_email, [to_email])
-        msg.attach_alternative(html_content, "text/html")
-        
-        # Envía el correo
-        msg.send()
\ No newline at end of file
+        # Deja el correo (texto + HTML) en la cola de salida
+        enqueue_email(subject, text_content, [to_email], html_body=html_content, from_email=from_email)
\ No newline at end of file
@@ -1,7 +1,27 @@
+from allauth.account.apps import AccountConfig
 from django.apps import AppConfig
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
 
 
 class AccountsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'accounts'
     verbose_name = 'Cuentas'
+
+
+class AllauthAccountConfig(AccountConfig):
+    """
+    allauth.account, aceptando la versión async-capable de su middleware
+    (DecoracionesMori.middleware.AccountMiddleware) en MIDDLEWARE.
+    """
+    required_middleware = (
+        'allauth.account.middleware.AccountMiddleware',
+        'DecoracionesMori.middleware.AccountMiddleware',
+    )
+
+    def ready(self):
+        if not any(path in settings.MIDDLEWARE for path in self.required_middleware):
+            raise ImproperlyConfigured(
+                f"{self.required_middleware[-1]} must be added to settings.MIDDLEWARE"
+            )
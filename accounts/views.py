@@ -8,7 +8,7 @@ from django.utils import timezone
 from datetime import timedelta
 import random
 import string
-from django.core.mail import EmailMultiAlternatives
+from appointments.outbox import enqueue_email
 from django.template.loader import render_to_string
 from django.conf import settings
 from django.urls import reverse
@@ -207,12 +207,8 @@ def send_welcome_email(request, user):
     from_email = getattr(settings, 'DEFAULT_FROM_EMAIL', 'noreply@decoracionesmori.com')
     to_email = user.email
     
-    # Crea el objeto EmailMultiAlternatives para enviar tanto texto como HTML
-    msg = EmailMultiAlternatives(subject, text_content, from_email, [to_email])
-    msg.attach_alternative(html_content, "text/html")
-    
-    # Envía el correo
-    msg.send()
+    # Deja el correo (texto + HTML) en la cola de salida
+    enqueue_email(subject, text_content, [to_email], html_body=html_content, from_email=from_email)
 
 @login_required
 def resend_verification_code(request):
@@ -261,9 +257,5 @@ def send_verification_email(request, user, verification_code):
     from_email = 'noreply@decoracionesmori.com'  # Configura esto en settings.py
     to_email = user.email
     
-    # Crea el objeto EmailMultiAlternatives para enviar tanto texto como HTML
-    msg = EmailMultiAlternatives(subject, text_content, from_email, [to_email])
-    msg.attach_alternative(html_content, "text/html")
-    
-    # Envía el correo
-    msg.send()
\ No newline at end of file
+    # Deja el correo (texto + HTML) en la cola de salida
+    enqueue_email(subject, text_content, [to_email], html_body=html_content, from_email=from_email)
\ No newline at end of file
@@ -1,6 +1,6 @@
 from django.contrib import admin
 from django.utils.translation import gettext_lazy as _
-from .models import Appointment, WorkScheduleTemplate, ScheduledWorkDay
+from .models import Appointment, WorkScheduleTemplate, ScheduledWorkDay, Holiday, OutboundEmail, IdentityLookup
 from django.contrib import messages 
 from django.shortcuts import get_object_or_404, redirect
 from urllib.parse import quote
@@ -8,33 +8,76 @@ from services.models import Service
 from django.contrib.auth import get_user_model
 from django.urls import reverse 
 from django.utils.html import format_html
+from django.utils import timezone
 # Quitamos las importaciones de envio de correo de aquí, ya no se usan en esta vista
 from .utils import check_and_cancel_expired_appointments 
+from .workdays import materialize_months_ahead, DEFAULT_MONTHS_AHEAD
 
 User = get_user_model() 
 
 # --- Admin para Modelos de Horario ---
 
+@admin.action(description=f"Generar días programados (próximos {DEFAULT_MONTHS_AHEAD} meses)")
+def materialize_workdays_action(modeladmin, request, queryset):
+    # Usa la plantilla y los feriados completos, no solo las filas seleccionadas
+    created = materialize_months_ahead()
+    modeladmin.message_user(request, f"Se generaron {created} día(s) programado(s) para los próximos {DEFAULT_MONTHS_AHEAD} meses.", level=messages.SUCCESS)
+
 @admin.register(WorkScheduleTemplate)
 class WorkScheduleTemplateAdmin(admin.ModelAdmin):
     list_display = ('get_day_of_week_display', 'start_time', 'end_time', 'is_working_day')
     list_editable = ('start_time', 'end_time', 'is_working_day')
     ordering = ('day_of_week',)
 
+    actions = [materialize_workdays_action]
+
     def get_day_of_week_display(self, obj):
         return obj.get_day_of_week_display()
     get_day_of_week_display.short_description = _('Día de la semana')
 
+@admin.register(Holiday)
+class HolidayAdmin(admin.ModelAdmin):
+    list_display = ('date', 'name', 'is_recurring')
+    list_filter = ('is_recurring',)
+    search_fields = ('name',)
+    date_hierarchy = 'date'
+    actions = [materialize_workdays_action]
+
 # --- MODIFICACIÓN EN ScheduledWorkDayAdmin ---
 @admin.register(ScheduledWorkDay)
 class ScheduledWorkDayAdmin(admin.ModelAdmin):
     change_list_template = 'admin/appointments/calendar.html'
+    # La cancelación de citas vencidas ya no corre al abrir el calendario:
+    # se ejecuta con `manage.py cancel_expired_appointments` (cron).
 
-    def changelist_view(self, request, extra_context=None):
-        cancelled = check_and_cancel_expired_appointments(request)
-        if cancelled > 0:
-            messages.warning(request, f"MANTENIMIENTO: Se han cancelado {cancelled} citas vencidas automáticamente.")
-        return super().changelist_view(request, extra_context=extra_context)
+# --- Cola de correos ---
+@admin.register(OutboundEmail)
+class OutboundEmailAdmin(admin.ModelAdmin):
+    list_display = ('id', 'subject', 'get_recipients', 'status', 'attempts', 'next_attempt_at', 'created_at', 'sent_at')
+    list_filter = ('status', 'created_at')
+    search_fields = ('subject', 'recipients')
+    readonly_fields = ('created_at', 'sent_at', 'attempts', 'last_error')
+    list_per_page = 50
+    actions = ['action_retry']
+
+    def get_recipients(self, obj):
+        return ', '.join(obj.recipients)
+    get_recipients.short_description = _('Destinatarios')
+
+    def action_retry(self, request, queryset):
+        count = queryset.exclude(status=OutboundEmail.STATUS_SENT).update(
+            status=OutboundEmail.STATUS_PENDING, attempts=0, next_attempt_at=timezone.now()
+        )
+        self.message_user(request, f"{count} correo(s) vuelven a la cola de envío.", level=messages.SUCCESS)
+    action_retry.short_description = "Reintentar envío de los correos seleccionados"
+
+# --- Consultas DNI/RUC guardadas ---
+@admin.register(IdentityLookup)
+class IdentityLookupAdmin(admin.ModelAdmin):
+    list_display = ('doc_type', 'number', 'found', 'fetched_at', 'expires_at')
+    list_filter = ('doc_type', 'found')
+    search_fields = ('number',)
+    readonly_fields = ('doc_type', 'number', 'found', 'data', 'fetched_at', 'expires_at')
 
 # --- Admin para Citas ---
 @admin.register(Appointment)
@@ -55,7 +98,7 @@ class AppointmentAdmin(admin.ModelAdmin):
     list_display_links = ('id', 'client')
     list_per_page = 25
     
-    actions = ['action_clean_expired_appointments']
+    actions = ['action_clean_expired_appointments', 'action_find_staff_conflicts']
 
     fieldsets = (
         (_('Información Principal'), {
@@ -73,10 +116,6 @@ class AppointmentAdmin(admin.ModelAdmin):
         }),
     )
 
-    def changelist_view(self, request, extra_context=None):
-        cancelled = check_and_cancel_expired_appointments(request)
-        return super().changelist_view(request, extra_context=extra_context)
-
     def action_clean_expired_appointments(self, request, queryset):
         cancelled = check_and_cancel_expired_appointments(request)
         if cancelled == 0:
@@ -86,6 +125,36 @@ class AppointmentAdmin(admin.ModelAdmin):
             
     action_clean_expired_appointments.short_description = "Verificar y Cancelar citas vencidas (Regla 24h)"
 
+    CONFLICTS_IN_MESSAGE = 10
+
+    def action_find_staff_conflicts(self, request, queryset):
+        from .conflicts import find_conflicts
+        from django.db.models import Min, Max
+        bounds = queryset.aggregate(start=Min('appointment_date'), end=Max('appointment_date'))
+        if not bounds['start']:
+            self.message_user(request, "Las citas seleccionadas no tienen fecha.", level=messages.INFO)
+            return
+        conflicts = find_conflicts(bounds['start'], bounds['end'])
+        if not conflicts:
+            self.message_user(request, "No hay cruces de horario del personal en esas fechas.", level=messages.SUCCESS)
+            return
+        # Un solo mensaje con el resumen; el detalle completo está en /admin_api/appointment-conflicts/
+        details = []
+        for conflict in conflicts[:self.CONFLICTS_IN_MESSAGE]:
+            first, second = conflict['appointments']
+            details.append(
+                f"{conflict['staff_name']} el {conflict['date']}: #{first['id']} ({first['start']}-{first['end']}) "
+                f"con #{second['id']} ({second['start']}-{second['end']})"
+            )
+        remaining = len(conflicts) - len(details)
+        self.message_user(
+            request,
+            f"Se encontraron {len(conflicts)} cruce(s) de horario del personal: " + "; ".join(details)
+            + (f"; y {remaining} más." if remaining else "."),
+            level=messages.WARNING,
+        )
+    action_find_staff_conflicts.short_description = "Detectar cruces de horario del personal (fechas seleccionadas)"
+
     def get_client_full_name(self, obj):
         if obj.client:
             return obj.client.get_full_name() or obj.client.username
@@ -133,29 +202,72 @@ class AppointmentAdmin(admin.ModelAdmin):
         ]
         return custom_urls + urls
 
+    STATS_GRANULARITIES = ('day', 'week', 'month')
+    STATS_STATUSES = ('confirmed', 'pending', 'completed')
+
     def appointments_stats_api_local(self, request):
+        """
+        Series de citas creadas por estado (confirmed/pending/completed).
+        Parámetros GET opcionales: start, end (YYYY-MM-DD, por defecto los
+        últimos 30 días) y granularity (day/week/month). Una sola consulta
+        agrupada; los periodos sin citas se rellenan con cero.
+        """
         from django.http import JsonResponse
-        from django.utils import timezone
+        from django.db.models import Count, Q, DateField
+        from django.db.models.functions import Trunc
+        from datetime import datetime, timedelta
+
+        granularity = request.GET.get('granularity', 'day')
+        if granularity not in self.STATS_GRANULARITIES:
+            return JsonResponse({'error': 'granularity debe ser day, week o month'}, status=400)
+        try:
+            end_date = (datetime.strptime(request.GET['end'], '%Y-%m-%d').date()
+                        if request.GET.get('end') else timezone.now().date())
+            start_date = (datetime.strptime(request.GET['start'], '%Y-%m-%d').date()
+                          if request.GET.get('start') else end_date - timedelta(days=30))
+        except ValueError:
+            return JsonResponse({'error': 'Formato de fecha inválido (YYYY-MM-DD)'}, status=400)
+        if start_date > end_date:
+            return JsonResponse({'error': 'start debe ser anterior a end'}, status=400)
+
+        rows = (
+            self.model.objects
+            .filter(created_at__date__range=(start_date, end_date))
+            .annotate(period=Trunc('created_at', granularity, output_field=DateField()))
+            .values('period')
+            .annotate(**{status: Count('id', filter=Q(status=status)) for status in self.STATS_STATUSES})
+            .order_by('period')
+        )
+        by_period = {row['period']: row for row in rows}
+
+        data = {'dates': [], 'granularity': granularity}
+        data.update({status: [] for status in self.STATS_STATUSES})
+        for period in self._stats_periods(start_date, end_date, granularity):
+            row = by_period.get(period, {})
+            data['dates'].append(period.isoformat())
+            for status in self.STATS_STATUSES:
+                data[status].append(row.get(status, 0))
+        return JsonResponse(data)
+
+    @staticmethod
+    def _stats_periods(start_date, end_date, granularity):
+        """Inicio de cada periodo entre start_date y end_date, igual que Trunc en la BD."""
         from datetime import timedelta
-        
-        end_date = timezone.now()
-        start_date = end_date - timedelta(days=30)
-        appointments = self.model.objects.filter(created_at__range=[start_date, end_date])
-        dates = []
-        confirmed = []
-        pending = []
-        completed = []
-        current_date_iter = start_date
-        while current_date_iter <= end_date:
-            dates.append(current_date_iter.date().isoformat())
-            day_appointments = appointments.filter(created_at__date=current_date_iter.date())
-            confirmed.append(day_appointments.filter(status='confirmed').count())
-            pending.append(day_appointments.filter(status='pending').count())
-            completed.append(day_appointments.filter(status='completed').count())
-            current_date_iter += timedelta(days=1)
-        return JsonResponse({
-            'dates': dates, 'confirmed': confirmed, 'pending': pending, 'completed': completed,
-        })
+
+        if granularity == 'week':
+            current = start_date - timedelta(days=start_date.weekday())
+        elif granularity == 'month':
+            current = start_date.replace(day=1)
+        else:
+            current = start_date
+        while current <= end_date:
+            yield current
+            if granularity == 'week':
+                current += timedelta(days=7)
+            elif granularity == 'month':
+                current = (current.replace(day=28) + timedelta(days=4)).replace(day=1)
+            else:
+                current += timedelta(days=1)
 
     def generate_invoice_button(self, obj):
         from django.urls import reverse
@@ -2,103 +2,104 @@
 from django.shortcuts import get_object_or_404
 from django.http import JsonResponse
 from django.contrib.admin.views.decorators import staff_member_required
-from django.views.decorators.http import require_http_methods # No usado directamente aquí, pero puede ser útil
+from django.views.decorators.http import require_http_methods, condition
+from django.core.cache import cache
+from django.views.decorators.cache import cache_control
 from django.utils import timezone
-from django.db.models import Count
+from django.db.models import Count, Q
 from django.core.serializers.json import DjangoJSONEncoder
 from datetime import datetime, timedelta, time
 import json
 
 from .models import Appointment, ScheduledWorkDay, WorkScheduleTemplate
+from .availability import resolve_schedule, SOURCE_WORKDAY
+from .conflicts import staff_conflicts, find_conflicts
+from .realtime import appointment_event
+from .cache import calendar_cache_key, get_calendar_version, CALENDAR_CACHE_TIMEOUT
 from services.models import Service # Asegúrate que esta app y modelo existan
 from django.contrib.auth import get_user_model
 
 User = get_user_model()
 
-@staff_member_required
-def calendar_events_api(request):
+def _parse_calendar_params(request):
+    """Devuelve (start_date, end_date, service_filter, staff_filter) o lanza ValueError."""
     start_str = request.GET.get('start')
     end_str = request.GET.get('end')
-    service_filter = request.GET.get('service')
-    staff_filter = request.GET.get('staff')
-
     if not start_str or not end_str:
-        return JsonResponse({'error': 'Start and end dates required'}, status=400)
+        raise ValueError('Start and end dates required')
+    start_date = datetime.fromisoformat(start_str.replace('Z', '+00:00')).date()
+    end_date = datetime.fromisoformat(end_str.replace('Z', '+00:00')).date()
+    return start_date, end_date, request.GET.get('service') or 'all', request.GET.get('staff') or 'all'
+
+
+def _calendar_cache_key(request):
+    try:
+        params = _parse_calendar_params(request)
+    except ValueError:
+        return None
+    return calendar_cache_key(*params, get_calendar_version())
 
+
+def calendar_events_etag(request):
+    # El ETag cambia con el rango, los filtros o la versión de los datos
+    cache_key = _calendar_cache_key(request)
+    return cache_key.rsplit(':', 1)[-1] if cache_key else None
+
+
+@staff_member_required
+@cache_control(private=True, no_cache=True)
+@condition(etag_func=calendar_events_etag)
+def calendar_events_api(request):
+    if not request.GET.get('start') or not request.GET.get('end'):
+        return JsonResponse({'error': 'Start and end dates required'}, status=400)
     try:
-        start_date = datetime.fromisoformat(start_str.replace('Z', '+00:00')).date()
-        end_date = datetime.fromisoformat(end_str.replace('Z', '+00:00')).date()
+        start_date, end_date, service_filter, staff_filter = _parse_calendar_params(request)
     except ValueError:
         return JsonResponse({'error': 'Invalid date format'}, status=400)
 
+    cache_key = _calendar_cache_key(request)
+    events = cache.get(cache_key)
+    if events is None:
+        events = _build_calendar_events(start_date, end_date, service_filter, staff_filter)
+        cache.set(cache_key, events, CALENDAR_CACHE_TIMEOUT)
+    return JsonResponse(events, safe=False, encoder=DjangoJSONEncoder)
+
+
+def _build_calendar_events(start_date, end_date, service_filter, staff_filter):
     events = []
-    current_date = start_date
-    while current_date <= end_date:
-        try:
-            workday = ScheduledWorkDay.objects.get(date=current_date)
-            if workday.is_working and workday.start_time and workday.end_time:
-                events.append({
-                    'id': f'workday-{current_date}',
-                    'title': f'Horario: {workday.start_time.strftime("%H:%M")} - {workday.end_time.strftime("%H:%M")}',
-                    'start': current_date.isoformat(), 'end': current_date.isoformat(),
-                    'display': 'background', 'backgroundColor': '#e8f5e8', 'borderColor': '#4caf50',
-                    'classNames': ['workday-event']
-                })
-            elif not workday.is_working:
-                events.append({
-                    'id': f'non-workday-{current_date}', 'title': 'Día no laborable',
-                    'start': current_date.isoformat(), 'end': current_date.isoformat(),
-                    'display': 'background', 'backgroundColor': '#ffebee', 'borderColor': '#f44336',
-                    'classNames': ['non-workday-event']
-                })
-        except ScheduledWorkDay.DoesNotExist:
-            day_of_week = current_date.weekday()
-            try:
-                template = WorkScheduleTemplate.objects.get(day_of_week=day_of_week)
-                if template.is_working_day and template.start_time and template.end_time:
-                    events.append({
-                        'id': f'template-{current_date}',
-                        'title': f'Plantilla: {template.start_time.strftime("%H:%M")} - {template.end_time.strftime("%H:%M")}',
-                        'start': current_date.isoformat(), 'end': current_date.isoformat(),
-                        'display': 'background', 'backgroundColor': '#fff3e0', 'borderColor': '#ff9800',
-                        'classNames': ['template-event']
-                    })
-            except WorkScheduleTemplate.DoesNotExist:
-                pass
-        current_date += timedelta(days=1)
+    # Solo días ya generados; los que falten se crean con `manage.py materialize_workdays`
+    for current_date, schedule in resolve_schedule(start_date, end_date, use_templates=False).items():
+        if schedule is None:
+            continue
+        if schedule.is_working and schedule.start_time and schedule.end_time:
+            events.append({
+                'id': f'workday-{current_date}',
+                'title': f'Horario: {schedule.start_time.strftime("%H:%M")} - {schedule.end_time.strftime("%H:%M")}',
+                'start': current_date.isoformat(), 'end': current_date.isoformat(),
+                'display': 'background', 'backgroundColor': '#e8f5e8', 'borderColor': '#4caf50',
+                'classNames': ['workday-event']
+            })
+        elif not schedule.is_working:
+            events.append({
+                'id': f'non-workday-{current_date}', 'title': 'Día no laborable',
+                'start': current_date.isoformat(), 'end': current_date.isoformat(),
+                'display': 'background', 'backgroundColor': '#ffebee', 'borderColor': '#f44336',
+                'classNames': ['non-workday-event']
+            })
 
     appointments_query = Appointment.objects.filter(
         appointment_date__range=[start_date, end_date],
         appointment_date__isnull=False, appointment_time__isnull=False
     ).select_related('client', 'service', 'staff')
 
-    if service_filter and service_filter != 'all':
+    if service_filter != 'all':
         appointments_query = appointments_query.filter(service_id=service_filter)
-    if staff_filter and staff_filter != 'all':
+    if staff_filter != 'all':
         appointments_query = appointments_query.filter(staff_id=staff_filter)
 
-    status_colors = {'pending': '#ffc107', 'confirmed': '#28a745', 'completed': '#6c757d', 'cancelled': '#dc3545'}
     for appt in appointments_query:
-        start_dt = datetime.combine(appt.appointment_date, appt.appointment_time)
-        duration = getattr(appt.service, 'duration', 60)
-        end_dt = start_dt + timedelta(minutes=duration)
-        client_name = appt.client.get_full_name() or appt.client.username
-        staff_name = appt.staff.get_full_name() if appt.staff else 'Sin asignar'
-        events.append({
-            'id': f'appointment-{appt.id}',
-            'title': f'{client_name} - {appt.service.name}',
-            'start': start_dt.isoformat(), 'end': end_dt.isoformat(),
-            'backgroundColor': status_colors.get(appt.status, '#6c757d'),
-            'borderColor': status_colors.get(appt.status, '#6c757d'),
-            'textColor': '#ffffff',
-            'extendedProps': {
-                'appointmentId': appt.id, 'clientName': client_name, 'serviceName': appt.service.name,
-                'staffName': staff_name, 'status': appt.status, 'statusDisplay': appt.get_status_display(),
-                'phone': getattr(appt.client, 'phone_number', ''), 'notes': appt.notes, 'type': 'appointment'
-            },
-            'classNames': ['appointment-event', f'status-{appt.status}']
-        })
-    return JsonResponse(events, safe=False, encoder=DjangoJSONEncoder)
+        events.append(appointment_event(appt))
+    return events
 
 @staff_member_required
 def update_appointment_api(request):
@@ -115,8 +116,19 @@ def update_appointment_api(request):
             appointment.appointment_date = new_dt.date()
             appointment.appointment_time = new_dt.time()
         if 'status' in data: appointment.status = data['status']
+        conflicts = staff_conflicts(appointment)
+        if conflicts:
+            return JsonResponse({
+                'error': 'El personal asignado ya tiene otra cita en ese horario',
+                'conflicts': [
+                    {'id': other.id, 'start': other.appointment_time.strftime('%H:%M'),
+                     'end': other.end_time.strftime('%H:%M')}
+                    for other in conflicts
+                ]
+            }, status=409)
+        # post_save publica el cambio a los demás calendarios abiertos (realtime.py)
         appointment.save()
-        return JsonResponse({'success': True, 'message': 'Cita actualizada'})
+        return JsonResponse({'success': True, 'message': 'Cita actualizada', 'event': appointment_event(appointment)})
     except json.JSONDecodeError: return JsonResponse({'error': 'JSON inválido'}, status=400)
     except Appointment.DoesNotExist: return JsonResponse({'error': 'Cita no encontrada'}, status=404)
     except Exception as e: return JsonResponse({'error': str(e)}, status=500)
@@ -127,13 +139,51 @@ def appointment_stats_api(request):
     start_of_week = today - timedelta(days=today.weekday())
     end_of_week = start_of_week + timedelta(days=6)
     start_of_month = today.replace(day=1)
+    # Los tres totales en una sola consulta con conteos condicionales
+    totals = Appointment.objects.filter(
+        appointment_date__range=[min(start_of_week, start_of_month), max(end_of_week, today)]
+    ).aggregate(
+        today=Count('id', filter=Q(appointment_date=today)),
+        week=Count('id', filter=Q(appointment_date__range=[start_of_week, end_of_week])),
+        month=Count('id', filter=Q(appointment_date__range=[start_of_month, today])),
+    )
     stats = {
-        'today': {'total': Appointment.objects.filter(appointment_date=today).count()},
-        'week': {'total': Appointment.objects.filter(appointment_date__range=[start_of_week, end_of_week]).count()},
-        'month': {'total': Appointment.objects.filter(appointment_date__range=[start_of_month, today]).count()}
+        'today': {'total': totals['today']},
+        'week': {'total': totals['week']},
+        'month': {'total': totals['month']}
     }
     return JsonResponse(stats, encoder=DjangoJSONEncoder)
 
+@staff_member_required
+def appointment_conflicts_api(request):
+    """Cruces de horario del personal en un rango (por defecto, desde hoy a 30 días)."""
+    today = timezone.now().date()
+    try:
+        start = datetime.strptime(request.GET['start'], '%Y-%m-%d').date() if request.GET.get('start') else today
+        end = datetime.strptime(request.GET['end'], '%Y-%m-%d').date() if request.GET.get('end') else start + timedelta(days=30)
+    except ValueError: return JsonResponse({'error': 'Formato de fecha inválido'}, status=400)
+    staff = None
+    if request.GET.get('staff'):
+        staff = get_object_or_404(User, pk=request.GET['staff'], is_staff=True)
+    conflicts = find_conflicts(start, end, staff=staff)
+    return JsonResponse({'start': start.isoformat(), 'end': end.isoformat(),
+                         'count': len(conflicts), 'conflicts': conflicts})
+
+def _parse_capacity(value):
+    """Cupo del día desde el JSON: vacío o null -> None (cupo por defecto); si no, entero >= 0."""
+    if value is None or value == '':
+        return None
+    if isinstance(value, bool):
+        raise ValueError('max_appointments debe ser un número entero')
+    try:
+        capacity = int(value)
+    except (TypeError, ValueError):
+        raise ValueError('max_appointments debe ser un número entero')
+    if capacity < 0 or capacity != float(value):
+        raise ValueError('max_appointments debe ser un entero no negativo')
+    return capacity
+
+
 @staff_member_required
 def workday_schedule_api(request):
     if request.method == 'GET':
@@ -141,43 +191,41 @@ def workday_schedule_api(request):
         if not date_str: return JsonResponse({'error': 'Fecha requerida'}, status=400)
         try:
             target_date = datetime.strptime(date_str, '%Y-%m-%d').date()
-            workday = ScheduledWorkDay.objects.get(date=target_date)
-            return JsonResponse({
-                'date': workday.date.isoformat(),
-                'start_time': workday.start_time.strftime('%H:%M') if workday.start_time else None,
-                'end_time': workday.end_time.strftime('%H:%M') if workday.end_time else None,
-                'is_working': workday.is_working, 'notes': workday.notes
-            })
-        except ScheduledWorkDay.DoesNotExist:
-            day_of_week = target_date.weekday()
-            try:
-                template = WorkScheduleTemplate.objects.get(day_of_week=day_of_week)
-                return JsonResponse({
-                    'date': target_date.isoformat(),
-                    'start_time': template.start_time.strftime('%H:%M') if template.start_time else None,
-                    'end_time': template.end_time.strftime('%H:%M') if template.end_time else None,
-                    'is_working': template.is_working_day, 'notes': '', 'from_template': True
-                })
-            except WorkScheduleTemplate.DoesNotExist:
-                return JsonResponse({'date': target_date.isoformat(), 'start_time': None, 'end_time': None,
-                                     'is_working': True, 'notes': '', 'not_configured': True })
         except ValueError: return JsonResponse({'error': 'Formato de fecha inválido'}, status=400)
+        schedule = resolve_schedule(target_date, target_date)[target_date]
+        if schedule is None:
+            return JsonResponse({'date': target_date.isoformat(), 'start_time': None, 'end_time': None,
+                                 'is_working': True, 'notes': '', 'not_configured': True })
+        data = {
+            'date': target_date.isoformat(),
+            'start_time': schedule.start_time.strftime('%H:%M') if schedule.start_time else None,
+            'end_time': schedule.end_time.strftime('%H:%M') if schedule.end_time else None,
+            'is_working': schedule.is_working, 'notes': schedule.notes,
+            'max_appointments': schedule.max_appointments
+        }
+        if schedule.source != SOURCE_WORKDAY:
+            data['from_template'] = True
+        return JsonResponse(data)
     
     elif request.method == 'POST':
         try:
             data = json.loads(request.body)
             target_date = datetime.strptime(data['date'], '%Y-%m-%d').date()
+            max_appointments = _parse_capacity(data.get('max_appointments'))
             workday, created = ScheduledWorkDay.objects.get_or_create(date=target_date, defaults={
                 'is_working': data.get('is_working', True),
                 'start_time': datetime.strptime(data['start_time'], '%H:%M').time() if data.get('start_time') else None,
                 'end_time': datetime.strptime(data['end_time'], '%H:%M').time() if data.get('end_time') else None,
-                'notes': data.get('notes', '')
+                'notes': data.get('notes', ''),
+                'max_appointments': max_appointments
             })
             if not created:
                 workday.is_working = data.get('is_working', workday.is_working)
                 workday.start_time = datetime.strptime(data['start_time'], '%H:%M').time() if data.get('start_time') else None
                 workday.end_time = datetime.strptime(data['end_time'], '%H:%M').time() if data.get('end_time') else None
                 workday.notes = data.get('notes', workday.notes)
+                if 'max_appointments' in data:
+                    workday.max_appointments = max_appointments
                 workday.save()
             return JsonResponse({'success': True, 'message': 'Horario actualizado'})
         except json.JSONDecodeError: return JsonResponse({'error': 'JSON inválido'}, status=400)
@@ -5,3 +5,7 @@ class AppointmentsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'appointments'
     verbose_name = 'Agendamientos'
+
+    def ready(self):
+        # Importar señales
+        import appointments.signals
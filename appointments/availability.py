@@ -0,0 +1,288 @@
+# appointments/availability.py
+"""
+Motor de disponibilidad de citas.
+
+Calcula los horarios libres para un rango de fechas con una consulta para los
+días programados y otra para las citas del rango; el cruce se hace en memoria
+con intervalos ordenados en lugar de consultar la BD por cada slot.
+"""
+import bisect
+import datetime
+from dataclasses import dataclass, field
+
+from django.conf import settings
+
+from .models import Appointment, ScheduledWorkDay, WorkScheduleTemplate
+
+# Estados de cita que ocupan tiempo en la agenda
+ACTIVE_STATUSES = Appointment.ACTIVE_STATUSES
+
+DEFAULT_DURATION = 60  # minutos, si el servicio no define duración
+
+STATUS_AVAILABLE = 'available'
+STATUS_FULL = 'full'
+STATUS_NOT_WORKING = 'not_working'
+STATUS_NOT_SCHEDULED = 'not_scheduled'
+
+# Origen del horario resuelto para un día
+SOURCE_WORKDAY = 'workday'
+SOURCE_TEMPLATE = 'template'
+
+
+def time_to_minutes(value):
+    return value.hour * 60 + value.minute
+
+
+def minutes_to_time(minutes):
+    return datetime.time(minutes // 60, minutes % 60)
+
+
+class IntervalSet:
+    """
+    Conjunto de intervalos semiabiertos [inicio, fin) en minutos, ordenados
+    y sin solapamientos. Se usa para acumular el tiempo ocupado de un día.
+    """
+
+    def __init__(self, intervals=None):
+        self._starts = []
+        self._ends = []
+        for start, end in sorted(intervals or []):
+            self.add(start, end)
+
+    def __iter__(self):
+        return iter(zip(self._starts, self._ends))
+
+    def __len__(self):
+        return len(self._starts)
+
+    def add(self, start, end):
+        """Inserta un intervalo fusionándolo con los que se solapen o toquen."""
+        if end <= start:
+            return
+        left = bisect.bisect_left(self._ends, start)
+        right = bisect.bisect_right(self._starts, end)
+        if left < right:
+            start = min(start, self._starts[left])
+            end = max(end, self._ends[right - 1])
+        self._starts[left:right] = [start]
+        self._ends[left:right] = [end]
+
+    def overlaps(self, start, end):
+        """True si [start, end) se cruza con algún intervalo del conjunto."""
+        idx = bisect.bisect_right(self._ends, start)
+        return idx < len(self._starts) and self._starts[idx] < end
+
+    def gaps(self, start, end):
+        """Intervalos libres dentro de [start, end)."""
+        free = []
+        cursor = start
+        idx = bisect.bisect_right(self._ends, start)
+        while idx < len(self._starts) and self._starts[idx] < end:
+            if self._starts[idx] > cursor:
+                free.append((cursor, self._starts[idx]))
+            cursor = max(cursor, self._ends[idx])
+            idx += 1
+        if cursor < end:
+            free.append((cursor, end))
+        return free
+
+
+@dataclass
+class DayAvailability:
+    date: datetime.date
+    status: str
+    start_time: datetime.time = None
+    end_time: datetime.time = None
+    notes: str = None
+    busy: IntervalSet = field(default_factory=IntervalSet)
+    slots: list = field(default_factory=list)
+
+    @property
+    def is_working(self):
+        return self.status in (STATUS_AVAILABLE, STATUS_FULL)
+
+    def fits(self, start_time, duration):
+        """Indica si una cita de `duration` minutos cabe a la hora indicada."""
+        if not self.is_working:
+            return False
+        start = time_to_minutes(start_time)
+        end = start + duration
+        if self.start_time and start < time_to_minutes(self.start_time):
+            return False
+        if self.end_time and end > time_to_minutes(self.end_time):
+            return False
+        return not self.busy.overlaps(start, end)
+
+    def as_dict(self):
+        data = {
+            'date': self.date.isoformat(),
+            'status': self.status,
+            'is_working': self.is_working,
+            'notes': self.notes,
+        }
+        if self.is_working and self.start_time and self.end_time:
+            data['start_time'] = self.start_time.strftime('%H:%M')
+            data['end_time'] = self.end_time.strftime('%H:%M')
+            data['available_slots'] = [slot.strftime('%H:%M') for slot in self.slots]
+        return data
+
+
+@dataclass
+class ResolvedSchedule:
+    date: datetime.date
+    source: str
+    is_working: bool
+    start_time: datetime.time = None
+    end_time: datetime.time = None
+    notes: str = ''
+    max_appointments: int = None
+
+
+def resolve_schedule(start_date, end_date, use_templates=True):
+    """
+    Horario efectivo de cada día del rango: el ScheduledWorkDay del día si
+    existe, si no (con `use_templates`) la WorkScheduleTemplate de su día de
+    la semana. Devuelve {fecha: ResolvedSchedule | None} con dos consultas en
+    total, o una sola sin plantilla (los días se generan con
+    `manage.py materialize_workdays`).
+    """
+    overrides = {
+        workday.date: workday
+        for workday in ScheduledWorkDay.objects.filter(date__range=[start_date, end_date])
+    }
+    templates = {}
+    if use_templates:
+        templates = {template.day_of_week: template for template in WorkScheduleTemplate.objects.all()}
+
+    resolved = {}
+    current = start_date
+    while current <= end_date:
+        workday = overrides.get(current)
+        template = templates.get(current.weekday())
+        if workday is not None:
+            resolved[current] = ResolvedSchedule(
+                current, SOURCE_WORKDAY, workday.is_working,
+                workday.start_time, workday.end_time, workday.notes or '', workday.max_appointments,
+            )
+        elif template is not None:
+            resolved[current] = ResolvedSchedule(
+                current, SOURCE_TEMPLATE, template.is_working_day,
+                template.start_time, template.end_time,
+            )
+        else:
+            resolved[current] = None
+        current += datetime.timedelta(days=1)
+    return resolved
+
+
+def service_duration(service):
+    return getattr(service, 'duration', None) or DEFAULT_DURATION
+
+
+def get_availability(start_date, end_date, service=None, staff=None, step=None, exclude_appointment=None):
+    """
+    Devuelve {fecha: DayAvailability} para cada día del rango [start_date, end_date].
+
+    - `service` determina la duración de los slots (y el paso, si no se indica `step`).
+    - `staff` limita las citas consideradas a las de ese miembro del personal;
+      sin staff se considera toda la agenda.
+    - `exclude_appointment` permite ignorar una cita (p. ej. al reprogramarla).
+    """
+    duration = service_duration(service)
+    step = step or duration
+
+    workdays = {
+        workday.date: workday
+        for workday in ScheduledWorkDay.objects.filter(date__range=[start_date, end_date])
+    }
+
+    appointments = Appointment.objects.filter(
+        appointment_date__range=[start_date, end_date],
+        appointment_time__isnull=False,
+        status__in=ACTIVE_STATUSES,
+    )
+    if staff is not None:
+        appointments = appointments.filter(staff=staff)
+    if exclude_appointment is not None and exclude_appointment.pk:
+        appointments = appointments.exclude(pk=exclude_appointment.pk)
+
+    busy_by_day = {}
+    for appt_date, appt_time, appt_duration in appointments.values_list(
+        'appointment_date', 'appointment_time', 'service__duration'
+    ):
+        start = time_to_minutes(appt_time)
+        busy_by_day.setdefault(appt_date, IntervalSet()).add(
+            start, start + (appt_duration or DEFAULT_DURATION)
+        )
+
+    result = {}
+    current = start_date
+    while current <= end_date:
+        workday = workdays.get(current)
+        if workday is None:
+            day = DayAvailability(current, STATUS_NOT_SCHEDULED)
+        elif not workday.is_working:
+            day = DayAvailability(current, STATUS_NOT_WORKING, notes=workday.notes)
+        else:
+            day = DayAvailability(
+                current, STATUS_AVAILABLE,
+                start_time=workday.start_time, end_time=workday.end_time,
+                notes=workday.notes, busy=busy_by_day.get(current, IntervalSet()),
+            )
+            if workday.start_time and workday.end_time:
+                day.slots = _build_slots(day, duration, step)
+                if not day.slots:
+                    day.status = STATUS_FULL
+        result[current] = day
+        current += datetime.timedelta(days=1)
+    return result
+
+
+def get_day_availability(target_date, service=None, staff=None, exclude_appointment=None):
+    return get_availability(
+        target_date, target_date, service=service, staff=staff,
+        exclude_appointment=exclude_appointment,
+    )[target_date]
+
+
+def get_daily_status_map(start_date, end_date):
+    """
+    Estado por día ({'YYYY-MM-DD': status}) para el rango indicado, según el
+    cupo diario de citas. Una sola consulta: el cupo ocupado se lee del
+    contador reserved_count de cada día (ver holds.py), sin contar citas.
+    """
+    default_capacity = getattr(settings, 'APPOINTMENTS_DAILY_CAPACITY', 3)
+    workdays = {
+        row['date']: row
+        for row in ScheduledWorkDay.objects.filter(
+            date__range=[start_date, end_date]
+        ).values('date', 'is_working', 'max_appointments', 'reserved_count')
+    }
+
+    status_map = {}
+    current = start_date
+    while current <= end_date:
+        workday = workdays.get(current)
+        if workday is None:
+            status = STATUS_NOT_SCHEDULED
+        elif not workday['is_working']:
+            status = STATUS_NOT_WORKING
+        else:
+            capacity = workday['max_appointments']
+            if capacity is None:
+                capacity = default_capacity
+            status = STATUS_FULL if workday['reserved_count'] >= capacity else STATUS_AVAILABLE
+        status_map[current.isoformat()] = status
+        current += datetime.timedelta(days=1)
+    return status_map
+
+
+def _build_slots(day, duration, step):
+    """Slots cada `step` minutos desde el inicio de cada hueco libre del día."""
+    slots = []
+    for gap_start, gap_end in day.busy.gaps(time_to_minutes(day.start_time), time_to_minutes(day.end_time)):
+        slot = gap_start
+        while slot + duration <= gap_end:
+            slots.append(minutes_to_time(slot))
+            slot += step
+    return slots
@@ -0,0 +1,63 @@
+# appointments/cache.py
+"""
+Versión de los datos de agenda para cachear respuestas del calendario.
+
+Cada cambio en citas u horarios incrementa la versión; las respuestas cacheadas
+y los ETag incluyen la versión, así que quedan invalidados sin tener que
+recorrer ni borrar claves.
+
+La versión tiene que ser la misma para todos los procesos. Con una cache
+compartida (Redis, Memcached, BD) vive en la cache; con la cache en memoria
+por proceso (sin REDIS_URL) vive en la tabla version_calendario, y la cache
+local solo guarda respuestas ya etiquetadas con esa versión.
+"""
+import hashlib
+
+from django.core.cache import cache, caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.db.models import F
+
+from .models import CalendarVersion
+
+CALENDAR_VERSION_KEY = 'appointments:calendar_version'
+CALENDAR_CACHE_TIMEOUT = 60 * 5  # segundos
+
+
+def version_in_db():
+    """True si la cache por defecto es local al proceso y no sirve para compartir la versión."""
+    return isinstance(caches['default'], (LocMemCache, DummyCache))
+
+
+def get_calendar_version():
+    if version_in_db():
+        version = CalendarVersion.objects.filter(pk=1).values_list('version', flat=True).first()
+        if version is None:
+            version = CalendarVersion.objects.get_or_create(pk=1)[0].version
+        return version
+    version = cache.get(CALENDAR_VERSION_KEY)
+    if version is None:
+        cache.add(CALENDAR_VERSION_KEY, 1, timeout=None)
+        version = cache.get(CALENDAR_VERSION_KEY, 1)
+    return version
+
+
+def bump_calendar_version():
+    """Invalida las respuestas cacheadas del calendario."""
+    if version_in_db():
+        # Un UPDATE atómico: se confirma (o se deshace) junto con el cambio que lo provocó
+        if not CalendarVersion.objects.filter(pk=1).update(version=F('version') + 1):
+            CalendarVersion.objects.get_or_create(pk=1, defaults={'version': 2})
+        return get_calendar_version()
+    try:
+        return cache.incr(CALENDAR_VERSION_KEY)
+    except ValueError:
+        # La clave no existía (cache reiniciada)
+        cache.add(CALENDAR_VERSION_KEY, 1, timeout=None)
+        return cache.incr(CALENDAR_VERSION_KEY)
+
+
+def calendar_cache_key(*parts):
+    raw = '|'.join(str(part) for part in parts)
+    digest = hashlib.md5(raw.encode('utf-8')).hexdigest()
+    return f'appointments:calendar:{digest}'
@@ -0,0 +1,102 @@
+# appointments/conflicts.py
+"""
+Detección de cruces de horario del personal.
+
+Cada cita guarda su hora de fin (`end_time`), así que dos citas del mismo
+personal se cruzan si `inicio_a < fin_b` y `inicio_b < fin_a`. La consulta
+puntual usa el índice (staff, appointment_date, appointment_time); el reporte
+por rango trae las citas ordenadas en una sola consulta y las barre en memoria.
+"""
+from .availability import ACTIVE_STATUSES, DEFAULT_DURATION, time_to_minutes, minutes_to_time
+from .models import Appointment
+
+LAST_MINUTE_OF_DAY = 24 * 60 - 1
+
+
+def compute_end_time(start_time, duration):
+    """Hora de fin de una cita; no pasa de las 23:59 del mismo día."""
+    if start_time is None:
+        return None
+    end = time_to_minutes(start_time) + (duration or DEFAULT_DURATION)
+    return minutes_to_time(min(end, LAST_MINUTE_OF_DAY))
+
+
+def overlapping_appointments(staff, target_date, start_time, end_time, exclude_pk=None):
+    """Citas activas de `staff` en `target_date` que se cruzan con [start_time, end_time)."""
+    queryset = Appointment.objects.filter(
+        staff=staff,
+        appointment_date=target_date,
+        appointment_time__lt=end_time,
+        end_time__gt=start_time,
+        status__in=ACTIVE_STATUSES,
+    )
+    if exclude_pk is not None:
+        queryset = queryset.exclude(pk=exclude_pk)
+    return queryset.order_by('appointment_time')
+
+
+def staff_conflicts(appointment):
+    """
+    Lista de citas que chocan con `appointment` (vacía si no tiene personal,
+    fecha u hora, o si no está activa). Calcula la hora de fin sin guardar.
+    """
+    if (not appointment.staff_id or not appointment.appointment_date
+            or not appointment.appointment_time or appointment.status not in ACTIVE_STATUSES):
+        return []
+    duration = appointment.service.duration if appointment.service_id else None
+    end_time = compute_end_time(appointment.appointment_time, duration)
+    return list(overlapping_appointments(
+        appointment.staff_id, appointment.appointment_date,
+        appointment.appointment_time, end_time, exclude_pk=appointment.pk,
+    ))
+
+
+def find_conflicts(start_date, end_date, staff=None):
+    """
+    Todos los pares de citas activas que se cruzan en [start_date, end_date].
+    Una consulta ordenada por (staff, fecha, hora) y un barrido lineal que solo
+    compara cada cita con las que siguen abiertas en ese momento.
+    """
+    queryset = Appointment.objects.filter(
+        appointment_date__range=[start_date, end_date],
+        staff__isnull=False,
+        appointment_time__isnull=False,
+        end_time__isnull=False,
+        status__in=ACTIVE_STATUSES,
+    )
+    if staff is not None:
+        queryset = queryset.filter(staff=staff)
+    rows = queryset.order_by('staff_id', 'appointment_date', 'appointment_time').values(
+        'id', 'staff_id', 'staff__username', 'staff__first_name', 'staff__last_name',
+        'appointment_date', 'appointment_time', 'end_time',
+    )
+
+    conflicts = []
+    group = None
+    open_rows = []
+    for row in rows:
+        key = (row['staff_id'], row['appointment_date'])
+        if key != group:
+            group, open_rows = key, []
+        open_rows = [other for other in open_rows if other['end_time'] > row['appointment_time']]
+        for other in open_rows:
+            conflicts.append(_conflict_dict(other, row))
+        open_rows.append(row)
+    return conflicts
+
+
+def _conflict_dict(first, second):
+    staff_name = f"{first['staff__first_name']} {first['staff__last_name']}".strip() or first['staff__username']
+    return {
+        'staff_id': first['staff_id'],
+        'staff_name': staff_name,
+        'date': first['appointment_date'].isoformat(),
+        'appointments': [
+            {
+                'id': row['id'],
+                'start': row['appointment_time'].strftime('%H:%M'),
+                'end': row['end_time'].strftime('%H:%M'),
+            }
+            for row in (first, second)
+        ],
+    }
@@ -0,0 +1,25 @@
+# appointments/consumers.py
+from channels.generic.websocket import AsyncJsonWebsocketConsumer
+
+from .realtime import CALENDAR_GROUP
+
+
+class CalendarConsumer(AsyncJsonWebsocketConsumer):
+    """
+    Websocket del calendario del admin: solo staff. Reenvía los cambios de
+    citas publicados en el grupo `admin_calendar` (ver realtime.py).
+    """
+
+    async def connect(self):
+        user = self.scope.get('user')
+        if not user or not user.is_authenticated or not user.is_staff:
+            await self.close()
+            return
+        await self.channel_layer.group_add(CALENDAR_GROUP, self.channel_name)
+        await self.accept()
+
+    async def disconnect(self, code):
+        await self.channel_layer.group_discard(CALENDAR_GROUP, self.channel_name)
+
+    async def calendar_delta(self, message):
+        await self.send_json({'action': message['action'], 'id': message['id'], 'event': message['event']})
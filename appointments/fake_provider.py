@@ -0,0 +1,92 @@
+# appointments/fake_provider.py
+"""
+Proveedor falso de DNI/RUC para pruebas y mediciones locales.
+
+Imita las rutas de apiperu.dev (/api/dni/<dni>) y decolecta
+(/v1/sunat/ruc/full?numero=<ruc>) con latencia y tasa de error
+configurables. Se levanta con `manage.py fake_identity_provider` o, desde
+código, con `start_fake_provider()` (hilo en segundo plano).
+
+Reglas: los números que terminan en 0 no existen (404); el resto responde
+con datos generados a partir del número.
+"""
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+
+class FakeProviderHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # keep-alive, como los proveedores reales
+    wbufsize = -1  # cabeceras y cuerpo en un solo envío (evita esperas de Nagle/ACK)
+
+    def do_GET(self):
+        server = self.server
+        server.hits += 1
+        if server.latency:
+            time.sleep(server.latency)
+        if server.error_rate and random.random() < server.error_rate:
+            return self._send(503, {'success': False, 'message': 'Servicio no disponible'})
+
+        parsed = urlparse(self.path)
+        if parsed.path.startswith('/api/dni/'):
+            number = parsed.path.rsplit('/', 1)[-1]
+            if number.endswith('0'):
+                return self._send(200, {'success': False, 'message': 'No se encontraron resultados'})
+            return self._send(200, {'success': True, 'data': {
+                'numero': number,
+                'nombres': f'NOMBRE {number[-3:]}',
+                'apellido_paterno': 'PRUEBA',
+                'apellido_materno': 'LOCAL',
+                'nombre_completo': f'NOMBRE {number[-3:]} PRUEBA LOCAL',
+            }})
+        if parsed.path == '/v1/sunat/ruc/full':
+            number = parse_qs(parsed.query).get('numero', [''])[0]
+            if not number or number.endswith('0'):
+                return self._send(404, {'message': 'RUC no encontrado'})
+            return self._send(200, {
+                'numero_documento': number,
+                'razon_social': f'EMPRESA {number[-4:]} S.A.C.',
+                'direccion': 'AV. PRUEBA 123',
+                'departamento': 'LAMBAYEQUE', 'provincia': 'CHICLAYO', 'distrito': 'CHICLAYO',
+                'estado': 'ACTIVO', 'condicion': 'HABIDO',
+            })
+        return self._send(404, {'message': 'Ruta no encontrada'})
+
+    def _send(self, status, payload):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+class FakeProviderServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 256  # muchas conexiones simultáneas en las mediciones
+
+    def __init__(self, address, latency=0.0, error_rate=0.0, verbose=False):
+        super().__init__(address, FakeProviderHandler)
+        self.latency = latency
+        self.error_rate = error_rate
+        self.verbose = verbose
+        self.hits = 0
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f'http://{host}:{port}'
+
+
+def start_fake_provider(port=0, latency=0.0, error_rate=0.0):
+    """Levanta el proveedor falso en un hilo; devuelve el servidor (usar .base_url y .shutdown())."""
+    server = FakeProviderServer(('127.0.0.1', port), latency=latency, error_rate=error_rate)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
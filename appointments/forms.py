@@ -2,6 +2,10 @@
 from django import forms
 from django.utils.translation import gettext_lazy as _
 from .models import Appointment, ScheduledWorkDay
+from .availability import (
+    get_day_availability, service_duration,
+    STATUS_FULL, STATUS_NOT_SCHEDULED, STATUS_NOT_WORKING,
+)
 from services.models import Service
 from django.core.exceptions import ValidationError
 from django.utils import timezone
@@ -76,6 +80,8 @@ class AppointmentRequestForm(forms.ModelForm):
     nombres_hidden = forms.CharField(widget=forms.HiddenInput(), required=False)
     apellido_paterno_hidden = forms.CharField(widget=forms.HiddenInput(), required=False)
     apellido_materno_hidden = forms.CharField(widget=forms.HiddenInput(), required=False)
+    # Reserva temporal del cupo tomada al elegir la fecha (ver holds.py)
+    hold_token = forms.UUIDField(widget=forms.HiddenInput(), required=False)
 
     class Meta:
         model = Appointment
@@ -160,17 +166,30 @@ class AppointmentRequestForm(forms.ModelForm):
                     _("La fecha de la cita debe ser con al menos un día de antelación (a partir de mañana).")
                 )
             
-            # Validación de día laborable según ScheduledWorkDay
-            try:
-                workday = ScheduledWorkDay.objects.get(date=date)
-                if not workday.is_working:
-                    raise ValidationError(_("La fecha seleccionada no es un día laborable según nuestra programación."))
-            except ScheduledWorkDay.DoesNotExist:
+            # Validación de día laborable con el mismo motor que alimenta el datepicker
+            day_availability = get_day_availability(date, service=self._get_service())
+            if day_availability.status == STATUS_NOT_WORKING:
+                raise ValidationError(_("La fecha seleccionada no es un día laborable según nuestra programación."))
+            if day_availability.status == STATUS_NOT_SCHEDULED:
                 raise ValidationError(
                     _("No hay información de horario laboral para la fecha {date}. Por favor, consulte con el administrador.").format(date=date.strftime("%d/%m/%Y"))
                 )
+            if day_availability.status == STATUS_FULL:
+                raise ValidationError(_("No quedan horarios disponibles para la fecha seleccionada."))
+            self.day_availability = day_availability
         return date
 
+    def _get_service(self):
+        """
+        Servicio de la cita: el ya validado (el campo 'service' se limpia antes
+        que la fecha) o, si no vino en el formulario, el service_id de la URL.
+        """
+        if not hasattr(self, '_service'):
+            self._service = self.cleaned_data.get('service')
+            if self._service is None and str(self.service_id or '').isdigit():
+                self._service = Service.objects.filter(pk=self.service_id).first()
+        return self._service
+
     def clean_email(self): # Tu lógica existente para el email
         if self.user and self.user.is_authenticated:
             return self.user.email
@@ -185,6 +204,15 @@ class AppointmentRequestForm(forms.ModelForm):
         dni = cleaned_data.get('dni')
         ruc = cleaned_data.get('ruc')
 
+        # La hora elegida debe caber en un hueco libre del día
+        appointment_time = cleaned_data.get('appointment_time')
+        day_availability = getattr(self, 'day_availability', None)
+        if day_availability and appointment_time:
+            if not day_availability.fits(appointment_time, service_duration(self._get_service())):
+                self.add_error('appointment_time', _("La hora seleccionada no está disponible. Horarios libres: {slots}.").format(
+                    slots=', '.join(slot.strftime('%H:%M') for slot in day_availability.slots) or '-'
+                ))
+
         # Validación condicional
         if client_type == 'persona':
             if not dni:
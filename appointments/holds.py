@@ -0,0 +1,169 @@
+# appointments/holds.py
+"""
+Cupo diario de citas con reservas temporales.
+
+`ScheduledWorkDay.reserved_count` cuenta las citas activas más las reservas
+(SlotHold) vigentes del día. Tomar un cupo bloquea la fila del día con
+select_for_update, así dos clientes no pueden quedarse con el último cupo a
+la vez; consultar si un día está lleno es leer un entero, sin contar citas.
+"""
+import datetime
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, Count, IntegerField, Value, When
+from django.db.models.functions import Cast, Greatest
+from django.utils import timezone
+from django.utils.translation import gettext_lazy as _
+
+from .cache import bump_calendar_version
+from .models import Appointment, ScheduledWorkDay, SlotHold
+
+HOLD_TTL = datetime.timedelta(minutes=getattr(settings, 'APPOINTMENTS_HOLD_MINUTES', 10))
+
+
+class SlotUnavailable(Exception):
+    """No queda cupo (o no se atiende) en la fecha pedida."""
+
+
+def adjust_reserved_counts(deltas):
+    """
+    Aplica {fecha: delta} a reserved_count de los días programados con un
+    solo UPDATE (CASE por fecha). Nunca baja de cero: la suma se hace con
+    signo, porque en MySQL la columna es UNSIGNED y `0 + (-1)` falla (error
+    1690) antes de que GREATEST pueda acotarla.
+    """
+    deltas = {day: delta for day, delta in deltas.items() if delta}
+    if not deltas:
+        return
+    ScheduledWorkDay.objects.filter(date__in=deltas).update(
+        reserved_count=Greatest(
+            Cast('reserved_count', IntegerField()) + Case(
+                *[When(date=day, then=Value(delta)) for day, delta in deltas.items()],
+                default=Value(0), output_field=IntegerField(),
+            ),
+            Value(0),
+        )
+    )
+    bump_calendar_version()
+
+
+def _lock_workday(target_date):
+    try:
+        return ScheduledWorkDay.objects.select_for_update().get(date=target_date)
+    except ScheduledWorkDay.DoesNotExist:
+        raise SlotUnavailable(_("No hay horario laboral programado para la fecha seleccionada."))
+
+
+def _release_expired(target_date, now):
+    """Libera (con el día ya bloqueado) las reservas vencidas de la fecha."""
+    expired = SlotHold.objects.filter(date=target_date, expires_at__lte=now).delete()[0]
+    if expired:
+        adjust_reserved_counts({target_date: -expired})
+    return expired
+
+
+def _ensure_capacity(workday):
+    if not workday.is_working:
+        raise SlotUnavailable(_("La fecha seleccionada no es un día laborable según nuestra programación."))
+    if workday.reserved_count >= workday.capacity:
+        raise SlotUnavailable(_("No quedan cupos disponibles para la fecha seleccionada."))
+
+
+def release_client_holds(client, exclude_pk=None):
+    """Elimina las reservas vigentes de un cliente y devuelve su cupo."""
+    # Solo las vigentes: las vencidas se quedan para que sweep_expired_holds
+    # (o _release_expired) las borre y devuelva su cupo una sola vez
+    holds = SlotHold.objects.filter(client=client, expires_at__gt=timezone.now())
+    if exclude_pk is not None:
+        holds = holds.exclude(pk=exclude_pk)
+    per_day = dict(holds.values('date').annotate(total=Count('id')).values_list('date', 'total'))
+    holds.delete()
+    adjust_reserved_counts({day: -total for day, total in per_day.items()})
+
+
+def place_hold(client, target_date, service=None):
+    """
+    Reserva un cupo de `target_date` por HOLD_TTL para `client`. Si el cliente
+    ya tenía una reserva vigente ese día solo se renueva; las de otros días se
+    liberan. Lanza SlotUnavailable si el día está lleno o no se atiende.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        workday = _lock_workday(target_date)
+        hold = SlotHold.objects.filter(client=client, date=target_date, expires_at__gt=now).first()
+        if hold is None:
+            if _release_expired(target_date, now):
+                workday.refresh_from_db(fields=['reserved_count'])
+            _ensure_capacity(workday)
+            hold = SlotHold.objects.create(
+                client=client, service=service, date=target_date, expires_at=now + HOLD_TTL
+            )
+            adjust_reserved_counts({target_date: 1})
+        else:
+            hold.expires_at = now + HOLD_TTL
+            hold.save(update_fields=['expires_at'])
+        release_client_holds(client, exclude_pk=hold.pk)
+    return hold
+
+
+def claim_capacity(client, target_date, hold_token=None):
+    """
+    Llamar dentro de transaction.atomic() justo antes de guardar la cita.
+    Consume la reserva vigente del cliente para ese día o, si no la tiene,
+    comprueba el cupo con el día bloqueado. El guardado de la cita suma su
+    propio cupo (Appointment.save).
+    """
+    now = timezone.now()
+    workday = _lock_workday(target_date)
+    holds = SlotHold.objects.filter(client=client, date=target_date, expires_at__gt=now)
+    if hold_token:
+        holds = holds.filter(token=hold_token)
+    hold = holds.first()
+    if hold is not None:
+        hold.delete()
+        adjust_reserved_counts({target_date: -1})
+        return
+    if _release_expired(target_date, now):
+        workday.refresh_from_db(fields=['reserved_count'])
+    _ensure_capacity(workday)
+
+
+def sweep_expired_holds(now=None):
+    """Borra en bloque las reservas vencidas y devuelve su cupo. Devuelve cuántas se liberaron."""
+    now = now or timezone.now()
+    with transaction.atomic():
+        expired = SlotHold.objects.filter(expires_at__lte=now)
+        per_day = dict(expired.values('date').annotate(total=Count('id')).values_list('date', 'total'))
+        if not per_day:
+            return 0
+        expired.delete()
+        adjust_reserved_counts({day: -total for day, total in per_day.items()})
+    return sum(per_day.values())
+
+
+def recount_reserved(start_date, end_date):
+    """
+    Recalcula reserved_count desde cero para el rango (citas activas +
+    reservas vigentes). Sirve para reconciliar tras cambios masivos hechos
+    fuera del ORM.
+    """
+    now = timezone.now()
+    totals = dict(
+        Appointment.objects.filter(
+            appointment_date__range=[start_date, end_date], status__in=Appointment.ACTIVE_STATUSES
+        ).values('appointment_date').annotate(total=Count('id')).values_list('appointment_date', 'total')
+    )
+    for day, total in SlotHold.objects.filter(
+        date__range=[start_date, end_date], expires_at__gt=now
+    ).values('date').annotate(total=Count('id')).values_list('date', 'total'):
+        totals[day] = totals.get(day, 0) + total
+
+    workdays = ScheduledWorkDay.objects.filter(date__range=[start_date, end_date])
+    changed = [day for day in workdays if day.reserved_count != totals.get(day.date, 0)]
+    for day in changed:
+        day.reserved_count = totals.get(day.date, 0)
+    ScheduledWorkDay.objects.bulk_update(changed, ['reserved_count'], batch_size=500)
+    if changed:
+        bump_calendar_version()
+    return len(changed)
@@ -0,0 +1,261 @@
+# appointments/identity.py
+"""
+Consultas de identidad (DNI en apiperu.dev, RUC en decolecta) con caché.
+
+Orden de búsqueda para cada documento:
+  1. caché de Django (misma respuesta ya servida hace poco),
+  2. tabla IdentityLookup (respuestas guardadas con vigencia; los
+     "no encontrado" también se guardan, con vigencia corta),
+  3. la API externa (vía provider_client: conexiones reutilizadas,
+     reintentos y circuit breaker); solo las respuestas definitivas se
+     guardan, los errores de conexión o del proveedor no. Las consultas
+     simultáneas del mismo documento esperan una sola llamada (singleflight).
+
+Cada función devuelve (payload, status) con el mismo formato JSON que ya
+consumen los formularios. `alookup_dni` / `alookup_ruc` hacen lo mismo sin
+bloquear el event loop (aiohttp y ORM async) para las vistas servidas por ASGI.
+Las vistas que usan este módulo son anónimas, así que solo se sirven
+respuestas del proveedor, nunca datos de los usuarios registrados.
+"""
+import asyncio
+from datetime import timedelta
+
+import aiohttp
+import requests
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+from . import provider_client
+from .models import IdentityLookup
+from .singleflight import (
+    SingleFlight, AsyncSingleFlight, cache_single_flight, acache_single_flight,
+)
+
+FOUND_TTL = timedelta(days=getattr(settings, 'IDENTITY_LOOKUP_TTL_DAYS', 30))
+NOT_FOUND_TTL = timedelta(hours=getattr(settings, 'IDENTITY_LOOKUP_NEGATIVE_TTL_HOURS', 24))
+LOCAL_CACHE_TIMEOUT = 60 * 10  # segundos
+
+DOC_LENGTHS = {IdentityLookup.DOC_DNI: 8, IdentityLookup.DOC_RUC: 11}
+
+_flights = SingleFlight()
+_aflights = AsyncSingleFlight()
+
+
+class ProviderError(Exception):
+    """La API externa no respondió algo definitivo (caída, timeout, 5xx...)."""
+
+    def __init__(self, message, status=502):
+        super().__init__(message)
+        self.status = status
+
+
+def _cache_key(doc_type, number):
+    return f'identity:{doc_type}:{number}'
+
+
+def _validate(doc_type, number):
+    number = (number or '').strip()
+    expected = DOC_LENGTHS[doc_type]
+    if not number.isdigit() or len(number) != expected:
+        return None, ({'error': f'{doc_type.upper()} inválido: debe tener {expected} dígitos'}, 400)
+    return number, None
+
+
+# --- Proveedores externos ---
+
+def _dni_request(dni):
+    return f'{settings.APIPERU_BASE_URL}/api/dni/{dni}?api_token={settings.APIPERU_TOKEN}', {}
+
+
+def _ruc_request(ruc):
+    headers = {
+        'Authorization': f'Bearer {settings.DECOLECTA_API_KEY}',
+        'Content-Type': 'application/json'
+    }
+    return f'{settings.DECOLECTA_BASE_URL}/v1/sunat/ruc/full?numero={ruc}', headers
+
+
+def _parse_dni(status, data, dni):
+    """Devuelve (encontrado, payload) o lanza ProviderError."""
+    if status == 404:
+        return False, {'error': 'No se encontraron datos.'}
+    if status != 200:
+        raise ProviderError(f'Error en la API externa (Código: {status})', status=status)
+    if not isinstance(data, dict):
+        raise ProviderError('Respuesta inválida de la API externa')
+    if not data.get('success'):
+        return False, {'error': data.get('message', 'No se encontraron datos.')}
+    person = data.get('data') or {}
+    return True, {
+        'nombres': person.get('nombres', ''),
+        'apellidoPaterno': person.get('apellido_paterno', ''),
+        'apellidoMaterno': person.get('apellido_materno', ''),
+        'nombre_completo': person.get('nombre_completo', ''),
+        'dni': person.get('numero', dni),
+    }
+
+
+def _parse_ruc(status, data, ruc):
+    """Devuelve (encontrado, payload) o lanza ProviderError."""
+    if status in (400, 404, 422):
+        return False, {'error': 'No se encontró el RUC o hubo un error en la API externa.'}
+    if status != 200:
+        raise ProviderError(f'Error en la API externa (Código: {status})', status=status)
+    if not isinstance(data, dict):
+        raise ProviderError('Respuesta inválida de la API externa')
+    return True, {
+        'razon_social': data.get('razon_social'),
+        'direccion': data.get('direccion'),
+        'departamento': data.get('departamento'),
+        'provincia': data.get('provincia'),
+        'distrito': data.get('distrito'),
+        'estado': data.get('estado'),
+        'condicion': data.get('condicion'),
+        'ruc': data.get('numero_documento') or ruc,
+    }
+
+
+# proveedor del circuit breaker, (url, headers), parser
+UPSTREAMS = {
+    IdentityLookup.DOC_DNI: ('apiperu', _dni_request, _parse_dni),
+    IdentityLookup.DOC_RUC: ('decolecta', _ruc_request, _parse_ruc),
+}
+
+
+def _fetch(doc_type, number):
+    """Consulta síncrona al proveedor. Devuelve (encontrado, payload) o lanza ProviderError."""
+    provider, build_request, parse = UPSTREAMS[doc_type]
+    url, headers = build_request(number)
+    try:
+        response = provider_client.get(provider, url, headers=headers)
+    except provider_client.CircuitOpen as e:
+        raise ProviderError(str(e), status=503)
+    except requests.exceptions.RequestException as e:
+        raise ProviderError(f'Error de conexión con API externa: {e}', status=500)
+    try:
+        data = response.json()
+    except ValueError:
+        data = None
+    return parse(response.status_code, data, number)
+
+
+async def _afetch(doc_type, number):
+    """Igual que _fetch, con el cliente aiohttp."""
+    provider, build_request, parse = UPSTREAMS[doc_type]
+    url, headers = build_request(number)
+    try:
+        status, data = await provider_client.aget(provider, url, headers=headers)
+    except provider_client.CircuitOpen as e:
+        raise ProviderError(str(e), status=503)
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        raise ProviderError(f'Error de conexión con API externa: {e}', status=500)
+    return parse(status, data, number)
+
+
+def _response(found, payload):
+    return payload, (200 if found else 404)
+
+
+def _stored_defaults(found, payload):
+    return {'found': found, 'data': payload,
+            'expires_at': timezone.now() + (FOUND_TTL if found else NOT_FOUND_TTL)}
+
+
+def lookup_document(doc_type, number):
+    """Consulta un DNI o RUC usando la caché. Devuelve (payload, status)."""
+    number, invalid = _validate(doc_type, number)
+    if invalid:
+        return invalid
+
+    key = _cache_key(doc_type, number)
+    cached = cache.get(key)
+    if cached is not None:
+        return _response(*cached)
+
+    now = timezone.now()
+    stored = IdentityLookup.objects.filter(doc_type=doc_type, number=number, expires_at__gt=now).first()
+    if stored is not None:
+        cache.set(key, (stored.found, stored.data), LOCAL_CACHE_TIMEOUT)
+        return _response(stored.found, stored.data)
+
+    # Consultas idénticas simultáneas (hilos y procesos) comparten una sola llamada
+    return _flights.do(key, lambda: cache_single_flight(key, lambda: _fetch_and_store(doc_type, number)))
+
+
+def _fetch_and_store(doc_type, number):
+    """Llamada a la API externa (solo la hace el líder). Devuelve (payload, status)."""
+    key = _cache_key(doc_type, number)
+    cached = cache.get(key)
+    if cached is not None:
+        # Otro líder terminó justo antes de tomar el candado
+        return _response(*cached)
+
+    try:
+        found, payload = _fetch(doc_type, number)
+    except ProviderError as e:
+        return {'error': str(e)}, e.status
+
+    IdentityLookup.objects.update_or_create(
+        doc_type=doc_type, number=number, defaults=_stored_defaults(found, payload),
+    )
+    cache.set(key, (found, payload), LOCAL_CACHE_TIMEOUT)
+    return _response(found, payload)
+
+
+def lookup_dni(dni):
+    return lookup_document(IdentityLookup.DOC_DNI, dni)
+
+
+def lookup_ruc(ruc):
+    return lookup_document(IdentityLookup.DOC_RUC, ruc)
+
+
+# --- Versión async (vistas servidas por ASGI) ---
+
+async def alookup_document(doc_type, number):
+    """Como lookup_document, sin bloquear el event loop."""
+    number, invalid = _validate(doc_type, number)
+    if invalid:
+        return invalid
+
+    key = _cache_key(doc_type, number)
+    cached = await cache.aget(key)
+    if cached is not None:
+        return _response(*cached)
+
+    now = timezone.now()
+    stored = await IdentityLookup.objects.filter(doc_type=doc_type, number=number, expires_at__gt=now).afirst()
+    if stored is not None:
+        await cache.aset(key, (stored.found, stored.data), LOCAL_CACHE_TIMEOUT)
+        return _response(stored.found, stored.data)
+
+    return await _aflights.do(
+        key, lambda: acache_single_flight(key, lambda: _afetch_and_store(doc_type, number))
+    )
+
+
+async def _afetch_and_store(doc_type, number):
+    key = _cache_key(doc_type, number)
+    cached = await cache.aget(key)
+    if cached is not None:
+        return _response(*cached)
+
+    try:
+        found, payload = await _afetch(doc_type, number)
+    except ProviderError as e:
+        return {'error': str(e)}, e.status
+
+    await IdentityLookup.objects.aupdate_or_create(
+        doc_type=doc_type, number=number, defaults=_stored_defaults(found, payload),
+    )
+    await cache.aset(key, (found, payload), LOCAL_CACHE_TIMEOUT)
+    return _response(found, payload)
+
+
+async def alookup_dni(dni):
+    return await alookup_document(IdentityLookup.DOC_DNI, dni)
+
+
+async def alookup_ruc(ruc):
+    return await alookup_document(IdentityLookup.DOC_RUC, ruc)
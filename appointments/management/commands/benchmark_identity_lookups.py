@@ -0,0 +1,94 @@
+import asyncio
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from django.test import AsyncClient, Client
+from django.test.utils import override_settings
+from django.urls import reverse
+
+from appointments import provider_client
+from appointments.fake_provider import start_fake_provider
+
+
+class Command(BaseCommand):
+    help = (
+        'Compara el rendimiento de los endpoints de DNI síncrono (hilos, como '
+        'los workers de gunicorn, vía Client) y async (un solo event loop, vía '
+        'AsyncClient sobre el handler ASGI) con toda la pila de middleware, '
+        'contra el proveedor falso local. Cada consulta usa un DNI distinto '
+        'para que la caché no intervenga.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200, help='Consultas por modo.')
+        parser.add_argument('--workers', type=int, default=8, help='Hilos del modo síncrono.')
+        parser.add_argument('--concurrency', type=int, default=200, help='Consultas simultáneas del modo async.')
+        parser.add_argument('--latency', type=float, default=0.2, help='Segundos de espera del proveedor falso.')
+
+    def handle(self, *args, **options):
+        server = start_fake_provider(latency=options['latency'])
+        try:
+            with override_settings(APIPERU_BASE_URL=server.base_url, DECOLECTA_BASE_URL=server.base_url,
+                                   ALLOWED_HOSTS=['testserver']):
+                self._report('sync', server, lambda numbers: self._run_sync(numbers, options['workers']),
+                             options['requests'])
+                self._report('async', server, lambda numbers: asyncio.run(
+                    self._run_async(numbers, options['concurrency'])), options['requests'])
+        finally:
+            server.shutdown()
+            server.server_close()
+
+    def _numbers(self, count):
+        # DNIs nuevos en cada ejecución; terminan en 1-9 para que el proveedor los encuentre
+        prefix = random.randint(10, 99)
+        return [f'{prefix}{i:05d}{random.randint(1, 9)}' for i in range(count)]
+
+    def _report(self, label, server, run, count):
+        numbers = self._numbers(count)
+        # No medir respuestas guardadas por una ejecución anterior ni un breaker abierto
+        cache.delete_many([f'identity:dni:{number}' for number in numbers])
+        cache.delete(provider_client.CircuitBreaker('apiperu').open_key)
+        hits_before = server.hits
+        started = time.perf_counter()
+        statuses = run(numbers)
+        elapsed = time.perf_counter() - started
+        ok = sum(1 for status in statuses if status == 200)
+        self.stdout.write(
+            f'{label:>5}: {count} consultas en {elapsed:.2f}s '
+            f'({count / elapsed:.1f} req/s), {ok} OK, {server.hits - hits_before} llamadas al proveedor'
+        )
+
+    def _run_sync(self, numbers, workers):
+        url = reverse('appointments:buscar_dni')
+        local = threading.local()
+
+        def one(number):
+            client = getattr(local, 'client', None)
+            if client is None:
+                client = local.client = Client()
+            try:
+                return client.post(url, {'dni': number}).status_code
+            finally:
+                close_old_connections()
+
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            return list(pool.map(one, numbers))
+
+    async def _run_async(self, numbers, concurrency):
+        url = reverse('appointments:buscar_dni_async')
+        client = AsyncClient()
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def one(number):
+            async with semaphore:
+                return (await client.post(url, {'dni': number})).status_code
+
+        try:
+            return await asyncio.gather(*(one(number) for number in numbers))
+        finally:
+            await provider_client.get_async_session().close()
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+from appointments.utils import check_and_cancel_expired_appointments
+
+
+class Command(BaseCommand):
+    help = (
+        'Cancela en bloque las citas pendientes vencidas (regla de 24h). '
+        'Pensado para ejecutarse periódicamente (cron / programador de tareas).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Solo cuenta las citas vencidas, sin cancelarlas.')
+        parser.add_argument('--no-notify', action='store_true', help='No encolar los correos de cancelación.')
+
+    def handle(self, *args, **options):
+        count = check_and_cancel_expired_appointments(
+            notify=not options['no_notify'],
+            dry_run=options['dry_run'],
+        )
+        if options['dry_run']:
+            self.stdout.write(f'{count} cita(s) vencida(s) por cancelar.')
+        else:
+            self.stdout.write(self.style.SUCCESS(f'Se cancelaron {count} cita(s) vencida(s).'))
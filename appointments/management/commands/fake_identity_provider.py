@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+from appointments.fake_provider import FakeProviderServer
+
+
+class Command(BaseCommand):
+    help = (
+        'Levanta un proveedor DNI/RUC falso en local para pruebas. Apuntar '
+        'APIPERU_BASE_URL y DECOLECTA_BASE_URL a la URL que muestra.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--port', type=int, default=8765)
+        parser.add_argument('--latency', type=float, default=0.0, help='Segundos de espera por respuesta.')
+        parser.add_argument('--error-rate', type=float, default=0.0, help='Fracción de respuestas 503 (0 a 1).')
+
+    def handle(self, *args, **options):
+        server = FakeProviderServer(
+            ('127.0.0.1', options['port']),
+            latency=options['latency'], error_rate=options['error_rate'], verbose=True,
+        )
+        self.stdout.write(self.style.SUCCESS(f'Proveedor falso escuchando en {server.base_url} (Ctrl+C para salir)'))
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
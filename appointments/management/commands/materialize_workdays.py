@@ -0,0 +1,25 @@
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from appointments.workdays import materialize_months_ahead, DEFAULT_MONTHS_AHEAD
+
+
+class Command(BaseCommand):
+    help = (
+        'Genera los días programados que falten para los próximos meses a partir de la '
+        'plantilla semanal y los feriados. Pensado para ejecutarse periódicamente (cron).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--months', type=int, default=DEFAULT_MONTHS_AHEAD, help='Meses a generar por adelantado.')
+        parser.add_argument('--start', help='Fecha inicial (YYYY-MM-DD). Por defecto, hoy.')
+
+    def handle(self, *args, **options):
+        start_date = None
+        if options['start']:
+            try:
+                start_date = datetime.strptime(options['start'], '%Y-%m-%d').date()
+            except ValueError:
+                raise CommandError('Formato de fecha inválido, use YYYY-MM-DD.')
+        created = materialize_months_ahead(options['months'], start_date=start_date)
+        self.stdout.write(self.style.SUCCESS(f'Se generaron {created} día(s) programado(s).'))
@@ -0,0 +1,43 @@
+import logging
+import time
+
+from django.core.management.base import BaseCommand
+from appointments.outbox import deliver_outbox
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = (
+        'Envía los correos en cola (tabla correos_salientes) por lotes, '
+        'reutilizando una conexión SMTP por lote. Con --loop queda como worker.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=50, help='Correos por lote (por conexión SMTP).')
+        parser.add_argument('--loop', action='store_true', help='Seguir procesando la cola indefinidamente.')
+        parser.add_argument('--interval', type=float, default=10, help='Segundos de espera con la cola vacía (con --loop).')
+
+    def handle(self, *args, **options):
+        total_sent = total_failed = 0
+        while True:
+            try:
+                sent, failed = deliver_outbox(batch_size=options['batch_size'])
+            except Exception:
+                # Un error inesperado (p. ej. la BD) no debe tumbar al worker
+                logger.exception('Error procesando la cola de correos')
+                self.stderr.write('Error procesando la cola de correos; ver el log.')
+                sent = failed = 0
+            total_sent += sent
+            total_failed += failed
+            if sent or failed:
+                self.stdout.write(f'Lote: {sent} enviado(s), {failed} con error.')
+            if sent + failed < options['batch_size']:
+                # Cola vacía (o solo quedan reintentos programados)
+                if not options['loop']:
+                    break
+                time.sleep(options['interval'])
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Correos enviados: {total_sent}. Con error: {total_failed}.'
+        ))
@@ -0,0 +1,27 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from appointments.holds import sweep_expired_holds, recount_reserved
+
+
+class Command(BaseCommand):
+    help = (
+        'Libera en bloque las reservas temporales de cupo vencidas. '
+        'Pensado para ejecutarse periódicamente (cron / programador de tareas).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--recount', action='store_true',
+            help='Además, recalcula el cupo ocupado de los días desde hoy (reconciliación).'
+        )
+        parser.add_argument('--days', type=int, default=120, help='Días a recalcular con --recount.')
+
+    def handle(self, *args, **options):
+        released = sweep_expired_holds()
+        self.stdout.write(self.style.SUCCESS(f'Se liberaron {released} reserva(s) vencida(s).'))
+        if options['recount']:
+            today = timezone.now().date()
+            fixed = recount_reserved(today, today + timedelta(days=options['days']))
+            self.stdout.write(f'Días con cupo corregido: {fixed}.')
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.20 on 2026-10-18 09:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointments', '0010_scheduledworkday_workscheduletemplate_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='scheduledworkday',
+            name='max_appointments',
+            field=models.PositiveIntegerField(blank=True, help_text='Déjelo vacío para usar el cupo diario por defecto.', null=True, verbose_name='Cupo máximo de citas'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.20 on 2026-10-18 09:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointments', '0011_scheduledworkday_max_appointments'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(fields=['status', 'appointment_date'], name='citas_status_date_idx'),
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 4.2.20 on 2026-10-18 09:15
+
+import datetime
+
+from django.db import migrations, models
+
+
+def fill_end_time(apps, schema_editor):
+    """Calcula end_time de las citas existentes (hora + duración del servicio)."""
+    Appointment = apps.get_model('appointments', 'Appointment')
+    pending = []
+    queryset = Appointment.objects.filter(appointment_time__isnull=False).select_related('service')
+    for appointment in queryset.iterator(chunk_size=1000):
+        minutes = appointment.appointment_time.hour * 60 + appointment.appointment_time.minute
+        minutes = min(minutes + (appointment.service.duration or 60), 24 * 60 - 1)
+        appointment.end_time = datetime.time(minutes // 60, minutes % 60)
+        pending.append(appointment)
+        if len(pending) >= 1000:
+            Appointment.objects.bulk_update(pending, ['end_time'])
+            pending = []
+    if pending:
+        Appointment.objects.bulk_update(pending, ['end_time'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointments', '0013_outbound_email'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='appointment',
+            name='end_time',
+            field=models.TimeField(blank=True, editable=False, null=True, verbose_name='Hora de Fin'),
+        ),
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(fields=['staff', 'appointment_date', 'appointment_time'], name='citas_staff_date_time_idx'),
+        ),
+        migrations.RunPython(fill_end_time, migrations.RunPython.noop),
+    ]
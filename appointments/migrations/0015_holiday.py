@@ -0,0 +1,27 @@
+# Generated by Django 4.2.20 on 2026-10-18 09:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointments', '0014_appointment_end_time'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Holiday',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(verbose_name='Fecha')),
+                ('name', models.CharField(max_length=120, verbose_name='Motivo')),
+                ('is_recurring', models.BooleanField(default=False, help_text='Marque para feriados de fecha fija (mismo día y mes cada año).', verbose_name='¿Se repite cada año?')),
+            ],
+            options={
+                'verbose_name': 'Feriado / Excepción',
+                'verbose_name_plural': 'Feriados y Excepciones',
+                'ordering': ['date'],
+            },
+        ),
+    ]
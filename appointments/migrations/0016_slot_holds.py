@@ -0,0 +1,55 @@
+# Generated by Django 4.2.20 on 2026-10-18 09:19
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import uuid
+
+
+def fill_reserved_count(apps, schema_editor):
+    """Cupo ocupado inicial de cada día: sus citas activas (un conteo agrupado)."""
+    Appointment = apps.get_model('appointments', 'Appointment')
+    ScheduledWorkDay = apps.get_model('appointments', 'ScheduledWorkDay')
+    totals = dict(
+        Appointment.objects.filter(status__in=('pending', 'confirmed'), appointment_date__isnull=False)
+        .values('appointment_date').annotate(total=models.Count('id')).values_list('appointment_date', 'total')
+    )
+    workdays = list(ScheduledWorkDay.objects.filter(date__in=totals))
+    for workday in workdays:
+        workday.reserved_count = totals[workday.date]
+    ScheduledWorkDay.objects.bulk_update(workdays, ['reserved_count'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('services', '0015_service_duration'),
+        ('appointments', '0015_holiday'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='scheduledworkday',
+            name='reserved_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Cupos ocupados'),
+        ),
+        migrations.CreateModel(
+            name='SlotHold',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('token', models.UUIDField(default=uuid.uuid4, editable=False, unique=True, verbose_name='Token')),
+                ('date', models.DateField(verbose_name='Fecha')),
+                ('expires_at', models.DateTimeField(verbose_name='Vence')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Fecha de Creación')),
+                ('client', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='slot_holds', to=settings.AUTH_USER_MODEL, verbose_name='Cliente')),
+                ('service', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='slot_holds', to='services.service', verbose_name='Servicio')),
+            ],
+            options={
+                'verbose_name': 'Reserva Temporal',
+                'verbose_name_plural': 'Reservas Temporales',
+                'indexes': [models.Index(fields=['expires_at'], name='slothold_expires_idx'), models.Index(fields=['date', 'expires_at'], name='slothold_date_expires_idx')],
+            },
+        ),
+        migrations.RunPython(fill_reserved_count, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 4.2.20 on 2026-10-18 09:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointments', '0016_slot_holds'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IdentityLookup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('doc_type', models.CharField(choices=[('dni', 'DNI'), ('ruc', 'RUC')], max_length=3, verbose_name='Tipo de documento')),
+                ('number', models.CharField(max_length=11, verbose_name='Número')),
+                ('found', models.BooleanField(default=True, verbose_name='¿Encontrado?')),
+                ('data', models.JSONField(default=dict, verbose_name='Respuesta')),
+                ('fetched_at', models.DateTimeField(auto_now=True, verbose_name='Consultado')),
+                ('expires_at', models.DateTimeField(verbose_name='Vence')),
+            ],
+            options={
+                'verbose_name': 'Consulta DNI/RUC',
+                'verbose_name_plural': 'Consultas DNI/RUC',
+                'db_table': 'consultas_identidad',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='identitylookup',
+            constraint=models.UniqueConstraint(fields=('doc_type', 'number'), name='consulta_identidad_unica'),
+        ),
+    ]
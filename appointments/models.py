@@ -5,6 +5,7 @@ from django.conf import settings # Mejor forma de referenciar User model
 from services.models import Service # Asumiendo que está en la app 'services'
 from django.utils import timezone
 import datetime
+import uuid
 from django.core.exceptions import ValidationError
 # --- Modelos de Horario Laboral ---
 
@@ -45,7 +46,15 @@ class ScheduledWorkDay(models.Model):
     start_time = models.TimeField(verbose_name=_('Hora de inicio general'), null=True, blank=True)
     end_time = models.TimeField(verbose_name=_('Hora de fin general'), null=True, blank=True)
     is_working = models.BooleanField(default=True, verbose_name=_('¿Se trabaja este día?'))
+    max_appointments = models.PositiveIntegerField(
+        verbose_name=_('Cupo máximo de citas'), null=True, blank=True,
+        help_text=_('Déjelo vacío para usar el cupo diario por defecto.')
+    )
     notes = models.TextField(verbose_name=_('Notas generales del día'), blank=True, null=True)
+    # Citas activas + reservas temporales vigentes; se mantiene con F() (ver holds.py)
+    reserved_count = models.PositiveIntegerField(
+        verbose_name=_('Cupos ocupados'), default=0, editable=False
+    )
 
     class Meta:
         verbose_name = _('Día de Trabajo Programado')
@@ -66,9 +75,49 @@ class ScheduledWorkDay(models.Model):
     def day_of_week(self):
         return self.date.weekday()
 
+    @property
+    def capacity(self):
+        """Cupo de citas del día (el propio o el cupo por defecto de settings)."""
+        if self.max_appointments is not None:
+            return self.max_appointments
+        return getattr(settings, 'APPOINTMENTS_DAILY_CAPACITY', 3)
+
+    @property
+    def remaining(self):
+        """Cupos libres del día (sin consultar las citas)."""
+        return max(self.capacity - self.reserved_count, 0)
+
+class Holiday(models.Model):
+    """
+    Feriado o excepción al horario semanal. Al generar los días programados
+    desde la plantilla, estas fechas se crean como no laborables.
+    """
+    date = models.DateField(verbose_name=_('Fecha'))
+    name = models.CharField(max_length=120, verbose_name=_('Motivo'))
+    is_recurring = models.BooleanField(
+        default=False, verbose_name=_('¿Se repite cada año?'),
+        help_text=_('Marque para feriados de fecha fija (mismo día y mes cada año).')
+    )
+
+    class Meta:
+        verbose_name = _('Feriado / Excepción')
+        verbose_name_plural = _('Feriados y Excepciones')
+        ordering = ['date']
+
+    def __str__(self):
+        return f"{self.date.strftime('%d/%m/%Y')} - {self.name}"
+
+    def matches(self, target_date):
+        if self.is_recurring:
+            return (self.date.month, self.date.day) == (target_date.month, target_date.day)
+        return self.date == target_date
+
 # --- Modelo de Cita Modificado ---
 
 class Appointment(models.Model):
+    # Estados que ocupan cupo y tiempo en la agenda
+    ACTIVE_STATUSES = ('pending', 'confirmed')
+
     STATUS_CHOICES = (
         # Considera traducir las claves también o usar constantes
         ("pending", _("Pendiente")),
@@ -112,6 +161,14 @@ class Appointment(models.Model):
         blank=True
     )
 
+    # Calculada al guardar (hora + duración del servicio); permite buscar cruces con un rango indexado
+    end_time = models.TimeField(
+        verbose_name=_("Hora de Fin"),
+        null=True,
+        blank=True,
+        editable=False
+    )
+
     # ELIMINADO: staff_availability = models.ForeignKey(StaffAvailability, on_delete=models.SET_NULL, null=True)
 
     created_at = models.DateTimeField(auto_now_add=True, verbose_name=_("Fecha de Creación"))
@@ -128,6 +185,12 @@ class Appointment(models.Model):
         verbose_name = _("Cita")
         verbose_name_plural = _("Citas")
         ordering = ['-appointment_date', '-appointment_time'] # Ordenar por fecha/hora de cita
+        indexes = [
+            # Vencimiento de pendientes y conteos de cupo por día
+            models.Index(fields=['status', 'appointment_date'], name='citas_status_date_idx'),
+            # Cruces de horario del personal: staff + fecha + rango de horas
+            models.Index(fields=['staff', 'appointment_date', 'appointment_time'], name='citas_staff_date_time_idx'),
+        ]
 
     def __str__(self):
         client_name = self.client.get_full_name() or self.client.username
@@ -163,7 +226,6 @@ class Appointment(models.Model):
                                 date=self.appointment_date
                             )
                         })
-                # --- Aquí irían otras validaciones si las necesitas (conflictos, etc.) ---
 
             except ScheduledWorkDay.DoesNotExist:
                  # Usa ValidationError directamente y asócialo al campo
@@ -172,9 +234,184 @@ class Appointment(models.Model):
                     'appointment_date': _("No hay información de horario laboral para la fecha seleccionada ({date}). Contacte al administrador.").format(date=self.appointment_date)
                 })
 
+        # El mismo personal no puede tener dos citas activas que se crucen
+        from .conflicts import staff_conflicts
+        conflicts = staff_conflicts(self)
+        if conflicts:
+            other = conflicts[0]
+            raise ValidationError({
+                'staff': _("{staff} ya tiene la cita #{id} de {start} a {end} ese día.").format(
+                    staff=self.staff.get_full_name() or self.staff.username,
+                    id=other.id,
+                    start=other.appointment_time.strftime('%H:%M'),
+                    end=other.end_time.strftime('%H:%M'),
+                )
+            })
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Día cuyo cupo ocupa la cita tal como está en la BD (para ajustar el contador al guardar)
+        if 'status' in field_names and 'appointment_date' in field_names:
+            instance._reserved_date = instance.reserved_date
+        return instance
+
+    @property
+    def reserved_date(self):
+        """Fecha cuyo cupo ocupa la cita, o None si no está activa."""
+        return self.appointment_date if self.status in self.ACTIVE_STATUSES else None
+
+    def save(self, *args, **kwargs):
+        from .conflicts import compute_end_time
+        from .holds import adjust_reserved_counts
+        self.end_time = compute_end_time(self.appointment_time, self.service.duration if self.service_id else None)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'appointment_time' in update_fields:
+            kwargs['update_fields'] = set(update_fields) | {'end_time'}
+
+        if self._state.adding:
+            self._reserved_date = None
+        elif not hasattr(self, '_reserved_date'):
+            previous = type(self).objects.filter(pk=self.pk).values('appointment_date', 'status').first()
+            self._reserved_date = (
+                previous['appointment_date'] if previous and previous['status'] in self.ACTIVE_STATUSES else None
+            )
+        old_date, new_date = getattr(self, '_reserved_date', None), self.reserved_date
+        super().save(*args, **kwargs)
+        if old_date != new_date:
+            deltas = {}
+            if old_date:
+                deltas[old_date] = -1
+            if new_date:
+                deltas[new_date] = deltas.get(new_date, 0) + 1
+            adjust_reserved_counts(deltas)
+        self._reserved_date = new_date
+
     # Considera añadir métodos para obtener la fecha/hora formateadas si lo necesitas a menudo
     # def get_formatted_date(self):
     #     return self.appointment_date.strftime('%d/%m/%Y')
 
     # def get_formatted_time(self):
-    #     return self.appointment_time.strftime('%H:%M')
\ No newline at end of file
+    #     return self.appointment_time.strftime('%H:%M')
+
+# --- Cola de correos salientes ---
+
+class OutboundEmail(models.Model):
+    """
+    Correo transaccional en cola. Las vistas solo lo registran; el envío real
+    lo hace `manage.py send_queued_emails` reutilizando una conexión SMTP.
+    """
+    STATUS_PENDING = 'pending'
+    STATUS_SENT = 'sent'
+    STATUS_DEAD = 'dead'
+    STATUS_CHOICES = (
+        (STATUS_PENDING, _("Pendiente")),
+        (STATUS_SENT, _("Enviado")),
+        (STATUS_DEAD, _("Descartado")),
+    )
+
+    subject = models.CharField(_("Asunto"), max_length=255)
+    body = models.TextField(_("Texto plano"))
+    html_body = models.TextField(_("HTML"), blank=True)
+    from_email = models.CharField(_("Remitente"), max_length=254, blank=True)
+    recipients = models.JSONField(_("Destinatarios"), default=list)
+    status = models.CharField(_("Estado"), max_length=10, choices=STATUS_CHOICES, default=STATUS_PENDING)
+    attempts = models.PositiveSmallIntegerField(_("Intentos"), default=0)
+    next_attempt_at = models.DateTimeField(_("Próximo intento"), default=timezone.now)
+    last_error = models.TextField(_("Último error"), blank=True)
+    created_at = models.DateTimeField(_("Fecha de Creación"), auto_now_add=True)
+    sent_at = models.DateTimeField(_("Fecha de Envío"), null=True, blank=True)
+
+    class Meta:
+        db_table = 'correos_salientes'
+        verbose_name = _("Correo Saliente")
+        verbose_name_plural = _("Correos Salientes")
+        ordering = ['-created_at']
+        indexes = [
+            # El worker solo lee pendientes cuyo próximo intento ya venció
+            models.Index(fields=['status', 'next_attempt_at'], name='correo_status_next_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.subject} → {', '.join(self.recipients)} ({self.get_status_display()})"
+
+
+class SlotHold(models.Model):
+    """
+    Reserva temporal de un cupo del día mientras el cliente completa el
+    formulario. Ocupa cupo en ScheduledWorkDay.reserved_count hasta que se
+    convierte en cita o vence (ver appointments/holds.py).
+    """
+    token = models.UUIDField(_("Token"), default=uuid.uuid4, unique=True, editable=False)
+    client = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.CASCADE,
+        related_name="slot_holds", verbose_name=_("Cliente")
+    )
+    service = models.ForeignKey(
+        Service, on_delete=models.SET_NULL, null=True, blank=True,
+        related_name="slot_holds", verbose_name=_("Servicio")
+    )
+    date = models.DateField(_("Fecha"))
+    expires_at = models.DateTimeField(_("Vence"))
+    created_at = models.DateTimeField(_("Fecha de Creación"), auto_now_add=True)
+
+    class Meta:
+        verbose_name = _("Reserva Temporal")
+        verbose_name_plural = _("Reservas Temporales")
+        indexes = [
+            models.Index(fields=['expires_at'], name='slothold_expires_idx'),
+            models.Index(fields=['date', 'expires_at'], name='slothold_date_expires_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.client} - {self.date} (vence {self.expires_at:%H:%M})"
+
+
+class IdentityLookup(models.Model):
+    """
+    Resultado guardado de una consulta DNI/RUC a la API externa, para no
+    volver a pagar la misma consulta. También guarda los "no encontrado"
+    (con una vigencia más corta).
+    """
+    DOC_DNI = 'dni'
+    DOC_RUC = 'ruc'
+    DOC_CHOICES = (
+        (DOC_DNI, 'DNI'),
+        (DOC_RUC, 'RUC'),
+    )
+
+    doc_type = models.CharField(_("Tipo de documento"), max_length=3, choices=DOC_CHOICES)
+    number = models.CharField(_("Número"), max_length=11)
+    found = models.BooleanField(_("¿Encontrado?"), default=True)
+    data = models.JSONField(_("Respuesta"), default=dict)
+    fetched_at = models.DateTimeField(_("Consultado"), auto_now=True)
+    expires_at = models.DateTimeField(_("Vence"))
+
+    class Meta:
+        db_table = 'consultas_identidad'
+        verbose_name = _("Consulta DNI/RUC")
+        verbose_name_plural = _("Consultas DNI/RUC")
+        constraints = [
+            models.UniqueConstraint(fields=['doc_type', 'number'], name='consulta_identidad_unica'),
+        ]
+
+    def __str__(self):
+        estado = _("encontrado") if self.found else _("no encontrado")
+        return f"{self.get_doc_type_display()} {self.number} ({estado})"
+
+
+class CalendarVersion(models.Model):
+    """
+    Versión de los datos de agenda guardada en la BD (una sola fila). Se usa
+    cuando la cache por defecto no es compartida entre procesos (ver cache.py).
+    """
+    version = models.PositiveBigIntegerField(_("Versión"), default=1)
+    updated_at = models.DateTimeField(_("Actualizado"), auto_now=True)
+
+    class Meta:
+        db_table = 'version_calendario'
+        verbose_name = _("Versión del Calendario")
+        verbose_name_plural = _("Versión del Calendario")
+
+    def __str__(self):
+        return f"v{self.version}"
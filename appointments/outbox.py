@@ -0,0 +1,127 @@
+# appointments/outbox.py
+"""
+Cola persistente de correos transaccionales.
+
+`enqueue_email` guarda el mensaje en la tabla `correos_salientes` y vuelve de
+inmediato; `deliver_outbox` (usado por `manage.py send_queued_emails`) envía los
+pendientes por lotes sobre una sola conexión SMTP. Los fallos se reintentan con
+espera exponencial y, al agotar los intentos, el correo queda descartado para
+revisarlo desde el admin.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import OutboundEmail
+
+MAX_ATTEMPTS = getattr(settings, 'EMAIL_OUTBOX_MAX_ATTEMPTS', 5)
+RETRY_BASE_SECONDS = getattr(settings, 'EMAIL_OUTBOX_RETRY_BASE_SECONDS', 60)
+RETRY_MAX_SECONDS = 60 * 60 * 6
+
+
+def enqueue_email(subject, body, recipient_list, html_body='', from_email=None):
+    """Registra un correo para envío diferido. Devuelve el OutboundEmail creado."""
+    recipients = [address for address in recipient_list if address]
+    if not recipients:
+        return None
+    return OutboundEmail.objects.create(
+        subject=subject[:255],
+        body=body,
+        html_body=html_body or '',
+        from_email=from_email or getattr(settings, 'DEFAULT_FROM_EMAIL', '') or '',
+        recipients=recipients,
+    )
+
+
+def retry_delay(attempts):
+    """Espera antes del siguiente intento: base * 2^(intentos-1), con tope."""
+    return timedelta(seconds=min(RETRY_BASE_SECONDS * 2 ** max(attempts - 1, 0), RETRY_MAX_SECONDS))
+
+
+def _claim_batch(batch_size, now):
+    """
+    Toma un lote de pendientes vencidos. Se corre su próximo intento hacia
+    adelante para que otro worker en paralelo no los tome mientras se envían.
+    """
+    with transaction.atomic():
+        ids = list(
+            OutboundEmail.objects.select_for_update(skip_locked=True)
+            .filter(status=OutboundEmail.STATUS_PENDING, next_attempt_at__lte=now)
+            .order_by('next_attempt_at', 'id')
+            .values_list('id', flat=True)[:batch_size]
+        )
+        if ids:
+            OutboundEmail.objects.filter(id__in=ids).update(next_attempt_at=now + retry_delay(1))
+    return list(OutboundEmail.objects.filter(id__in=ids).order_by('id'))
+
+
+def _build_message(email, connection):
+    message = EmailMultiAlternatives(
+        email.subject, email.body,
+        email.from_email or getattr(settings, 'DEFAULT_FROM_EMAIL', None),
+        email.recipients, connection=connection,
+    )
+    if email.html_body:
+        message.attach_alternative(email.html_body, 'text/html')
+    return message
+
+
+def _record_failure(email, exc):
+    """Cuenta el intento fallido: reprograma con espera exponencial o descarta el correo."""
+    email.attempts += 1
+    email.last_error = f"{type(exc).__name__}: {exc}"[:2000]
+    if email.attempts >= MAX_ATTEMPTS:
+        email.status = OutboundEmail.STATUS_DEAD
+    else:
+        email.next_attempt_at = timezone.now() + retry_delay(email.attempts)
+    email.save(update_fields=['attempts', 'last_error', 'status', 'next_attempt_at'])
+
+
+def deliver_outbox(batch_size=50, connection=None):
+    """
+    Envía un lote de correos pendientes usando una sola conexión.
+    Devuelve (enviados, fallidos).
+    """
+    now = timezone.now()
+    batch = _claim_batch(batch_size, now)
+    if not batch:
+        return 0, 0
+
+    sent_ids, failed = [], 0
+    connection = connection or get_connection(fail_silently=False)
+    try:
+        connection.open()
+    except Exception as exc:
+        # SMTP caído: cuenta como intento para todo el lote, así también llegan a descartarse
+        for email in batch:
+            _record_failure(email, exc)
+        return 0, len(batch)
+    try:
+        for email in batch:
+            try:
+                if not _build_message(email, connection).send():
+                    raise ConnectionError('El backend de correo no aceptó el mensaje.')
+            except Exception as exc:
+                failed += 1
+                _record_failure(email, exc)
+                # Si la conexión se cayó, se reabre para el resto del lote
+                try:
+                    connection.close()
+                    connection.open()
+                except Exception:
+                    pass
+            else:
+                sent_ids.append(email.id)
+    finally:
+        connection.close()
+
+    if sent_ids:
+        OutboundEmail.objects.filter(id__in=sent_ids).update(
+            status=OutboundEmail.STATUS_SENT, sent_at=timezone.now(),
+            attempts=F('attempts') + 1, last_error='',
+        )
+    return len(sent_ids), failed
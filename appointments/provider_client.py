@@ -0,0 +1,188 @@
+# appointments/provider_client.py
+"""
+Cliente HTTP compartido para las APIs externas de identidad (DNI / RUC).
+
+- Una requests.Session por hilo con pool de conexiones (keep-alive): las
+  consultas seguidas reutilizan la conexión TLS en lugar de abrir otra.
+- Reintentos acotados con espera exponencial y jitter, solo ante errores
+  transitorios (conexión, timeout, 429/502/503/504).
+- Circuit breaker por proveedor, con el estado en la caché de Django para que
+  todos los workers lo compartan: tras varios fallos seguidos las llamadas
+  fallan al instante durante un tiempo, sin ocupar el worker esperando.
+
+`arequest`/`aget` son la versión asíncrona (aiohttp, una ClientSession por
+event loop) para las vistas async servidas por ASGI, con los mismos
+reintentos y el mismo circuit breaker.
+"""
+import asyncio
+import random
+import threading
+import time
+import weakref
+
+import aiohttp
+import requests
+from django.conf import settings
+from django.core.cache import cache
+from requests.adapters import HTTPAdapter
+
+CONNECT_TIMEOUT = getattr(settings, 'IDENTITY_API_CONNECT_TIMEOUT', 3)
+READ_TIMEOUT = getattr(settings, 'IDENTITY_API_READ_TIMEOUT', 5)
+MAX_RETRIES = getattr(settings, 'IDENTITY_API_RETRIES', 2)
+RETRY_BACKOFF = 0.2  # segundos, base de la espera exponencial
+RETRY_STATUSES = {429, 502, 503, 504}
+
+BREAKER_THRESHOLD = getattr(settings, 'IDENTITY_API_BREAKER_THRESHOLD', 5)
+BREAKER_COOLDOWN = getattr(settings, 'IDENTITY_API_BREAKER_COOLDOWN', 30)  # segundos
+BREAKER_WINDOW = 60  # segundos en los que se acumulan fallos
+
+_local = threading.local()
+
+
+class CircuitOpen(Exception):
+    """El proveedor falló repetidamente; no se le llama hasta que pase el enfriamiento."""
+
+
+def get_session():
+    session = getattr(_local, 'session', None)
+    if session is None:
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=10)
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        _local.session = session
+    return session
+
+
+class CircuitBreaker:
+    def __init__(self, name, threshold=BREAKER_THRESHOLD, cooldown=BREAKER_COOLDOWN):
+        self.name = name
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures_key = f'provider:{name}:failures'
+        self.open_key = f'provider:{name}:open'
+
+    def is_open(self):
+        return bool(cache.get(self.open_key))
+
+    def record_success(self):
+        cache.delete(self.failures_key)
+
+    def record_failure(self):
+        cache.add(self.failures_key, 0, BREAKER_WINDOW)
+        try:
+            failures = cache.incr(self.failures_key)
+        except ValueError:
+            cache.set(self.failures_key, 1, BREAKER_WINDOW)
+            failures = 1
+        if failures >= self.threshold:
+            cache.set(self.open_key, True, self.cooldown)
+            # Pasado el enfriamiento basta un fallo más para volver a abrir (semiabierto)
+            cache.set(self.failures_key, self.threshold - 1, self.cooldown + BREAKER_WINDOW)
+
+    # Versiones async (usan los métodos a* de la caché)
+    async def ais_open(self):
+        return bool(await cache.aget(self.open_key))
+
+    async def arecord_success(self):
+        await cache.adelete(self.failures_key)
+
+    async def arecord_failure(self):
+        await cache.aadd(self.failures_key, 0, BREAKER_WINDOW)
+        try:
+            failures = await cache.aincr(self.failures_key)
+        except ValueError:
+            await cache.aset(self.failures_key, 1, BREAKER_WINDOW)
+            failures = 1
+        if failures >= self.threshold:
+            await cache.aset(self.open_key, True, self.cooldown)
+            await cache.aset(self.failures_key, self.threshold - 1, self.cooldown + BREAKER_WINDOW)
+
+
+def request(provider, method, url, **kwargs):
+    """
+    Hace la petición con reintentos y circuit breaker. Devuelve la respuesta
+    (cualquier código no transitorio) o lanza CircuitOpen /
+    requests.RequestException cuando se agotan los intentos.
+    """
+    breaker = CircuitBreaker(provider)
+    if breaker.is_open():
+        raise CircuitOpen(f'{provider}: servicio no disponible temporalmente')
+
+    kwargs.setdefault('timeout', (CONNECT_TIMEOUT, READ_TIMEOUT))
+    session = get_session()
+    for attempt in range(MAX_RETRIES + 1):
+        try:
+            response = session.request(method, url, **kwargs)
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+            if attempt == MAX_RETRIES:
+                breaker.record_failure()
+                raise
+        else:
+            if response.status_code not in RETRY_STATUSES and response.status_code < 500:
+                breaker.record_success()
+                return response
+            if attempt == MAX_RETRIES:
+                breaker.record_failure()
+                return response
+        # Espera exponencial con jitter completo para no sincronizar reintentos
+        time.sleep(random.uniform(0, RETRY_BACKOFF * 2 ** attempt))
+
+
+def get(provider, url, **kwargs):
+    return request(provider, 'GET', url, **kwargs)
+
+
+# --- Cliente asíncrono ---
+
+_async_sessions = weakref.WeakKeyDictionary()
+
+
+def get_async_session():
+    """ClientSession compartida por el event loop actual (pool keep-alive)."""
+    loop = asyncio.get_running_loop()
+    session = _async_sessions.get(loop)
+    if session is None or session.closed:
+        session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=100, keepalive_timeout=30),
+            timeout=aiohttp.ClientTimeout(connect=CONNECT_TIMEOUT, sock_read=READ_TIMEOUT),
+        )
+        _async_sessions[loop] = session
+    return session
+
+
+async def arequest(provider, method, url, **kwargs):
+    """
+    Igual que request(), sin bloquear el event loop. Devuelve
+    (status, json | None) o lanza CircuitOpen / aiohttp.ClientError /
+    asyncio.TimeoutError cuando se agotan los intentos.
+    """
+    breaker = CircuitBreaker(provider)
+    if await breaker.ais_open():
+        raise CircuitOpen(f'{provider}: servicio no disponible temporalmente')
+
+    session = get_async_session()
+    for attempt in range(MAX_RETRIES + 1):
+        try:
+            async with session.request(method, url, **kwargs) as response:
+                status = response.status
+                try:
+                    data = await response.json(content_type=None)
+                except ValueError:
+                    data = None
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            if attempt == MAX_RETRIES:
+                await breaker.arecord_failure()
+                raise
+        else:
+            if status not in RETRY_STATUSES and status < 500:
+                await breaker.arecord_success()
+                return status, data
+            if attempt == MAX_RETRIES:
+                await breaker.arecord_failure()
+                return status, data
+        await asyncio.sleep(random.uniform(0, RETRY_BACKOFF * 2 ** attempt))
+
+
+async def aget(provider, url, **kwargs):
+    return await arequest(provider, 'GET', url, **kwargs)
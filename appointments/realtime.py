@@ -0,0 +1,75 @@
+# appointments/realtime.py
+"""
+Cambios de citas en tiempo real para el calendario del admin.
+
+Cada alta, edición, cancelación o borrado de una cita se publica como un
+evento de FullCalendar en el grupo `admin_calendar` de Channels; los
+calendarios abiertos (consumers.CalendarConsumer) lo aplican sobre su lista
+de eventos en lugar de volver a pedir todo el rango a calendar_events_api.
+"""
+import logging
+from datetime import datetime, timedelta
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+
+from .models import Appointment
+
+logger = logging.getLogger(__name__)
+
+CALENDAR_GROUP = 'admin_calendar'
+
+ACTION_CREATED = 'created'
+ACTION_UPDATED = 'updated'
+ACTION_CANCELLED = 'cancelled'
+ACTION_DELETED = 'deleted'
+
+STATUS_COLORS = {'pending': '#ffc107', 'confirmed': '#28a745', 'completed': '#6c757d', 'cancelled': '#dc3545'}
+
+
+def appointment_event(appt):
+    """Evento de FullCalendar para una cita (con client, service y staff ya cargados)."""
+    start_dt = datetime.combine(appt.appointment_date, appt.appointment_time)
+    duration = getattr(appt.service, 'duration', 60)
+    end_dt = start_dt + timedelta(minutes=duration)
+    client_name = appt.client.get_full_name() or appt.client.username
+    staff_name = appt.staff.get_full_name() if appt.staff else 'Sin asignar'
+    return {
+        'id': f'appointment-{appt.id}',
+        'title': f'{client_name} - {appt.service.name}',
+        'start': start_dt.isoformat(), 'end': end_dt.isoformat(),
+        'backgroundColor': STATUS_COLORS.get(appt.status, '#6c757d'),
+        'borderColor': STATUS_COLORS.get(appt.status, '#6c757d'),
+        'textColor': '#ffffff',
+        'extendedProps': {
+            'appointmentId': appt.id, 'clientName': client_name, 'serviceName': appt.service.name,
+            'serviceId': appt.service_id, 'staffId': appt.staff_id,
+            'staffName': staff_name, 'status': appt.status, 'statusDisplay': appt.get_status_display(),
+            'phone': getattr(appt.client, 'phone_number', ''), 'notes': appt.notes, 'type': 'appointment'
+        },
+        'classNames': ['appointment-event', f'status-{appt.status}']
+    }
+
+
+def _send(message):
+    channel_layer = get_channel_layer()
+    if channel_layer is None:
+        return
+    try:
+        async_to_sync(channel_layer.group_send)(CALENDAR_GROUP, dict(message, type='calendar.delta'))
+    except Exception:
+        # Un fallo del canal (p. ej. Redis caído) no debe romper el guardado de la cita
+        logger.warning("No se pudo publicar el cambio del calendario", exc_info=True)
+
+
+def broadcast_appointments(appointment_ids, action):
+    """Publica el estado actual de las citas indicadas (una sola consulta)."""
+    appointments = Appointment.objects.filter(
+        id__in=appointment_ids, appointment_date__isnull=False, appointment_time__isnull=False
+    ).select_related('client', 'service', 'staff')
+    for appt in appointments:
+        _send({'action': action, 'id': f'appointment-{appt.id}', 'event': appointment_event(appt)})
+
+
+def broadcast_appointment_deleted(appointment_id):
+    _send({'action': ACTION_DELETED, 'id': f'appointment-{appointment_id}', 'event': None})
@@ -0,0 +1,8 @@
+# appointments/routing.py
+from django.urls import path
+
+from .consumers import CalendarConsumer
+
+websocket_urlpatterns = [
+    path('ws/admin/calendar/', CalendarConsumer.as_asgi()),
+]
@@ -0,0 +1,55 @@
+from django.db.models.signals import post_save, post_delete
+from django.db import transaction
+from django.dispatch import receiver
+from services.models import Service
+from .models import Appointment, ScheduledWorkDay, WorkScheduleTemplate, Holiday
+from .cache import bump_calendar_version
+from .workdays import apply_holiday
+from .holds import adjust_reserved_counts
+from .realtime import (
+    broadcast_appointments, broadcast_appointment_deleted,
+    ACTION_CREATED, ACTION_UPDATED, ACTION_CANCELLED,
+)
+
+
+@receiver(post_save, sender=Appointment)
+@receiver(post_delete, sender=Appointment)
+@receiver(post_save, sender=ScheduledWorkDay)
+@receiver(post_delete, sender=ScheduledWorkDay)
+@receiver(post_save, sender=WorkScheduleTemplate)
+@receiver(post_delete, sender=WorkScheduleTemplate)
+@receiver(post_save, sender=Service)
+def invalidate_calendar_cache(sender, **kwargs):
+    """Cualquier cambio en la agenda invalida las respuestas cacheadas del calendario"""
+    bump_calendar_version()
+
+
+@receiver(post_save, sender=Holiday)
+def close_days_on_holiday(sender, instance, **kwargs):
+    """Un feriado nuevo o editado cierra los días ya generados que caen en él"""
+    apply_holiday(instance)
+
+
+@receiver(post_delete, sender=Appointment)
+def release_appointment_capacity(sender, instance, **kwargs):
+    """Una cita activa borrada libera su cupo del día"""
+    if instance.reserved_date:
+        adjust_reserved_counts({instance.reserved_date: -1})
+
+
+@receiver(post_save, sender=Appointment)
+def push_appointment_change(sender, instance, created, **kwargs):
+    """Publica la cita a los calendarios del admin abiertos, una vez confirmada la transacción"""
+    if created:
+        action = ACTION_CREATED
+    elif instance.status == 'cancelled':
+        action = ACTION_CANCELLED
+    else:
+        action = ACTION_UPDATED
+    transaction.on_commit(lambda: broadcast_appointments([instance.pk], action))
+
+
+@receiver(post_delete, sender=Appointment)
+def push_appointment_deleted(sender, instance, **kwargs):
+    appointment_id = instance.pk
+    transaction.on_commit(lambda: broadcast_appointment_deleted(appointment_id))
@@ -0,0 +1,144 @@
+# appointments/singleflight.py
+"""
+Coalescencia de llamadas idénticas en curso ("single-flight").
+
+Si varias peticiones piden lo mismo a la vez, solo una (la líder) ejecuta la
+función; las demás esperan y reciben el mismo resultado.
+
+- `SingleFlight` coordina los hilos de un mismo proceso.
+- `cache_single_flight` coordina procesos con un candado en la caché de
+  Django (cache.add es atómico). Entre procesos solo sirve con una caché
+  compartida (Redis); con la caché en memoria local equivale a un candado
+  por proceso.
+
+`AsyncSingleFlight` y `acache_single_flight` son los equivalentes para
+corrutinas (vistas async).
+
+La función debe devolver un valor (no lanzar) para que el resultado pueda
+compartirse tal cual, errores incluidos.
+"""
+import asyncio
+import threading
+import time
+
+from django.core.cache import cache
+
+LOCK_TIMEOUT = 20  # segundos; cubre los reintentos del cliente HTTP
+RESULT_TIMEOUT = 10  # segundos que el resultado queda para los que esperaban
+POLL_INTERVAL = 0.05
+
+
+class _Call:
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, fn):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.event.set()
+        return call.result
+
+
+def cache_single_flight(key, fn, wait_timeout=LOCK_TIMEOUT):
+    lock_key = f'singleflight:lock:{key}'
+    result_key = f'singleflight:result:{key}'
+
+    if not cache.add(lock_key, 1, LOCK_TIMEOUT):
+        # Otro proceso ya está haciendo la llamada: esperar su resultado
+        deadline = time.monotonic() + wait_timeout
+        while time.monotonic() < deadline:
+            result = cache.get(result_key)
+            if result is not None:
+                return result
+            if cache.get(lock_key) is None:
+                break
+            time.sleep(POLL_INTERVAL)
+        result = cache.get(result_key)
+        if result is not None:
+            return result
+        # El líder terminó sin dejar resultado (o tardó demasiado): hacerla aquí
+        return fn()
+
+    try:
+        result = fn()
+        cache.set(result_key, result, RESULT_TIMEOUT)
+        return result
+    finally:
+        cache.delete(lock_key)
+
+
+class AsyncSingleFlight:
+    """Como SingleFlight, para corrutinas de un mismo event loop."""
+
+    def __init__(self):
+        self._calls = {}
+
+    async def do(self, key, coro_fn):
+        loop = asyncio.get_running_loop()
+        call_key = (id(loop), key)
+        future = self._calls.get(call_key)
+        if future is not None:
+            return await asyncio.shield(future)
+        future = self._calls[call_key] = loop.create_future()
+        try:
+            result = await coro_fn()
+        except BaseException as e:
+            future.set_exception(e)
+            # Marcar la excepción como recuperada si nadie más esperaba
+            future.exception()
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            self._calls.pop(call_key, None)
+
+
+async def acache_single_flight(key, coro_fn, wait_timeout=LOCK_TIMEOUT):
+    lock_key = f'singleflight:lock:{key}'
+    result_key = f'singleflight:result:{key}'
+
+    if not await cache.aadd(lock_key, 1, LOCK_TIMEOUT):
+        deadline = time.monotonic() + wait_timeout
+        while time.monotonic() < deadline:
+            result = await cache.aget(result_key)
+            if result is not None:
+                return result
+            if await cache.aget(lock_key) is None:
+                break
+            await asyncio.sleep(POLL_INTERVAL)
+        result = await cache.aget(result_key)
+        if result is not None:
+            return result
+        return await coro_fn()
+
+    try:
+        result = await coro_fn()
+        await cache.aset(result_key, result, RESULT_TIMEOUT)
+        return result
+    finally:
+        await cache.adelete(lock_key)
@@ -1,3 +1,814 @@
-from django.test import TestCase
+import asyncio
+import datetime
+import threading
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.core import mail
+from django.core.cache import cache
+from django.core.handlers.asgi import ASGIHandler
+from django.core.mail.backends.locmem import EmailBackend
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from services.models import Service, ServiceCategory
+from . import cache as calendar_cache
+from . import provider_client
+from .fake_provider import start_fake_provider
+from .conflicts import find_conflicts, staff_conflicts
+from .availability import (
+    IntervalSet, get_availability, get_day_availability,
+    STATUS_AVAILABLE, STATUS_FULL, STATUS_NOT_SCHEDULED, STATUS_NOT_WORKING,
+)
+from .holds import (
+    HOLD_TTL, SlotUnavailable, adjust_reserved_counts, claim_capacity, place_hold,
+    recount_reserved, release_client_holds, sweep_expired_holds,
+)
+from .identity import alookup_dni, lookup_dni, lookup_ruc
+from .models import (
+    Appointment, Holiday, IdentityLookup, OutboundEmail, ScheduledWorkDay, SlotHold, WorkScheduleTemplate,
+)
+from .outbox import MAX_ATTEMPTS, deliver_outbox, enqueue_email, retry_delay
+from .utils import check_and_cancel_expired_appointments, expired_appointments_queryset
+from .workdays import apply_holiday, holidays_between, materialize_workdays
+
+
+def make_service(name='Decoración', duration=60):
+    category = ServiceCategory.objects.get_or_create(name='Eventos')[0]
+    return Service.objects.create(
+        category=category, name=name, description='-', base_price=100, duration=duration,
+    )
+
+
+class IntervalSetTests(SimpleTestCase):
+    """Intervalos ocupados del día: fusión, cruces y huecos libres."""
+
+    def test_overlapping_and_touching_intervals_merge(self):
+        busy = IntervalSet([(60, 120), (100, 180), (180, 200), (300, 360)])
+        self.assertEqual(list(busy), [(60, 200), (300, 360)])
+
+    def test_empty_interval_is_ignored(self):
+        busy = IntervalSet([(60, 60), (90, 30)])
+        self.assertEqual(len(busy), 0)
+
+    def test_overlaps_is_half_open(self):
+        busy = IntervalSet([(60, 120)])
+        self.assertTrue(busy.overlaps(90, 150))
+        self.assertFalse(busy.overlaps(120, 180))
+        self.assertFalse(busy.overlaps(0, 60))
+
+    def test_gaps_inside_range(self):
+        busy = IntervalSet([(540, 600), (660, 720)])
+        self.assertEqual(busy.gaps(480, 780), [(480, 540), (600, 660), (720, 780)])
+        self.assertEqual(busy.gaps(540, 600), [])
+
+
+class AvailabilityTests(TestCase):
+    """Slots del día según el horario programado y las citas activas."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.day = datetime.date(2030, 1, 7)
+        cls.service = make_service(duration=60)
+        cls.client_user = get_user_model().objects.create_user(username='cliente', password='x')
+        ScheduledWorkDay.objects.create(
+            date=cls.day, start_time=datetime.time(9), end_time=datetime.time(13), is_working=True,
+        )
+        ScheduledWorkDay.objects.create(date=cls.day + datetime.timedelta(days=1), is_working=False)
+
+    def book(self, hour, status='pending'):
+        return Appointment.objects.create(
+            client=self.client_user, service=self.service, status=status,
+            appointment_date=self.day, appointment_time=datetime.time(hour),
+        )
+
+    def test_free_day_has_hourly_slots(self):
+        day = get_day_availability(self.day, service=self.service)
+        self.assertEqual(day.status, STATUS_AVAILABLE)
+        self.assertEqual([slot.hour for slot in day.slots], [9, 10, 11, 12])
+
+    def test_active_appointments_remove_slots(self):
+        self.book(10)
+        self.book(11, status='cancelled')
+        day = get_day_availability(self.day, service=self.service)
+        self.assertEqual([slot.hour for slot in day.slots], [9, 11, 12])
+        self.assertFalse(day.fits(datetime.time(10, 30), 60))
+        self.assertTrue(day.fits(datetime.time(11), 60))
+
+    def test_full_day(self):
+        for hour in (9, 10, 11, 12):
+            self.book(hour)
+        self.assertEqual(get_day_availability(self.day, service=self.service).status, STATUS_FULL)
+
+    def test_range_statuses(self):
+        result = get_availability(self.day, self.day + datetime.timedelta(days=2), service=self.service)
+        self.assertEqual(
+            [result[date].status for date in sorted(result)],
+            [STATUS_AVAILABLE, STATUS_NOT_WORKING, STATUS_NOT_SCHEDULED],
+        )
+
+    def test_excluded_appointment_frees_its_slot(self):
+        appointment = self.book(10)
+        day = get_day_availability(self.day, service=self.service, exclude_appointment=appointment)
+        self.assertIn(datetime.time(10), day.slots)
+
+
+class WorkdayScheduleApiTests(TestCase):
+    """El cupo del día enviado desde el calendario se valida antes de guardarse."""
+
+    def setUp(self):
+        admin = get_user_model().objects.create_superuser('admin', 'admin@example.com', 'x')
+        self.client.force_login(admin)
+
+    def post(self, max_appointments):
+        return self.client.post(
+            reverse('admin_workday_schedule_api'),
+            data={'date': '2030-01-07', 'start_time': '09:00', 'end_time': '13:00', 'max_appointments': max_appointments},
+            content_type='application/json',
+        )
+
+    def test_invalid_capacity_is_rejected(self):
+        for value in (-1, 'abc', 2.5, True):
+            self.assertEqual(self.post(value).status_code, 400, value)
+        self.assertFalse(ScheduledWorkDay.objects.exists())
+
+    def test_capacity_is_coerced(self):
+        self.assertEqual(self.post('4').status_code, 200)
+        self.assertEqual(ScheduledWorkDay.objects.get().max_appointments, 4)
+        self.assertEqual(self.post('').status_code, 200)
+        self.assertIsNone(ScheduledWorkDay.objects.get().max_appointments)
+
+
+class CalendarVersionTests(TestCase):
+    """Sin cache compartida, la versión del calendario vive en la BD y la ven todos los procesos."""
+
+    def test_version_survives_a_cold_local_cache(self):
+        self.assertTrue(calendar_cache.version_in_db())
+        before = calendar_cache.get_calendar_version()
+        ScheduledWorkDay.objects.create(date=datetime.date(2030, 1, 7), is_working=True)
+        after = calendar_cache.get_calendar_version()
+        self.assertGreater(after, before)
+        # Otro proceso arranca con su cache en memoria vacía: ve la misma versión
+        calendar_cache.cache.clear()
+        self.assertEqual(calendar_cache.get_calendar_version(), after)
+
+
+class CalendarEventsApiTests(TestCase):
+    """El calendario responde 304 mientras la agenda no cambie."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.day = datetime.date(2030, 1, 7)
+        cls.admin = get_user_model().objects.create_superuser('admin', 'admin@example.com', 'x')
+        cls.appointment = Appointment.objects.create(
+            client=cls.admin, service=make_service(), appointment_date=cls.day, appointment_time=datetime.time(10),
+        )
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+
+    def get(self, **headers):
+        return self.client.get(
+            reverse('admin_calendar_events_api'), {'start': '2030-01-06', 'end': '2030-01-13'}, headers=headers,
+        )
+
+    def test_unchanged_calendar_is_not_modified(self):
+        response = self.get()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()), 1)
+        etag = response['ETag']
+        response = self.get(**{'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+        # Otro rango es otra respuesta
+        other = self.client.get(
+            reverse('admin_calendar_events_api'), {'start': '2030-02-01', 'end': '2030-02-07'},
+            headers={'If-None-Match': etag},
+        )
+        self.assertEqual(other.status_code, 200)
+
+    def test_saving_an_appointment_changes_the_etag(self):
+        etag = self.get()['ETag']
+        self.appointment.status = 'confirmed'
+        self.appointment.save()
+        response = self.get(**{'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(response.json()[0]['extendedProps']['status'], 'confirmed')
+
+
+class ExpiredAppointmentsTests(TestCase):
+    """Cancelación en bloque de pendientes a menos de 24h, con nota de auditoría y aviso."""
+
+    now = datetime.datetime(2030, 1, 6, 10, 0)
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.service = make_service()
+        cls.client_user = get_user_model().objects.create_user(
+            username='cliente', email='cliente@example.com', password='x',
+        )
+
+    def book(self, date, time, status='pending', notes=''):
+        return Appointment.objects.create(
+            client=self.client_user, service=self.service, status=status, notes=notes,
+            appointment_date=date, appointment_time=time,
+        )
+
+    def test_boundary_is_24_hours_ahead(self):
+        day = datetime.date(2030, 1, 7)
+        inside = self.book(day, datetime.time(9, 59))
+        past = self.book(datetime.date(2030, 1, 5), datetime.time(18))
+        without_time = self.book(datetime.date(2030, 1, 6), None)
+        self.book(day, datetime.time(10))
+        self.book(day, None)
+        self.book(datetime.date(2030, 1, 8), datetime.time(9))
+        self.book(datetime.date(2030, 1, 5), datetime.time(9), status='confirmed')
+        self.assertEqual(
+            set(expired_appointments_queryset(self.now).values_list('pk', flat=True)),
+            {inside.pk, past.pk, without_time.pk},
+        )
+
+    def cancel(self, **kwargs):
+        with mock.patch('appointments.utils.timezone.now', return_value=self.now):
+            return check_and_cancel_expired_appointments(**kwargs)
+
+    def test_cancellation_appends_the_note_and_queues_emails(self):
+        with_notes = self.book(datetime.date(2030, 1, 6), datetime.time(15), notes='Traer globos')
+        without_notes = self.book(datetime.date(2030, 1, 6), datetime.time(16))
+        kept = self.book(datetime.date(2030, 1, 9), datetime.time(9))
+
+        self.assertEqual(self.cancel(dry_run=True), 2)
+        self.assertFalse(OutboundEmail.objects.exists())
+        self.assertEqual(self.cancel(), 2)
+
+        note = '\n[AUTO] Cancelada el 06/01 10:00 (regla 24h).'
+        with_notes.refresh_from_db()
+        without_notes.refresh_from_db()
+        kept.refresh_from_db()
+        self.assertEqual((with_notes.status, with_notes.notes), ('cancelled', 'Traer globos' + note))
+        self.assertEqual((without_notes.status, without_notes.notes), ('cancelled', note))
+        self.assertEqual((kept.status, kept.notes), ('pending', ''))
+        self.assertEqual(
+            sorted(OutboundEmail.objects.values_list('subject', flat=True)),
+            sorted(f'Cita Cancelada #{pk} - Decoraciones Mori' for pk in (with_notes.pk, without_notes.pk)),
+        )
+        self.assertEqual(OutboundEmail.objects.first().recipients, ['cliente@example.com'])
+        # Ya canceladas: una segunda pasada no las toca ni vuelve a avisar
+        self.assertEqual(self.cancel(), 0)
+        self.assertEqual(OutboundEmail.objects.count(), 2)
+
+    def test_no_notify_skips_the_emails(self):
+        self.book(datetime.date(2030, 1, 6), datetime.time(15))
+        self.assertEqual(self.cancel(notify=False), 1)
+        self.assertFalse(OutboundEmail.objects.exists())
+
+
+class AppointmentStatsApiTests(TestCase):
+    """Series de citas por periodo: una consulta agrupada y periodos vacíos en cero."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = get_user_model().objects.create_superuser('admin', 'admin@example.com', 'x')
+        service = make_service()
+        for created, status in (
+            (datetime.datetime(2025, 1, 20, 9), 'confirmed'),
+            (datetime.datetime(2025, 3, 1, 9), 'confirmed'),
+            (datetime.datetime(2025, 3, 3, 9), 'pending'),
+            (datetime.datetime(2025, 3, 3, 18), 'pending'),
+            (datetime.datetime(2025, 3, 3, 19), 'cancelled'),
+        ):
+            appointment = Appointment.objects.create(client=cls.admin, service=service, status=status)
+            Appointment.objects.filter(pk=appointment.pk).update(created_at=created)
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+
+    def get(self, **params):
+        return self.client.get(reverse('admin:appointments_appointment_stats_api'), params)
+
+    def test_daily_buckets_are_zero_filled(self):
+        data = self.get(start='2025-03-01', end='2025-03-04').json()
+        self.assertEqual(data['granularity'], 'day')
+        self.assertEqual(data['dates'], ['2025-03-01', '2025-03-02', '2025-03-03', '2025-03-04'])
+        self.assertEqual(data['confirmed'], [1, 0, 0, 0])
+        self.assertEqual(data['pending'], [0, 0, 2, 0])
+        self.assertEqual(data['completed'], [0, 0, 0, 0])
+
+    def test_monthly_buckets_include_empty_months(self):
+        data = self.get(start='2025-01-15', end='2025-04-10', granularity='month').json()
+        self.assertEqual(data['dates'], ['2025-01-01', '2025-02-01', '2025-03-01', '2025-04-01'])
+        self.assertEqual(data['confirmed'], [1, 0, 1, 0])
+        self.assertEqual(data['pending'], [0, 0, 2, 0])
+
+    def test_weekly_buckets_start_on_monday(self):
+        data = self.get(start='2025-02-26', end='2025-03-04', granularity='week').json()
+        self.assertEqual(data['dates'], ['2025-02-24', '2025-03-03'])
+        self.assertEqual(data['confirmed'], [1, 0])
+        self.assertEqual(data['pending'], [0, 2])
+
+    def test_invalid_parameters(self):
+        self.assertEqual(self.get(granularity='year').status_code, 400)
+        self.assertEqual(self.get(start='2025-03-05', end='2025-03-01').status_code, 400)
+        self.assertEqual(self.get(start='05/03/2025').status_code, 400)
+
+
+class StaffConflictTests(TestCase):
+    """Cruces de horario del personal: [inicio, fin) con citas pegadas permitidas."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.day = datetime.date(2030, 1, 7)
+        cls.service = make_service(duration=60)
+        cls.admin = get_user_model().objects.create_superuser('admin', 'admin@example.com', 'x')
+        cls.staff = get_user_model().objects.create_user(username='decorador', password='x', is_staff=True)
+        cls.other_staff = get_user_model().objects.create_user(username='ayudante', password='x', is_staff=True)
+        cls.first = cls.book(10)
+        cls.second = cls.book(11)  # Empieza justo cuando termina la primera
+        cls.book(10, status='cancelled')
+        cls.book(10, staff=cls.other_staff)
+
+    @classmethod
+    def book(cls, hour, minute=0, status='pending', staff=None):
+        return Appointment.objects.create(
+            client=cls.admin, service=cls.service, staff=staff or cls.staff, status=status,
+            appointment_date=cls.day, appointment_time=datetime.time(hour, minute),
+        )
+
+    def candidate(self, hour, minute=0):
+        return Appointment(
+            client=self.admin, service=self.service, staff=self.staff,
+            appointment_date=self.day, appointment_time=datetime.time(hour, minute),
+        )
+
+    def test_back_to_back_slots_do_not_conflict(self):
+        self.assertEqual(staff_conflicts(self.first), [])
+        self.assertEqual(staff_conflicts(self.second), [])
+        self.assertEqual(staff_conflicts(self.candidate(9)), [])
+        self.assertEqual(find_conflicts(self.day, self.day), [])
+
+    def test_overlap_is_reported(self):
+        self.assertEqual(staff_conflicts(self.candidate(10, 30)), [self.first, self.second])
+        self.assertEqual(staff_conflicts(self.candidate(9, 30)), [self.first])
+        self.book(10, 30)
+        pairs = [[row['id'] for row in conflict['appointments']] for conflict in find_conflicts(self.day, self.day)]
+        third = Appointment.objects.get(appointment_time=datetime.time(10, 30)).pk
+        self.assertEqual(pairs, [[self.first.pk, third], [third, self.second.pk]])
+        self.assertEqual(find_conflicts(self.day, self.day, staff=self.other_staff), [])
+
+    def update(self, appointment, start):
+        self.client.force_login(self.admin)
+        return self.client.post(
+            reverse('admin_update_appointment_api'),
+            data={'id': f'appointment-{appointment.pk}', 'start': start}, content_type='application/json',
+        )
+
+    def test_update_api_rejects_an_overlap(self):
+        response = self.update(self.second, '2030-01-07T10:15:00')
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual([conflict['id'] for conflict in response.json()['conflicts']], [self.first.pk])
+        self.second.refresh_from_db()
+        self.assertEqual(self.second.appointment_time, datetime.time(11))
+
+    def test_update_api_accepts_a_touching_slot(self):
+        response = self.update(self.second, '2030-01-07T09:00:00')
+        self.assertEqual(response.status_code, 200)
+        self.second.refresh_from_db()
+        self.assertEqual((self.second.appointment_time, self.second.end_time), (datetime.time(9), datetime.time(10)))
+
+    def test_admin_action_sends_one_summary(self):
+        self.book(10, 30)
+        self.client.force_login(self.admin)
+        response = self.client.post(reverse('admin:appointments_appointment_changelist'), {
+            'action': 'action_find_staff_conflicts', '_selected_action': [self.first.pk],
+        }, follow=True)
+        messages = [str(message) for message in response.context['messages']]
+        self.assertEqual(len(messages), 1)
+        self.assertIn('Se encontraron 2 cruce(s)', messages[0])
+
+
+class MaterializeWorkdaysTests(TestCase):
+    """Días programados generados desde la plantilla semanal y los feriados."""
+
+    start, end = datetime.date(2030, 1, 7), datetime.date(2030, 1, 13)  # de lunes a domingo
+
+    @classmethod
+    def setUpTestData(cls):
+        for weekday in range(5):
+            WorkScheduleTemplate.objects.create(
+                day_of_week=weekday, start_time=datetime.time(9), end_time=datetime.time(17),
+            )
+        WorkScheduleTemplate.objects.create(day_of_week=5, is_working_day=False)
+        # Sin plantilla para el domingo
+        Holiday.objects.create(date=datetime.date(2030, 1, 9), name='Aniversario')
+        Holiday.objects.create(date=datetime.date(2000, 1, 10), name='Feriado anual', is_recurring=True)
+
+    def days(self):
+        return {day.date: day for day in ScheduledWorkDay.objects.all()}
+
+    def test_template_and_holidays(self):
+        self.assertEqual(materialize_workdays(self.start, self.end), 6)
+        days = self.days()
+        self.assertNotIn(datetime.date(2030, 1, 13), days)
+        monday = days[self.start]
+        self.assertEqual((monday.is_working, monday.start_time, monday.end_time),
+                         (True, datetime.time(9), datetime.time(17)))
+        self.assertEqual((days[datetime.date(2030, 1, 9)].is_working, days[datetime.date(2030, 1, 9)].notes),
+                         (False, 'Aniversario'))
+        self.assertEqual(days[datetime.date(2030, 1, 10)].notes, 'Feriado anual')
+        self.assertFalse(days[datetime.date(2030, 1, 12)].is_working)
+
+    def test_rerun_is_idempotent_and_keeps_edits(self):
+        ScheduledWorkDay.objects.create(date=self.start, start_time=datetime.time(12), end_time=datetime.time(14))
+        self.assertEqual(materialize_workdays(self.start, self.end), 5)
+        self.assertEqual(materialize_workdays(self.start, self.end), 0)
+        self.assertEqual(ScheduledWorkDay.objects.count(), 6)
+        self.assertEqual(self.days()[self.start].start_time, datetime.time(12))
+
+    def test_day_created_concurrently_is_skipped(self):
+        from . import workdays
+
+        def holidays_and_race(start_date, end_date):
+            # Otro proceso crea el martes entre la lectura y el bulk_create
+            ScheduledWorkDay.objects.create(date=datetime.date(2030, 1, 8), notes='En paralelo')
+            return holidays_between(start_date, end_date)
+
+        with mock.patch.object(workdays, 'holidays_between', side_effect=holidays_and_race):
+            materialize_workdays(self.start, self.end)
+        self.assertEqual(ScheduledWorkDay.objects.count(), 6)
+        self.assertEqual(self.days()[datetime.date(2030, 1, 8)].notes, 'En paralelo')
+
+    def test_new_holiday_closes_generated_days(self):
+        materialize_workdays(self.start, datetime.date(2031, 1, 31))
+        Holiday.objects.create(date=datetime.date(2030, 1, 8), name='Cierre')
+        Holiday.objects.create(date=datetime.date(2000, 1, 14), name='Todos los años', is_recurring=True)
+        days = self.days()
+        self.assertEqual((days[datetime.date(2030, 1, 8)].is_working, days[datetime.date(2030, 1, 8)].notes),
+                         (False, 'Cierre'))
+        self.assertEqual(days[datetime.date(2030, 1, 8)].start_time, None)
+        for year in (2030, 2031):
+            self.assertFalse(days[datetime.date(year, 1, 14)].is_working)
+        self.assertTrue(days[datetime.date(2030, 1, 15)].is_working)
+        # Los días ya pasados no se reescriben
+        past = ScheduledWorkDay.objects.create(date=datetime.date(2020, 1, 14), is_working=True)
+        self.assertEqual(apply_holiday(Holiday(date=datetime.date(2000, 1, 14), name='x', is_recurring=True)), 0)
+        past.refresh_from_db()
+        self.assertTrue(past.is_working)
+
+
+class HoldTests(TestCase):
+    """Cupo diario: reservas temporales y el contador reserved_count."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.day = datetime.date(2030, 1, 7)
+        cls.other_day = cls.day + datetime.timedelta(days=1)
+        cls.service = make_service()
+        User = get_user_model()
+        cls.ana = User.objects.create_user(username='ana', password='x')
+        cls.beto = User.objects.create_user(username='beto', password='x')
+        for date in (cls.day, cls.other_day):
+            ScheduledWorkDay.objects.create(
+                date=date, start_time=datetime.time(9), end_time=datetime.time(13), max_appointments=1,
+            )
+
+    def reserved(self, date=None):
+        return ScheduledWorkDay.objects.get(date=date or self.day).reserved_count
+
+    def expire(self, hold):
+        SlotHold.objects.filter(pk=hold.pk).update(expires_at=timezone.now() - datetime.timedelta(minutes=1))
+
+    def test_counter_never_goes_below_zero(self):
+        adjust_reserved_counts({self.day: -1})
+        self.assertEqual(self.reserved(), 0)
+        adjust_reserved_counts({self.day: 2, self.other_day: 1})
+        adjust_reserved_counts({self.day: -5})
+        self.assertEqual((self.reserved(), self.reserved(self.other_day)), (0, 1))
+
+    def test_hold_takes_the_last_slot(self):
+        place_hold(self.ana, self.day)
+        self.assertEqual(self.reserved(), 1)
+        with self.assertRaises(SlotUnavailable):
+            place_hold(self.beto, self.day)
+
+    def test_renewing_a_hold_does_not_count_twice(self):
+        first = place_hold(self.ana, self.day)
+        second = place_hold(self.ana, self.day)
+        self.assertEqual(first.pk, second.pk)
+        self.assertGreater(second.expires_at, timezone.now() + HOLD_TTL - datetime.timedelta(minutes=1))
+        self.assertEqual(self.reserved(), 1)
+
+    def test_hold_on_another_day_releases_the_previous_one(self):
+        place_hold(self.ana, self.day)
+        place_hold(self.ana, self.other_day)
+        self.assertEqual((self.reserved(), self.reserved(self.other_day)), (0, 1))
+        self.assertEqual(SlotHold.objects.get(client=self.ana).date, self.other_day)
+
+    def test_expired_hold_frees_its_slot_once(self):
+        self.expire(place_hold(self.ana, self.day))
+        # El cliente pide otro día: la vencida no se toca aquí...
+        release_client_holds(self.ana)
+        self.assertEqual(self.reserved(), 1)
+        # ...la libera el barrido, una sola vez
+        self.assertEqual(sweep_expired_holds(), 1)
+        self.assertEqual(sweep_expired_holds(), 0)
+        self.assertEqual(self.reserved(), 0)
+
+    def test_expired_hold_is_reused_by_another_client(self):
+        self.expire(place_hold(self.ana, self.day))
+        place_hold(self.beto, self.day)
+        self.assertEqual(self.reserved(), 1)
+        self.assertEqual(SlotHold.objects.get().client, self.beto)
+
+    def test_claim_consumes_the_hold(self):
+        hold = place_hold(self.ana, self.day)
+        with transaction.atomic():
+            claim_capacity(self.ana, self.day, hold_token=hold.token)
+            appointment = Appointment.objects.create(
+                client=self.ana, service=self.service,
+                appointment_date=self.day, appointment_time=datetime.time(10),
+            )
+        self.assertFalse(SlotHold.objects.exists())
+        self.assertEqual(self.reserved(), 1)
+        appointment.status = 'cancelled'
+        appointment.save()
+        self.assertEqual(self.reserved(), 0)
+
+    def test_claim_without_hold_checks_capacity(self):
+        place_hold(self.beto, self.day)
+        with self.assertRaises(SlotUnavailable):
+            with transaction.atomic():
+                claim_capacity(self.ana, self.day)
+
+    def test_recount_fixes_drift(self):
+        place_hold(self.ana, self.day)
+        ScheduledWorkDay.objects.filter(date=self.day).update(reserved_count=7)
+        self.assertEqual(recount_reserved(self.day, self.other_day), 1)
+        self.assertEqual(self.reserved(), 1)
+
+
+class RejectingBackend(EmailBackend):
+    """Sustituto del SMTP que rechaza todo, para probar los reintentos."""
+
+    def send_messages(self, messages):
+        raise ConnectionError('SMTP caído')
+
+
+class UnreachableBackend(EmailBackend):
+    """Sustituto del SMTP que ni siquiera acepta la conexión."""
+
+    def open(self):
+        raise ConnectionRefusedError('Servidor SMTP no disponible')
+
+
+@override_settings(EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend')
+class OutboxTests(TestCase):
+    """Cola de correos: encolar, enviar por lotes, reintentar y descartar."""
+
+    def test_enqueue_skips_empty_recipients(self):
+        self.assertIsNone(enqueue_email('Asunto', 'Cuerpo', ['', None]))
+        email = enqueue_email('Asunto', 'Cuerpo', ['', 'cliente@example.com'], html_body='<p>Cuerpo</p>')
+        self.assertEqual(email.recipients, ['cliente@example.com'])
+        self.assertEqual(email.status, OutboundEmail.STATUS_PENDING)
+        self.assertEqual(len(mail.outbox), 0)
+
+    def test_delivery_marks_sent(self):
+        email = enqueue_email('Asunto', 'Cuerpo', ['cliente@example.com'], html_body='<p>Cuerpo</p>')
+        self.assertEqual(deliver_outbox(), (1, 0))
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].alternatives, [('<p>Cuerpo</p>', 'text/html')])
+        email.refresh_from_db()
+        self.assertEqual(email.status, OutboundEmail.STATUS_SENT)
+        self.assertEqual(email.attempts, 1)
+        self.assertIsNotNone(email.sent_at)
+        # Ya enviado: el siguiente lote no lo vuelve a mandar
+        self.assertEqual(deliver_outbox(), (0, 0))
+
+    def test_failure_is_retried_with_backoff(self):
+        email = enqueue_email('Asunto', 'Cuerpo', ['cliente@example.com'])
+        before = timezone.now()
+        self.assertEqual(deliver_outbox(connection=RejectingBackend()), (0, 1))
+        email.refresh_from_db()
+        self.assertEqual(email.status, OutboundEmail.STATUS_PENDING)
+        self.assertEqual(email.attempts, 1)
+        self.assertIn('SMTP caído', email.last_error)
+        self.assertGreaterEqual(email.next_attempt_at, before + retry_delay(1))
+        # Hasta que venza la espera no se vuelve a intentar
+        self.assertEqual(deliver_outbox(), (0, 0))
+        self.assertGreater(retry_delay(3), retry_delay(2))
+
+    def test_last_attempt_marks_dead(self):
+        email = enqueue_email('Asunto', 'Cuerpo', ['cliente@example.com'])
+        OutboundEmail.objects.filter(pk=email.pk).update(attempts=MAX_ATTEMPTS - 1)
+        deliver_outbox(connection=RejectingBackend())
+        email.refresh_from_db()
+        self.assertEqual(email.status, OutboundEmail.STATUS_DEAD)
+        self.assertEqual(email.attempts, MAX_ATTEMPTS)
+
+    def test_connection_failure_counts_for_the_whole_batch(self):
+        first = enqueue_email('Asunto 1', 'Cuerpo', ['cliente@example.com'])
+        second = enqueue_email('Asunto 2', 'Cuerpo', ['cliente@example.com'])
+        OutboundEmail.objects.filter(pk=second.pk).update(attempts=MAX_ATTEMPTS - 1)
+        before = timezone.now()
+        self.assertEqual(deliver_outbox(connection=UnreachableBackend()), (0, 2))
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.assertEqual((first.status, first.attempts), (OutboundEmail.STATUS_PENDING, 1))
+        self.assertIn('Servidor SMTP no disponible', first.last_error)
+        self.assertGreaterEqual(first.next_attempt_at, before + retry_delay(1))
+        self.assertEqual((second.status, second.attempts), (OutboundEmail.STATUS_DEAD, MAX_ATTEMPTS))
+
+    def test_worker_survives_errors(self):
+        command = 'appointments.management.commands.send_queued_emails'
+        err = StringIO()
+        with mock.patch(f'{command}.deliver_outbox', side_effect=[RuntimeError('BD caída'), (1, 0)]) as deliver, \
+                mock.patch(f'{command}.time.sleep', side_effect=[None, KeyboardInterrupt]), \
+                self.assertLogs(command, 'ERROR'):
+            with self.assertRaises(KeyboardInterrupt):
+                call_command('send_queued_emails', loop=True, stdout=StringIO(), stderr=err)
+        self.assertEqual(deliver.call_count, 2)
+        self.assertIn('Error procesando la cola de correos', err.getvalue())
+
+    def test_command_drains_queue(self):
+        for n in range(3):
+            enqueue_email(f'Asunto {n}', 'Cuerpo', ['cliente@example.com'])
+        out = StringIO()
+        call_command('send_queued_emails', batch_size=2, stdout=out)
+        self.assertEqual(len(mail.outbox), 3)
+        self.assertIn('Correos enviados: 3', out.getvalue())
+
+
+class FakeProviderMixin:
+    """Apunta las APIs de identidad al proveedor falso local (fake_provider.py)."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.provider = start_fake_provider()
+        cls.addClassCleanup(cls.provider.server_close)
+        cls.addClassCleanup(cls.provider.shutdown)
+        override = override_settings(APIPERU_BASE_URL=cls.provider.base_url, DECOLECTA_BASE_URL=cls.provider.base_url)
+        override.enable()
+        cls.addClassCleanup(override.disable)
+
+    def setUp(self):
+        cache.clear()
+        self.provider.hits = 0
+        self.provider.error_rate = 0.0
+        self.provider.latency = 0.0
+
+
+class FakeProviderTestCase(FakeProviderMixin, TestCase):
+    pass
+
+
+class IdentityLookupTests(FakeProviderTestCase):
+    """Las búsquedas anónimas de DNI/RUC solo sirven datos del proveedor."""
+
+    def test_registered_users_are_not_exposed(self):
+        get_user_model().objects.create_user(
+            username='ana', password='x', first_name='Ana', last_name='Pérez Soto',
+            dni='12345678', ruc='20123456781', address='Calle Privada 1',
+        )
+        payload, status = lookup_dni('12345678')
+        self.assertEqual(status, 200)
+        self.assertEqual(payload['nombres'], 'NOMBRE 678')
+        response = self.client.post(reverse('appointments:buscar_ruc'), {'ruc': '20123456781'})
+        self.assertEqual(response.json()['razon_social'], 'EMPRESA 6781 S.A.C.')
+        self.assertNotIn('Calle Privada', response.content.decode())
+
+    def test_answers_are_stored_and_reused(self):
+        self.assertEqual(lookup_dni('12345670')[1], 404)
+        self.assertEqual(lookup_ruc('20123456781')[1], 200)
+        self.assertEqual(IdentityLookup.objects.count(), 2)
+        cache.clear()
+        self.assertEqual(lookup_dni('12345670')[1], 404)
+        self.assertEqual(lookup_ruc('20123456781')[1], 200)
+        self.assertEqual(self.provider.hits, 2)
+
+    def test_invalid_number_skips_the_provider(self):
+        self.assertEqual(lookup_dni('123')[1], 400)
+        self.assertEqual(self.provider.hits, 0)
+
+
+class CoalescedLookupTests(FakeProviderMixin, TransactionTestCase):
+    """Búsquedas idénticas simultáneas hacen una sola llamada al proveedor."""
+
+    CONCURRENCY = 8
+
+    def test_concurrent_threads_share_one_call(self):
+        self.provider.latency = 0.3
+        barrier = threading.Barrier(self.CONCURRENCY)
+        results = []
+
+        def worker():
+            try:
+                barrier.wait()
+                results.append(lookup_dni('12345678'))
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=worker) for _ in range(self.CONCURRENCY)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(self.provider.hits, 1)
+        self.assertEqual(len(results), self.CONCURRENCY)
+        self.assertTrue(all(result == results[0] and result[1] == 200 for result in results))
+        # Otro documento es otra llamada
+        self.assertEqual(lookup_dni('12345679')[1], 200)
+        self.assertEqual(self.provider.hits, 2)
+
+    async def test_concurrent_coroutines_share_one_call(self):
+        self.provider.latency = 0.3
+        try:
+            results = await asyncio.gather(*(alookup_dni('12345678') for _ in range(self.CONCURRENCY)))
+        finally:
+            await provider_client.get_async_session().close()
+        self.assertEqual(self.provider.hits, 1)
+        self.assertEqual({status for _payload, status in results}, {200})
+        self.assertEqual(await IdentityLookup.objects.acount(), 1)
+
+
+class AsyncIdentityEndpointTests(FakeProviderTestCase):
+    """Las vistas async de DNI/RUC pasan por toda la pila de middleware sin adaptarla a síncrona."""
+
+    @override_settings(DEBUG=True)
+    def test_middleware_stack_stays_async(self):
+        # Django avisa en django.request cada vez que adapta la pila a síncrona
+        with self.assertNoLogs('django.request', 'DEBUG'):
+            ASGIHandler()
+
+    async def test_lookup_through_the_endpoint(self):
+        try:
+            response = await self.async_client.post(reverse('appointments:buscar_dni_async'), {'dni': '12345678'})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.json()['nombres'], 'NOMBRE 678')
+            response = await self.async_client.post(reverse('appointments:buscar_ruc_async'), {'ruc': '20123456780'})
+            self.assertEqual(response.status_code, 404)
+        finally:
+            await provider_client.get_async_session().close()
+
+
+class ProviderClientTests(FakeProviderTestCase):
+    """Reintentos con jitter, circuit breaker y sesión HTTP por hilo."""
+
+    def url(self, dni='12345678'):
+        return f'{self.provider.base_url}/api/dni/{dni}'
+
+    def test_transient_errors_are_retried_with_jitter(self):
+        self.provider.error_rate = 1.0
+        with mock.patch.object(provider_client.time, 'sleep') as sleep:
+            response = provider_client.get('pruebas', self.url())
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(self.provider.hits, provider_client.MAX_RETRIES + 1)
+        delays = [call.args[0] for call in sleep.call_args_list]
+        self.assertEqual(len(delays), provider_client.MAX_RETRIES)
+        for attempt, delay in enumerate(delays):
+            self.assertTrue(0 <= delay <= provider_client.RETRY_BACKOFF * 2 ** attempt)
+
+    def test_definitive_answer_is_not_retried(self):
+        response = provider_client.get('pruebas', self.url('12345670'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.provider.hits, 1)
+
+    def test_breaker_opens_and_closes(self):
+        breaker = provider_client.CircuitBreaker('pruebas')
+        self.provider.error_rate = 1.0
+        with mock.patch.object(provider_client.time, 'sleep'):
+            for _ in range(provider_client.BREAKER_THRESHOLD):
+                provider_client.get('pruebas', self.url())
+        self.assertTrue(breaker.is_open())
+        hits = self.provider.hits
+        with self.assertRaises(provider_client.CircuitOpen):
+            provider_client.get('pruebas', self.url())
+        self.assertEqual(self.provider.hits, hits)
+
+        # Pasa el enfriamiento (vence la clave) y el proveedor ya responde
+        cache.delete(breaker.open_key)
+        self.provider.error_rate = 0.0
+        self.assertEqual(provider_client.get('pruebas', self.url()).status_code, 200)
+        self.assertFalse(breaker.is_open())
+        self.assertIsNone(cache.get(breaker.failures_key))
+
+    def test_half_open_breaker_reopens_on_one_failure(self):
+        breaker = provider_client.CircuitBreaker('pruebas')
+        for _ in range(provider_client.BREAKER_THRESHOLD):
+            breaker.record_failure()
+        cache.delete(breaker.open_key)
+        breaker.record_failure()
+        self.assertTrue(breaker.is_open())
+
+    def test_session_is_per_thread(self):
+        session = provider_client.get_session()
+        self.assertIs(provider_client.get_session(), session)
+        other = []
+        thread = threading.Thread(target=lambda: other.append(provider_client.get_session()))
+        thread.start()
+        thread.join()
+        self.assertIsNot(other[0], session)
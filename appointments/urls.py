@@ -7,9 +7,12 @@ from .views import (
     # AppointmentCalendarView, # Comentado hasta que se redefina
     buscar_cliente_por_dni,
     buscar_empresa_por_ruc,
+    buscar_cliente_por_dni_async,
+    buscar_empresa_por_ruc_async,
     appointment_detail,
     get_availabilities,
     get_daily_availability_status,
+    hold_slot,
 )
 from .views import cancel_appointment_view # Importa la vista de cancelación
 from django.utils.translation import gettext_lazy as _
@@ -28,9 +31,12 @@ urlpatterns = [
     # --- Detalles y Acciones Específicas ---
     path('<int:appointment_id>/', appointment_detail, name='appointment_detail'),
     path('api/daily-availability/', get_daily_availability_status, name='api_daily_availability'),
+    path('api/hold-slot/', hold_slot, name='hold_slot'),
     # --- Endpoints Auxiliares / API ---
     path('buscar-dni/', buscar_cliente_por_dni, name='buscar_dni'),
     path('api/buscar-ruc/', buscar_empresa_por_ruc, name='buscar_ruc'),
+    path('api/async/buscar-dni/', buscar_cliente_por_dni_async, name='buscar_dni_async'),
+    path('api/async/buscar-ruc/', buscar_empresa_por_ruc_async, name='buscar_ruc_async'),
     path('api/disponibilidades/', get_availabilities, name='get_availabilities'), # API actualizada (básica)
     path('cancel/<int:appointment_id>/', cancel_appointment_view, name='cancel_appointment'),
     # --- Otras (si aplican) ---
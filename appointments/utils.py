@@ -1,54 +1,76 @@
+import logging
+
 from django.utils import timezone
 from django.contrib import messages
 from datetime import timedelta, datetime, time
 from .models import Appointment
-from django.core.mail import send_mail
+from .holds import adjust_reserved_counts
+from .realtime import broadcast_appointments, ACTION_CANCELLED
+from django.db.models import Count, Q, Value, TextField
+from django.db.models.functions import Coalesce, Concat
+from .outbox import enqueue_email
 from django.template.loader import render_to_string
 from django.utils.html import strip_tags
 from django.conf import settings
 from django.urls import reverse
 
+logger = logging.getLogger(__name__)
+
 # ==========================================
 # LÓGICA DE MANTENIMIENTO (CITAS VENCIDAS)
 # ==========================================
-def check_and_cancel_expired_appointments(request=None):
-    now = timezone.now()
-    start_date = now - timedelta(days=730)
-    end_date = now + timedelta(days=5)
-    
-    pending_appointments = Appointment.objects.filter(
+EXPIRY_WINDOW = timedelta(hours=24)
+
+
+def expired_appointments_queryset(now=None):
+    """
+    Citas pendientes cuya fecha/hora cae dentro de las próximas 24h (o ya pasó).
+    Equivale a `fecha+hora - 24h < ahora`, resuelto en la BD con una sola
+    condición sobre (appointment_date, appointment_time). Sin hora se asume 23:59.
+    """
+    now = now or timezone.now()
+    cutoff = now + EXPIRY_WINDOW
+    if timezone.is_aware(cutoff):
+        cutoff = timezone.make_naive(cutoff)
+    same_day = Q(appointment_date=cutoff.date(), appointment_time__lt=cutoff.time())
+    if cutoff.time() > time(23, 59):
+        same_day |= Q(appointment_date=cutoff.date(), appointment_time__isnull=True)
+    return Appointment.objects.filter(
+        Q(appointment_date__lt=cutoff.date()) | same_day,
         status='pending',
-        appointment_date__range=[start_date.date(), end_date.date()]
     )
 
-    cancelled_count = 0
-
-    for appointment in pending_appointments:
-        if appointment.appointment_date:
-            appt_time = appointment.appointment_time if appointment.appointment_time else time(23, 59)
-            appt_datetime_naive = datetime.combine(appointment.appointment_date, appt_time)
-            
-            try:
-                if timezone.is_aware(now):
-                    appt_datetime = timezone.make_aware(appt_datetime_naive, timezone.get_current_timezone())
-                else:
-                    appt_datetime = appt_datetime_naive
-            except Exception:
-                appt_datetime = appt_datetime_naive
-
-            deadline = appt_datetime - timedelta(hours=24)
-            now_ts = now.timestamp()
-            deadline_ts = deadline.timestamp()
-
-            if now_ts > deadline_ts:
-                appointment.status = 'cancelled'
-                appointment.notes = (appointment.notes or "") + f"\n[AUTO] Cancelada el {now.strftime('%d/%m %H:%M')}. Deadline era: {deadline.strftime('%d/%m %H:%M')}"
-                appointment.save()
-                cancelled_count += 1
-            else:
-                if request and (deadline_ts - now_ts) < 172800: 
-                    time_left = (deadline_ts - now_ts) / 3600
-                    messages.info(request, f"Diagnóstico Cita #{appointment.id}: No vencida. Faltan {time_left:.1f} horas para que el sistema la cancele.")
+
+def check_and_cancel_expired_appointments(request=None, notify=True, dry_run=False):
+    """
+    Cancela en bloque las citas pendientes vencidas (regla de 24h) con un único
+    UPDATE que añade la nota de auditoría. Devuelve cuántas citas se cancelaron.
+    Pensado para ejecutarse desde `manage.py cancel_expired_appointments`.
+    """
+    now = timezone.now()
+    expired_ids = list(expired_appointments_queryset(now).values_list('id', flat=True))
+    if dry_run or not expired_ids:
+        return len(expired_ids)
+
+    audit_note = f"\n[AUTO] Cancelada el {now.strftime('%d/%m %H:%M')} (regla 24h)."
+    freed = dict(
+        Appointment.objects.filter(id__in=expired_ids, status='pending')
+        .values('appointment_date').annotate(total=Count('id')).values_list('appointment_date', 'total')
+    )
+    cancelled_count = Appointment.objects.filter(id__in=expired_ids, status='pending').update(
+        status='cancelled',
+        notes=Concat(Coalesce('notes', Value('')), Value(audit_note), output_field=TextField()),
+    )
+    # update() no pasa por Appointment.save: devolver el cupo de cada día a mano
+    # (adjust_reserved_counts también invalida la caché del calendario)
+    adjust_reserved_counts({day: -total for day, total in freed.items() if day})
+    # Tampoco hay post_save: publicar las cancelaciones al calendario en un solo lote
+    broadcast_appointments(expired_ids, ACTION_CANCELLED)
+
+    if notify:
+        cancelled = Appointment.objects.filter(id__in=expired_ids, status='cancelled').select_related('client', 'service')
+        for appointment in cancelled:
+            send_appointment_cancelled_email(request, appointment)
 
     return cancelled_count
 
@@ -58,22 +80,18 @@ def check_and_cancel_expired_appointments(request=None):
 # ==========================================
 
 def send_html_email(subject, template_name, context, recipient_list):
-    """Función auxiliar para enviar correos HTML con depuración."""
+    """
+    Renderiza el correo HTML y lo deja en la cola de salida.
+    El envío lo hace `manage.py send_queued_emails`, fuera del request.
+    """
     try:
         html_message = render_to_string(template_name, context)
         plain_message = strip_tags(html_message)
-        
-        send_mail(
-            subject,
-            plain_message,
-            settings.DEFAULT_FROM_EMAIL,
-            recipient_list,
-            html_message=html_message,
-            fail_silently=False, 
-        )
-        print(f"✅ CORREO ENVIADO: '{subject}' a {recipient_list}")
-    except Exception as e:
-        print(f"❌ ERROR CRÍTICO ENVIANDO CORREO '{subject}': {e}")
+        enqueue_email(subject, plain_message, recipient_list, html_body=html_message,
+                      from_email=settings.DEFAULT_FROM_EMAIL)
+        logger.info("Correo en cola: '%s' a %s", subject, recipient_list)
+    except Exception:
+        logger.exception("Error encolando el correo '%s'", subject)
 
 
 def send_appointment_received_email(request, appointment):
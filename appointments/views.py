@@ -10,7 +10,6 @@ from django.conf import settings
 from services.models import Service
 from django.utils import timezone
 from django.views.decorators.csrf import csrf_exempt # ¡Usar con cuidado! Mejor API con tokens
-import requests
 from django.contrib.auth.decorators import login_required
 from django.views.decorators.http import require_POST
 from django.urls import reverse_lazy # Para success_url
@@ -23,6 +22,10 @@ from django.utils.translation import gettext # Importa gettext
 # Al inicio de tu appointments/views.py
 from django.contrib.auth import get_user_model
 from .utils import send_appointment_received_email
+from .availability import get_availability, get_daily_status_map, STATUS_NOT_SCHEDULED
+from .holds import place_hold, claim_capacity, SlotUnavailable
+from .identity import lookup_dni, lookup_ruc, alookup_dni, alookup_ruc
+from django.db import transaction
 # ... otras importaciones ...
 User = get_user_model() # En lugar de User = settings.AUTH_USER_MODEL
 
@@ -155,7 +158,16 @@ class AppointmentRequestView(LoginRequiredMixin, CreateView):
             from django.shortcuts import get_object_or_404
             from services.models import Service
             form.instance.service = get_object_or_404(Service, pk=self.kwargs.get('service_id'))
-        response = super().form_valid(form)
+        # Tomar el cupo del día y guardar la cita en la misma transacción: la
+        # fila del día queda bloqueada, así dos solicitudes no ocupan el último cupo
+        try:
+            with transaction.atomic():
+                claim_capacity(user_to_update, form.cleaned_data['appointment_date'],
+                               hold_token=form.cleaned_data.get('hold_token'))
+                response = super().form_valid(form)
+        except SlotUnavailable as e:
+            form.add_error('appointment_date', str(e))
+            return self.form_invalid(form)
         send_appointment_received_email(self.request, self.object)
         # super().form_valid(form) se encarga de hacer form.save() y redirigir
         return response
@@ -185,37 +197,9 @@ def buscar_cliente_por_dni(request):
         dni = request.POST.get('dni')
         if not dni:
             return JsonResponse({'error': 'DNI es requerido'}, status=400)
-
-        token = '685c2d1a88c240a1482b75eed616a993e24e6bfb9b03739853046adf8dfb2863' # ¡Mover a settings!
-
-        try:
-            url = f'https://apiperu.dev/api/dni/{dni}?api_token={token}'
-            response = requests.get(url, timeout=10) # Añadir timeout
-
-            if response.status_code == 200:
-                data = response.json()
-                if data.get('success'):
-                    # Devolver más datos si son útiles (nombres, apellidos)
-                    return JsonResponse({
-                        'nombres': data['data'].get('nombres', ''),
-                        'apellidoPaterno': data['data'].get('apellido_paterno', ''),
-                        'apellidoMaterno': data['data'].get('apellido_materno', ''),
-                        'nombre_completo': data['data'].get('nombre_completo', ''),
-                        'dni': data['data'].get('numero', dni),
-                    })
-                else:
-                    error_msg = data.get('message', 'No se encontraron datos.')
-                    return JsonResponse({'error': error_msg}, status=404)
-            else:
-                 return JsonResponse({
-                    'error': f'Error en la API externa (Código: {response.status_code})'
-                 }, status=response.status_code)
-
-        except requests.exceptions.RequestException as e:
-            return JsonResponse({'error': f'Error de conexión con API externa: {str(e)}'}, status=500)
-        except Exception as e:
-             # Captura genérica para otros posibles errores (ej. JSON inválido)
-            return JsonResponse({'error': f'Error inesperado: {str(e)}'}, status=500)
+        # Caché local / consultas guardadas / API externa (ver identity.py)
+        payload, status = lookup_dni(dni)
+        return JsonResponse(payload, status=status)
 
     return JsonResponse({'error': 'Método no permitido'}, status=405)
 
@@ -243,52 +227,63 @@ def appointment_detail(request, appointment_id):
     return render(request, 'appointments/appointment_detail.html', context)
 
 
-# --- API de Disponibilidades (Reescrita) ---
-# Esta versión es básica: solo devuelve las horas generales del día.
-# Una versión avanzada generaría slots basados en la duración del servicio
-# y las citas ya existentes.
+# --- API de Disponibilidades ---
+# Devuelve los horarios libres calculados por el motor de disponibilidad
+# (appointments/availability.py) para un día o un rango de días.
+MAX_AVAILABILITY_RANGE_DAYS = 62
+
 @login_required(login_url='account_login') # O permitir acceso anónimo si es necesario
 def get_availabilities(request):
     """
-    API básica para obtener el horario laboral general de un día específico.
+    API de disponibilidad. Acepta `date` (un día) o `start`/`end` (rango),
+    y opcionalmente `service` (para la duración de la cita) y `staff`.
     """
     date_str = request.GET.get('date')
-    if not date_str:
-        return JsonResponse({'error': 'Parámetro "date" es requerido'}, status=400)
+    start_str = request.GET.get('start', date_str)
+    end_str = request.GET.get('end', date_str)
+    if not start_str or not end_str:
+        return JsonResponse({'error': 'Parámetro "date" o "start"/"end" es requerido'}, status=400)
 
     try:
-        target_date = datetime.date.fromisoformat(date_str)
-        workday = ScheduledWorkDay.objects.get(date=target_date)
-
-        if workday.is_working and workday.start_time and workday.end_time:
-            # Devolver el rango horario general
-             data = {
-                 'is_working': True,
-                 'start_time': workday.start_time.strftime('%H:%M'),
-                 'end_time': workday.end_time.strftime('%H:%M'),
-                 'notes': workday.notes
-             }
-             # --- Lógica Futura: Generación de Slots ---
-             # Aquí podrías añadir lógica para generar slots disponibles
-             # Necesitarías la duración del servicio (pasada como parámetro?)
-             # y consultar las citas ya existentes para ese día/staff.
-             # Ejemplo muy básico:
-             # slots = generate_time_slots(workday.start_time, workday.end_time, service_duration, existing_appointments)
-             # data['available_slots'] = slots
-             # ------------------------------------------
-        else:
-             data = {'is_working': False, 'notes': workday.notes}
-
-        return JsonResponse(data)
-
-    except ScheduledWorkDay.DoesNotExist:
-        return JsonResponse({'is_working': False, 'error': 'No schedule defined for this date'}, status=404)
+        start_date = datetime.date.fromisoformat(start_str)
+        end_date = datetime.date.fromisoformat(end_str)
     except ValueError:
         return JsonResponse({'error': 'Invalid date format (YYYY-MM-DD)'}, status=400)
+
+    if end_date < start_date or (end_date - start_date).days > MAX_AVAILABILITY_RANGE_DAYS:
+        return JsonResponse({'error': 'Rango de fechas inválido'}, status=400)
+
+    service = None
+    service_id = request.GET.get('service')
+    if service_id:
+        service = Service.objects.filter(pk=service_id).first()
+        if service is None:
+            return JsonResponse({'error': 'Servicio no encontrado'}, status=404)
+
+    staff = None
+    staff_id = request.GET.get('staff')
+    if staff_id:
+        staff = User.objects.filter(pk=staff_id, is_staff=True).first()
+        if staff is None:
+            return JsonResponse({'error': 'Personal no encontrado'}, status=404)
+
+    try:
+        availability = get_availability(start_date, end_date, service=service, staff=staff)
     except Exception as e:
         # Loguear el error real `e` en el servidor
         return JsonResponse({'error': 'An unexpected error occurred'}, status=500)
 
+    if date_str:
+        # Respuesta de un solo día (compatible con el formato anterior)
+        day = availability[start_date]
+        if day.status == STATUS_NOT_SCHEDULED:
+            return JsonResponse({'is_working': False, 'error': 'No schedule defined for this date'}, status=404)
+        return JsonResponse(day.as_dict())
+
+    return JsonResponse({
+        'days': {day_date.isoformat(): day.as_dict() for day_date, day in availability.items()}
+    })
+
 
 # --- Vista request_appointment (Eliminada) ---
 # Se elimina esta vista basada en función porque AppointmentRequestView (CBV)
@@ -335,38 +330,44 @@ def cancel_appointment_view(request, appointment_id):
 # ------------------------------------
 # en appointments/views.py
 def get_daily_availability_status(request):
-    # Este endpoint podría devolver un objeto con fechas y su estado (disponible, lleno, no laborable)
-    # para un rango de fechas (ej. próximo mes).
-    # Por ahora, es un concepto. La implementación detallada dependerá del datepicker.
-    data_summary = {}
+    """
+    Estado por día (available/full/not_working/not_scheduled) para el datepicker.
+    Por defecto cubre los próximos 60 días a partir de mañana; acepta `start`/`end`.
+    """
     today = timezone.now().date()
-    one_day_hence = today + datetime.timedelta(days=1)
+    try:
+        start_date = datetime.date.fromisoformat(request.GET['start']) if request.GET.get('start') else today + datetime.timedelta(days=1)
+        end_date = datetime.date.fromisoformat(request.GET['end']) if request.GET.get('end') else start_date + datetime.timedelta(days=59)
+    except ValueError:
+        return JsonResponse({'error': 'Invalid date format (YYYY-MM-DD)'}, status=400)
 
-    # Query para los próximos 30-60 días
-    date_range = [one_day_hence + datetime.timedelta(days=i) for i in range(60)]
+    if end_date < start_date or (end_date - start_date).days > MAX_AVAILABILITY_RANGE_DAYS:
+        return JsonResponse({'error': 'Rango de fechas inválido'}, status=400)
 
-    for day_to_check in date_range:
-        status = "available"
-        try:
-            workday = ScheduledWorkDay.objects.get(date=day_to_check)
-            if not workday.is_working:
-                status = "not_working"
-        except ScheduledWorkDay.DoesNotExist:
-            status = "not_scheduled" # Administrador necesita configurar este día
-
-        if status == "available": # Solo si es laborable y programado, chequear cupos
-            count = Appointment.objects.filter(
-                appointment_date=day_to_check,
-                status__in=['pending', 'confirmed']
-            ).count()
-            if count >= 3:
-                status = "full"
-        data_summary[day_to_check.isoformat()] = status
-
-    return JsonResponse(data_summary)
+    return JsonResponse(get_daily_status_map(start_date, end_date))
+
+@login_required
+@require_POST
+def hold_slot(request):
+    """
+    Reserva temporalmente un cupo del día elegido en el formulario de citas.
+    Devuelve el token que el formulario envía al confirmar la cita.
+    """
+    try:
+        target_date = datetime.date.fromisoformat(request.POST.get('date', ''))
+    except ValueError:
+        return JsonResponse({'error': 'Invalid date format (YYYY-MM-DD)'}, status=400)
+    if target_date <= timezone.now().date():
+        return JsonResponse({'error': 'La fecha debe ser a partir de mañana'}, status=400)
+
+    service = Service.objects.filter(pk=request.POST.get('service')).first() if request.POST.get('service', '').isdigit() else None
+    try:
+        hold = place_hold(request.user, target_date, service=service)
+    except SlotUnavailable as e:
+        return JsonResponse({'error': str(e)}, status=409)
+    return JsonResponse({'token': str(hold.token), 'date': hold.date.isoformat(), 'expires_at': hold.expires_at.isoformat()})
 
 # ... importaciones existentes ...
-import requests
 from django.http import JsonResponse
 from django.views.decorators.csrf import csrf_exempt
 
@@ -376,37 +377,36 @@ def buscar_empresa_por_ruc(request):
         ruc = request.POST.get('ruc')
         if not ruc:
             return JsonResponse({'error': 'RUC es requerido'}, status=400)
+        # Caché local / consultas guardadas / API externa (ver identity.py)
+        payload, status = lookup_ruc(ruc)
+        return JsonResponse(payload, status=status)
 
-        # ⚠️ RECOMENDACIÓN: Mueve esto a settings.py -> settings.DECOLECTA_API_KEY
-        token = 'sk_12062.BW7ZrmYioluxNOeo0nKnUQlO6Gs6yAUJ' 
-        
-        url = f"https://api.decolecta.com/v1/sunat/ruc/full?numero={ruc}"
-        
-        headers = {
-            'Authorization': f'Bearer {token}',
-            'Content-Type': 'application/json'
-        }
+    return JsonResponse({'error': 'Método no permitido'}, status=405)
 
-        try:
-            response = requests.get(url, headers=headers, timeout=10)
-            
-            if response.status_code == 200:
-                data = response.json()
-                # Mapeamos la respuesta de Decolecta a lo que necesita tu frontend
-                return JsonResponse({
-                    'razon_social': data.get('razon_social'),
-                    'direccion': data.get('direccion'),
-                    'departamento': data.get('departamento'),
-                    'provincia': data.get('provincia'),
-                    'distrito': data.get('distrito'),
-                    'estado': data.get('estado'),
-                    'condicion': data.get('condicion'),
-                    'ruc': data.get('numero_documento')
-                })
-            else:
-                return JsonResponse({'error': 'No se encontró el RUC o hubo un error en la API externa.'}, status=404)
 
-        except requests.exceptions.RequestException as e:
-            return JsonResponse({'error': f'Error de conexión: {str(e)}'}, status=500)
+# --- Variantes async (solo bajo ASGI: no ocupan un worker mientras espera la API externa) ---
+async def buscar_cliente_por_dni_async(request):
+    if request.method == 'POST':
+        dni = request.POST.get('dni')
+        if not dni:
+            return JsonResponse({'error': 'DNI es requerido'}, status=400)
+        payload, status = await alookup_dni(dni)
+        return JsonResponse(payload, status=status)
+
+    return JsonResponse({'error': 'Método no permitido'}, status=405)
+
+
+async def buscar_empresa_por_ruc_async(request):
+    if request.method == 'POST':
+        ruc = request.POST.get('ruc')
+        if not ruc:
+            return JsonResponse({'error': 'RUC es requerido'}, status=400)
+        payload, status = await alookup_ruc(ruc)
+        return JsonResponse(payload, status=status)
+
+    return JsonResponse({'error': 'Método no permitido'}, status=405)
+
 
-    return JsonResponse({'error': 'Método no permitido'}, status=405)
\ No newline at end of file
+# csrf_exempt de Django 4.2 envuelve la vista en una función síncrona; se marca directamente
+buscar_cliente_por_dni_async.csrf_exempt = True
+buscar_empresa_por_ruc_async.csrf_exempt = True
@@ -0,0 +1,104 @@
+# appointments/workdays.py
+"""
+Generación en bloque de días programados (ScheduledWorkDay).
+
+Los días se crean por adelantado a partir de la plantilla semanal y de la
+lista de feriados, con un solo bulk_create. Así la disponibilidad, el
+formulario de citas y el calendario solo leen ScheduledWorkDay y no tienen
+que resolver la plantilla fecha por fecha.
+"""
+import calendar
+import datetime
+
+from django.db.models import Q
+
+from .cache import bump_calendar_version
+from .models import Holiday, ScheduledWorkDay, WorkScheduleTemplate
+
+DEFAULT_MONTHS_AHEAD = 3
+
+
+def add_months(value, months):
+    month_index = value.month - 1 + months
+    year, month = value.year + month_index // 12, month_index % 12 + 1
+    return value.replace(year=year, month=month, day=min(value.day, calendar.monthrange(year, month)[1]))
+
+
+def holidays_between(start_date, end_date):
+    """{fecha: motivo} de los feriados (fijos y anuales) que caen en el rango."""
+    holidays = Holiday.objects.filter(Q(date__range=[start_date, end_date]) | Q(is_recurring=True))
+    by_month_day = {}
+    fixed = {}
+    for holiday in holidays:
+        if holiday.is_recurring:
+            by_month_day[(holiday.date.month, holiday.date.day)] = holiday.name
+        else:
+            fixed[holiday.date] = holiday.name
+
+    result = {}
+    current = start_date
+    while current <= end_date:
+        name = fixed.get(current) or by_month_day.get((current.month, current.day))
+        if name:
+            result[current] = name
+        current += datetime.timedelta(days=1)
+    return result
+
+
+def materialize_workdays(start_date, end_date):
+    """
+    Crea los ScheduledWorkDay que falten en [start_date, end_date] según la
+    plantilla semanal; los feriados se crean como no laborables. Los días ya
+    existentes (editados a mano o generados antes) no se tocan.
+    Devuelve cuántos días se crearon.
+    """
+    templates = {template.day_of_week: template for template in WorkScheduleTemplate.objects.all()}
+    holidays = holidays_between(start_date, end_date)
+    existing = set(
+        ScheduledWorkDay.objects.filter(date__range=[start_date, end_date]).values_list('date', flat=True)
+    )
+
+    new_days = []
+    current = start_date
+    while current <= end_date:
+        template = templates.get(current.weekday())
+        if current in existing:
+            pass
+        elif current in holidays:
+            new_days.append(ScheduledWorkDay(date=current, is_working=False, notes=holidays[current]))
+        elif template is not None:
+            new_days.append(ScheduledWorkDay(
+                date=current,
+                is_working=template.is_working_day,
+                start_time=template.start_time if template.is_working_day else None,
+                end_time=template.end_time if template.is_working_day else None,
+            ))
+        current += datetime.timedelta(days=1)
+
+    if new_days:
+        # ignore_conflicts cubre días creados en paralelo entre la lectura y la inserción
+        ScheduledWorkDay.objects.bulk_create(new_days, batch_size=500, ignore_conflicts=True)
+        # bulk_create no dispara post_save
+        bump_calendar_version()
+    return len(new_days)
+
+
+def materialize_months_ahead(months=DEFAULT_MONTHS_AHEAD, start_date=None):
+    start_date = start_date or datetime.date.today()
+    return materialize_workdays(start_date, add_months(start_date, months))
+
+
+def apply_holiday(holiday):
+    """
+    Marca como no laborables los días ya generados que caen en el feriado
+    (desde hoy en adelante). Devuelve cuántos días se actualizaron.
+    """
+    workdays = ScheduledWorkDay.objects.filter(date__gte=datetime.date.today(), is_working=True)
+    if holiday.is_recurring:
+        workdays = workdays.filter(date__month=holiday.date.month, date__day=holiday.date.day)
+    else:
+        workdays = workdays.filter(date=holiday.date)
+    updated = workdays.update(is_working=False, start_time=None, end_time=None, notes=holiday.name)
+    if updated:
+        bump_calendar_version()
+    return updated
@@ -5,10 +5,11 @@ from django.utils.html import format_html
 from django.urls import path, reverse, NoReverseMatch
 from django.shortcuts import redirect # No se usa directamente aquí, pero por si acaso
 
-from .models import InventoryStatus, InventoryMovement # Importa los modelos primero
+from .models import InventoryStatus, InventoryMovement, InventorySnapshot, LowStockAlert # Importa los modelos primero
+from .posting import set_movements_draft
 from services.models import Product # Para el filtro de productos
 # Importa tus vistas de admin personalizadas DESPUÉS de los modelos y el bloque unregister
-from .admin_views import inventory_report, product_history 
+from .admin_views import inventory_report, product_history, export_product_history, stock_as_of_api
 
 # --- BLOQUE PARA DES-REGISTRAR MODELOS (AÑADE ESTO AL INICIO) ---
 # Esto ayuda a evitar errores 'AlreadyRegistered' con el reloader del servidor de desarrollo.
@@ -26,7 +27,7 @@ except admin.sites.NotRegistered:
 @admin.register(InventoryStatus) # Esta es la línea 13 (después de importaciones y unregister)
 class InventoryStatusAdmin(admin.ModelAdmin):
     list_display = ('product_name', 'current_stock', 'stock_min', 'stock_status', 'last_updated', 'actions_buttons')
-    list_filter = ('product__category__name', 'product__is_active') 
+    list_filter = ('below_minimum', 'product__category__name', 'product__is_active') 
     search_fields = ('product__name', 'product__description')
     readonly_fields = ('current_stock', 'last_updated')
     actions = ['update_inventory_status_action'] 
@@ -40,6 +41,8 @@ class InventoryStatusAdmin(admin.ModelAdmin):
         custom_urls = [
             path('report/', self.admin_site.admin_view(inventory_report), name=f'{info[0]}_{info[1]}_view_report'),
             path('product/<int:product_id>/history/', self.admin_site.admin_view(product_history), name=f'{info[0]}_{info[1]}_product_kardex'),
+            path('product/<int:product_id>/history/export/', self.admin_site.admin_view(export_product_history), name=f'{info[0]}_{info[1]}_product_kardex_export'),
+            path('product/<int:product_id>/stock-as-of/', self.admin_site.admin_view(stock_as_of_api), name=f'{info[0]}_{info[1]}_stock_as_of'),
         ]
         return custom_urls + urls
 
@@ -65,7 +68,7 @@ class InventoryStatusAdmin(admin.ModelAdmin):
     stock_min.short_description = _('Stock Mínimo')
 
     def stock_status(self, obj):
-        if hasattr(obj, 'is_below_minimum') and obj.is_below_minimum():
+        if obj.below_minimum:
             return format_html('<span style="color: red; font-weight: bold;">⚠️ BAJO MÍNIMO</span>')
         elif obj.current_stock <= 0:
             return format_html('<span style="color: darkred; font-weight: bold;">🚫 SIN STOCK</span>')
@@ -116,23 +119,13 @@ class InventoryMovementAdmin(admin.ModelAdmin):
     draft_status.short_description = _('Estado')
 
     def confirm_movements_action(self, request, queryset):
-        updated = 0
-        product_ids_to_update = set()
-        for movement in queryset.filter(draft=True):
-            movement.draft = False
-            movement.save(update_fields=['draft']) 
-            product_ids_to_update.add(movement.product_id)
-            updated +=1
-            
-        for product_id in product_ids_to_update:
-            inventory_status, created = InventoryStatus.objects.get_or_create(product_id=product_id)
-            if hasattr(inventory_status, 'update_stock'): 
-                inventory_status.update_stock()
+        # Un UPDATE de movimientos y uno de stock por producto (ver posting.py)
+        updated = set_movements_draft(queryset, draft=False)
         self.message_user(request, _('Se confirmaron {} movimientos. Stock(s) afectado(s) actualizado(s).').format(updated))
     confirm_movements_action.short_description = _('Confirmar movimientos y actualizar stock')
 
     def mark_as_draft_action(self, request, queryset):
-        updated = queryset.filter(draft=False).update(draft=True)
+        updated = set_movements_draft(queryset, draft=True)
         self.message_user(request, _('Se marcaron {} movimientos como borrador.').format(updated))
     mark_as_draft_action.short_description = _('Marcar seleccionados como borrador')
     
@@ -147,4 +140,36 @@ class InventoryMovementAdmin(admin.ModelAdmin):
         extra_context.update(admin.site.each_context(request)) # Crucial
         return super().changelist_view(request, extra_context=extra_context)
 
-# ... (otro código como la configuración de verbose_name para la app si lo tienes)
\ No newline at end of file
+# ... (otro código como la configuración de verbose_name para la app si lo tienes)
+
+
+# --- Admin para InventorySnapshot (solo lectura; los genera el comando snapshot_inventory) ---
+@admin.register(InventorySnapshot)
+class InventorySnapshotAdmin(admin.ModelAdmin):
+    list_display = ('product', 'date', 'period', 'closing_stock', 'created_at')
+    list_filter = ('period', 'date')
+    search_fields = ('product__name',)
+    date_hierarchy = 'date'
+    list_select_related = ('product',)
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+# --- Admin para LowStockAlert (solo lectura; las abre y cierra el registro de movimientos) ---
+@admin.register(LowStockAlert)
+class LowStockAlertAdmin(admin.ModelAdmin):
+    list_display = ('product', 'stock_at_trigger', 'stock_min', 'triggered_at', 'resolved_at', 'notified_at')
+    list_filter = (('resolved_at', admin.EmptyFieldListFilter), ('notified_at', admin.EmptyFieldListFilter))
+    search_fields = ('product__name',)
+    date_hierarchy = 'triggered_at'
+    list_select_related = ('product',)
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
@@ -2,93 +2,83 @@
 from django.contrib import admin # Necesario para admin.site.each_context
 from django.contrib.admin.views.decorators import staff_member_required
 from django.utils.translation import gettext_lazy as _
-from django.db.models import F, Sum # Count, Q no se usan en el código actual que pasaste
+from django.db.models import F, Case, When, Value, CharField
 from django.shortcuts import render, get_object_or_404
-from django.http import JsonResponse
+from django.http import JsonResponse, FileResponse, StreamingHttpResponse
 from django.core.serializers.json import DjangoJSONEncoder
+from django.utils.dateparse import parse_date
+from django.utils.text import slugify
 from datetime import datetime
+from urllib.parse import urlencode
+import csv
+import itertools
 
 from .models import InventoryStatus, InventoryMovement
+from .kardex import kardex_page, kardex_rows, closing_balance, export_row, write_xlsx, EXPORT_HEADERS
+from .snapshots import stock_as_of
 from services.models import Product, ProductCategory # Asegúrate que estas importaciones sean correctas
 
-@staff_member_required
-def inventory_report(request):
-    """Vista para generar un reporte completo de inventario."""
-    categories = ProductCategory.objects.all()
-    category_id = request.GET.get('category')
-    status_filter = request.GET.get('status')
-    
+def _inventory_report_queryset(category_id=None, status_filter=None):
+    """
+    Estados de inventario del reporte con el estado del stock calculado en SQL
+    (`stock_state`: 'out', 'low' u 'ok'); `below_minimum` ya viene guardado.
+    """
     queryset = InventoryStatus.objects.select_related(
         'product', 'product__category'
-    ).order_by('product__category__name', 'product__name')
+    ).annotate(
+        stock_state=Case(
+            When(current_stock__lte=0, then=Value('out')),
+            When(current_stock__lt=F('product__stock_min'), then=Value('low')),
+            default=Value('ok'),
+            output_field=CharField(),
+        ),
+    ).order_by('product__category__name', 'product__category_id', 'product__name')
     
     if category_id:
         queryset = queryset.filter(product__category_id=category_id)
     if status_filter == 'low':
-        queryset = queryset.filter(current_stock__lt=F('product__stock_min'))
+        queryset = queryset.filter(below_minimum=True)
     elif status_filter == 'out':
         queryset = queryset.filter(current_stock__lte=0)
+    return queryset
+
+
+@staff_member_required
+def inventory_report(request):
+    """Vista para generar un reporte completo de inventario."""
+    categories = ProductCategory.objects.all()
+    category_id = request.GET.get('category')
+    status_filter = request.GET.get('status')
+    
+    # Una sola consulta; las estadísticas y el resumen salen de las mismas filas.
+    # Los productos sin estado se crean fuera de la vista (comando backfill_inventory_status).
+    inventory_items = list(_inventory_report_queryset(category_id, status_filter))
     
     stats = {
-        'total_products': queryset.count(),
-        'low_stock': queryset.filter(current_stock__lt=F('product__stock_min')).count(),
-        'out_of_stock': queryset.filter(current_stock__lte=0).count(),
+        'total_products': len(inventory_items),
+        'low_stock': sum(1 for item in inventory_items if item.below_minimum),
+        'out_of_stock': sum(1 for item in inventory_items if item.stock_state == 'out'),
     }
     
+    # Resumen por categoría (las filas ya vienen ordenadas por categoría)
     category_summary = []
-    for category in categories:
-        category_items = queryset.filter(product__category=category)
-        if category_items.exists():
-            category_summary.append({
-                'category': category,
-                'product_count': category_items.count(),
-                'low_stock': category_items.filter(current_stock__lt=F('product__stock_min')).count(),
-            })
+    for category, items in itertools.groupby(inventory_items, key=lambda item: item.product.category):
+        if category is None:
+            continue
+        items = list(items)
+        category_summary.append({
+            'category': category,
+            'product_count': len(items),
+            'low_stock': sum(1 for item in items if item.below_minimum),
+        })
             
     recent_movements = InventoryMovement.objects.filter(
         draft=False
     ).select_related('product').order_by('-created_at')[:10]
-    
-    products_without_status = Product.objects.exclude(
-        id__in=InventoryStatus.objects.values_list('product_id', flat=True)
-    )
-    
-    # Bandera para saber si se crearon nuevos estados y necesitamos re-filtrar
-    refilter_needed = False
-    if products_without_status.exists():
-        refilter_needed = True # Marcar que se crearon estados
-        for product in products_without_status:
-            entradas = InventoryMovement.objects.filter(
-                product=product, movement_type='entrada', draft=False
-            ).aggregate(total=Sum('quantity'))['total'] or 0
-            salidas = InventoryMovement.objects.filter(
-                product=product, movement_type='salida', draft=False
-            ).aggregate(total=Sum('quantity'))['total'] or 0
-            stock_actual = entradas - salidas
-            InventoryStatus.objects.create(product=product, current_stock=stock_actual)
-        
-        # Si se crearon nuevos estados, volvemos a obtener el queryset completo
-        queryset = InventoryStatus.objects.select_related(
-            'product', 'product__category'
-        ).order_by('product__category__name', 'product__name')
-        # Y re-aplicamos filtros
-        if category_id:
-            queryset = queryset.filter(product__category_id=category_id)
-        if status_filter == 'low':
-            queryset = queryset.filter(current_stock__lt=F('product__stock_min'))
-        elif status_filter == 'out':
-            queryset = queryset.filter(current_stock__lte=0)
-        # Actualizar también las stats si el queryset cambió
-        stats = {
-            'total_products': queryset.count(),
-            'low_stock': queryset.filter(current_stock__lt=F('product__stock_min')).count(),
-            'out_of_stock': queryset.filter(current_stock__lte=0).count(),
-        }
-
 
     context = {
         'title': _('Reporte de Inventario'),
-        'inventory_items': queryset,
+        'inventory_items': inventory_items,
         'categories': categories,
         'selected_category': category_id,
         'selected_status': status_filter,
@@ -102,53 +92,47 @@ def inventory_report(request):
     context.update(admin.site.each_context(request)) # MUY IMPORTANTE para plantillas de admin
     return render(request, 'admin/inventory/inventory_report.html', context)
 
+
+def _kardex_filters(request):
+    """Rango de fechas (?start=AAAA-MM-DD&end=AAAA-MM-DD); las fechas inválidas se ignoran."""
+    def parse(name):
+        try:
+            return parse_date(request.GET.get(name) or '')
+        except ValueError:
+            return None
+    return parse('start'), parse('end')
+
+
 @staff_member_required
 def product_history(request, product_id):
     """Vista para mostrar el historial de movimientos de un producto (Kardex)."""
     product = get_object_or_404(Product, pk=product_id)
+    start_date, end_date = _kardex_filters(request)
+    before = request.GET.get('before') or None
     
-    # Asegurar que InventoryStatus exista y esté actualizado
-    entradas_total = InventoryMovement.objects.filter(
-        product=product, movement_type='entrada', draft=False
-    ).aggregate(total=Sum('quantity'))['total'] or 0
-    salidas_total = InventoryMovement.objects.filter(
-        product=product, movement_type='salida', draft=False
-    ).aggregate(total=Sum('quantity'))['total'] or 0
-    current_stock_calculated = entradas_total - salidas_total
-
-    inventory_status, created = InventoryStatus.objects.get_or_create(
-        product=product,
-        defaults={'current_stock': current_stock_calculated}
-    )
-    if not created and inventory_status.current_stock != current_stock_calculated:
-        inventory_status.current_stock = current_stock_calculated
-        inventory_status.save(update_fields=['current_stock'])
-        
-    # Historial de movimientos confirmados para mostrar en orden cronológico (el más antiguo primero)
-    confirmed_movements = InventoryMovement.objects.filter(
-        product=product, draft=False
-    ).order_by('created_at') # Ordenar por más antiguo primero para calcular saldo cronológico
-
-    movement_history_display = []
-    balance = 0  # El saldo inicial antes de cualquier movimiento registrado es 0
-                 # O podrías buscar el primer movimiento y calcular el saldo inicial antes de ese.
-                 # Para un kardex, usualmente se parte de 0 y se reconstruye.
-
-    for movement in confirmed_movements:
-        if movement.movement_type == 'entrada':
-            balance += movement.quantity
-        else: # salida
-            balance -= movement.quantity
-        movement_history_display.append({
-            'movement': movement,
-            'balance': balance 
-        })
+    # Solo lectura: el estado lo crean la señal de Product o backfill_inventory_status;
+    # si todavía falta, se muestra el saldo de los movimientos
+    current_stock = InventoryStatus.objects.filter(product=product).values_list('current_stock', flat=True).first()
+    if current_stock is None:
+        current_stock = closing_balance(product, None)
+    
+    # Página del Kardex (más reciente primero), con el saldo arrastrado en el cursor
+    movements, next_cursor = kardex_page(product, start_date, end_date, before=before)
+    movement_history_display = [{'movement': movement, 'balance': movement.balance} for movement in movements]
+    
+    filters = {key: value for key, value in (('start', start_date), ('end', end_date)) if value}
+    next_page_query = urlencode({**filters, 'before': next_cursor}) if next_cursor else None
 
     context = {
         'title': _('Historial de Producto: {}').format(product.name),
         'product': product,
-        'movement_history': movement_history_display, # Ya está en orden cronológico
-        'current_balance': inventory_status.current_stock, # El stock actual definitivo
+        'movement_history': movement_history_display, # Más reciente primero
+        'current_balance': current_stock, # El stock actual definitivo
+        'start_date': start_date,
+        'end_date': end_date,
+        'is_first_page': before is None,
+        'next_page_query': next_page_query,
+        'export_query': urlencode(filters),
         'opts': Product._meta, # O InventoryMovement._meta, según lo que represente mejor la página
         'app_label': Product._meta.app_label,
         'has_change_permission': request.user.has_perm('inventory.change_inventorymovement'),
@@ -156,6 +140,65 @@ def product_history(request, product_id):
     context.update(admin.site.each_context(request)) # MUY IMPORTANTE
     return render(request, 'admin/inventory/product_history.html', context)
 
+
+class _Echo:
+    """Buffer mínimo para csv.writer: devuelve la línea en vez de guardarla."""
+    def write(self, value):
+        return value
+
+
+@staff_member_required
+def export_product_history(request, product_id):
+    """Kardex completo del rango en CSV (?format=csv) o Excel (?format=xlsx), sin cargarlo entero en memoria."""
+    product = get_object_or_404(Product, pk=product_id)
+    start_date, end_date = _kardex_filters(request)
+    rows = (export_row(movement) for movement in kardex_rows(product, start_date, end_date))
+    filename = f"kardex_{slugify(product.name) or product.pk}_{datetime.now():%Y%m%d}"
+
+    if request.GET.get('format') == 'xlsx':
+        return FileResponse(
+            write_xlsx(rows, EXPORT_HEADERS), as_attachment=True, filename=f'{filename}.xlsx',
+            content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+        )
+
+    writer = csv.writer(_Echo())
+    lines = itertools.chain([writer.writerow(EXPORT_HEADERS)], (writer.writerow(row) for row in rows))
+    response = StreamingHttpResponse(lines, content_type='text/csv')
+    response['Content-Disposition'] = f'attachment; filename="{filename}.csv"'
+    return response
+
+@staff_member_required
+def stock_as_of_api(request, product_id):
+    """Stock de un producto al cierre de ?date=AAAA-MM-DD: corte más cercano y movimientos desde ese corte."""
+    product = get_object_or_404(Product, pk=product_id)
+    try:
+        as_of = parse_date(request.GET.get('date') or '')
+    except ValueError:
+        as_of = None
+    if not as_of:
+        return JsonResponse({'error': 'Parámetro date requerido (AAAA-MM-DD)'}, status=400)
+
+    result = stock_as_of(product.pk, as_of)
+    snapshot = result['snapshot']
+    return JsonResponse({
+        'product_id': product.pk,
+        'product_name': product.name,
+        'date': as_of,
+        'stock': result['stock'],
+        'snapshot': {'date': snapshot.date, 'closing_stock': snapshot.closing_stock} if snapshot else None,
+        'movements': [
+            {
+                'id': movement.id,
+                'created_at': movement.created_at,
+                'movement_type': movement.movement_type,
+                'quantity': movement.quantity,
+                'document_reference': movement.document_reference or '',
+            }
+            for movement in result['movements']
+        ],
+    }, encoder=DjangoJSONEncoder)
+
+
 # --- NUEVA API PARA EL CALENDARIO DE MOVIMIENTOS ---
 @staff_member_required
 def inventory_movement_events_api(request):
@@ -228,16 +271,7 @@ def export_inventory_report_pdf(request):
     category_id = request.GET.get('category') # Para mantener los filtros
     status_filter = request.GET.get('status')
 
-    queryset = InventoryStatus.objects.select_related(
-        'product', 'product__category'
-    ).order_by('product__category__name', 'product__name')
-
-    if category_id:
-        queryset = queryset.filter(product__category_id=category_id)
-    if status_filter == 'low':
-        queryset = queryset.filter(current_stock__lt=F('product__stock_min'))
-    elif status_filter == 'out':
-        queryset = queryset.filter(current_stock__lte=0)
+    queryset = _inventory_report_queryset(category_id, status_filter)
 
     # No necesitas todas las stats complejas para el PDF, solo los items.
     # Pero puedes incluirlas si tu plantilla PDF las usa.
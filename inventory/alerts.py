@@ -0,0 +1,109 @@
+# inventory/alerts.py
+"""
+Alertas de stock bajo.
+
+Cada vez que el registro de movimientos cambia el stock (posting.py), se
+revisan solo los productos tocados: una consulta por su clave compara la
+bandera `below_minimum` del estado con `current_stock < stock_min`. Solo si
+alguno cruzó el mínimo se releen esas filas con bloqueo (así dos procesos en
+paralelo no crean la misma alerta dos veces), se voltea la bandera y se abre
+una LowStockAlert; si volvió por encima, se cierra. El aviso no sale en el
+momento: `send_low_stock_digest` junta las alertas abiertas sin avisar en un
+solo correo de la cola de salida.
+"""
+from django.conf import settings
+from django.db import transaction
+from django.db.models import BooleanField, ExpressionWrapper, F, Q
+from django.template.loader import render_to_string
+from django.utils import timezone
+from django.utils.html import strip_tags
+
+from appointments.outbox import enqueue_email
+
+from .models import InventoryStatus, LowStockAlert
+
+BELOW_MINIMUM = ExpressionWrapper(Q(current_stock__lt=F('product__stock_min')), output_field=BooleanField())
+
+
+def detect_crossings(product_ids):
+    """
+    Actualiza la bandera de stock bajo de los productos indicados y abre o
+    cierra sus alertas. Devuelve cuántas alertas se abrieron.
+    """
+    if not product_ids:
+        return 0
+    candidates = list(
+        InventoryStatus.objects.filter(product_id__in=product_ids)
+        .annotate(now_below=BELOW_MINIMUM)
+        .exclude(below_minimum=F('now_below'))
+        .values_list('pk', flat=True)
+    )
+    if not candidates:
+        return 0
+
+    with transaction.atomic():
+        # Releer con bloqueo: si otro proceso ya registró el cruce, aquí ya no aparece
+        crossed = list(
+            InventoryStatus.objects.select_for_update()
+            .filter(pk__in=candidates)
+            .annotate(now_below=BELOW_MINIMUM)
+            .exclude(below_minimum=F('now_below'))
+            .values_list('pk', 'product_id', 'now_below', 'current_stock', 'product__stock_min')
+        )
+        dropped = [row for row in crossed if row[2]]
+        replenished = [row for row in crossed if not row[2]]
+        if dropped:
+            InventoryStatus.objects.filter(pk__in=[row[0] for row in dropped]).update(below_minimum=True)
+            LowStockAlert.objects.bulk_create([
+                LowStockAlert(product_id=product_id, stock_at_trigger=current_stock, stock_min=stock_min)
+                for _pk, product_id, _below, current_stock, stock_min in dropped
+            ])
+        if replenished:
+            InventoryStatus.objects.filter(pk__in=[row[0] for row in replenished]).update(below_minimum=False)
+            LowStockAlert.objects.filter(
+                product_id__in=[row[1] for row in replenished], resolved_at__isnull=True
+            ).update(resolved_at=timezone.now())
+    return len(dropped)
+
+
+def below_minimum_statuses():
+    """Productos actualmente bajo el mínimo (usa el índice de la bandera), el más crítico primero."""
+    return InventoryStatus.objects.filter(below_minimum=True).select_related('product').order_by('current_stock')
+
+
+def alert_recipients():
+    recipients = getattr(settings, 'INVENTORY_ALERT_RECIPIENTS', None)
+    if recipients is None:
+        recipients = [email for _name, email in getattr(settings, 'ADMINS', [])] or [settings.DEFAULT_FROM_EMAIL]
+    return recipients
+
+
+def send_low_stock_digest(recipients=None):
+    """
+    Deja en la cola de salida un solo correo con las alertas abiertas que aún
+    no se avisaron y las marca como avisadas. Devuelve cuántas incluyó.
+    """
+    with transaction.atomic():
+        # Bloquear las pendientes evita que dos ejecuciones manden el mismo resumen
+        pending = list(
+            LowStockAlert.objects.select_for_update()
+            .filter(resolved_at__isnull=True, notified_at__isnull=True)
+            .values_list('pk', flat=True)
+        )
+        if not pending:
+            return 0
+        alerts = list(
+            LowStockAlert.objects.filter(pk__in=pending)
+            .select_related('product', 'product__inventory_status')
+            .order_by('triggered_at')
+        )
+        html_message = render_to_string('emails/low_stock_digest.html', {
+            'alerts': alerts,
+            'still_below': below_minimum_statuses().count(),
+        })
+        enqueue_email(
+            f'Stock bajo: {len(alerts)} producto(s) bajo el mínimo',
+            strip_tags(html_message), recipients or alert_recipients(), html_body=html_message,
+        )
+        LowStockAlert.objects.filter(pk__in=pending).update(notified_at=timezone.now())
+    return len(alerts)
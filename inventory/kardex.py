@@ -0,0 +1,188 @@
+# inventory/kardex.py
+"""
+Kardex (historial con saldo) de un producto.
+
+La pantalla pagina por keyset sobre (created_at, id), de la fila más reciente
+hacia atrás:
+    WHERE (created_at, id) < cursor ORDER BY created_at DESC, id DESC LIMIT n
+con el índice movimiento_kardex_idx, así cada página lee solo sus filas sin
+importar cuántas haya antes. El saldo de la primera fila de la página viaja en
+el cursor (la primera página parte del saldo al cierre del rango, ver
+snapshots.py) y el de cada fila siguiente se obtiene restando su cantidad.
+La exportación recorre el rango en orden cronológico sumando desde el saldo
+de apertura.
+"""
+import datetime
+import itertools
+import zipfile
+from decimal import Decimal, InvalidOperation
+from tempfile import SpooledTemporaryFile
+from xml.sax.saxutils import escape
+
+from django.db.models import Case, DecimalField, F, Q, When
+from django.utils import timezone
+
+from .models import InventoryMovement
+from .snapshots import balance_as_of
+
+PAGE_SIZE = 50
+
+SIGNED_QUANTITY = Case(
+    When(movement_type='entrada', then=F('quantity')),
+    default=-F('quantity'),
+    output_field=DecimalField(max_digits=12, decimal_places=2),
+)
+
+
+def _bounds(start_date, end_date):
+    start = datetime.datetime.combine(start_date, datetime.time.min) if start_date else None
+    end = datetime.datetime.combine(end_date + datetime.timedelta(days=1), datetime.time.min) if end_date else None
+    return start, end
+
+
+def opening_balance(product, start_date):
+    """Saldo antes del primer día del rango (0 si no hay fecha de inicio), desde el último corte."""
+    if not start_date:
+        return 0
+    return balance_as_of(product.pk, start_date - datetime.timedelta(days=1))
+
+
+def closing_balance(product, end_date):
+    """Saldo al cierre del rango (o al momento, sin fecha de fin), desde el último corte."""
+    return balance_as_of(product.pk, end_date or timezone.now().date())
+
+
+def kardex_queryset(product, start_date=None, end_date=None):
+    """Movimientos confirmados del rango con `signed_quantity`."""
+    start, end = _bounds(start_date, end_date)
+    movements = InventoryMovement.objects.filter(product=product, draft=False)
+    if start:
+        movements = movements.filter(created_at__gte=start)
+    if end:
+        movements = movements.filter(created_at__lt=end)
+    return movements.annotate(signed_quantity=SIGNED_QUANTITY)
+
+
+def encode_cursor(movement, balance):
+    """Cursor de la página siguiente: la última fila mostrada y el saldo de la fila que le sigue."""
+    return f'{movement.created_at.isoformat()}_{movement.pk}_{balance}'
+
+
+def decode_cursor(cursor):
+    """(created_at, id, saldo) del cursor, o None si no es válido."""
+    try:
+        created_at, pk, balance = (cursor or '').split('_')
+        return datetime.datetime.fromisoformat(created_at), int(pk), Decimal(balance)
+    except (ValueError, InvalidOperation):
+        return None
+
+
+def kardex_page(product, start_date=None, end_date=None, before=None, page_size=PAGE_SIZE):
+    """
+    Una página del Kardex, de la fila más reciente hacia atrás; `before` es el
+    cursor devuelto por la página anterior. Cada fila trae `balance` (saldo
+    tras el movimiento). Devuelve (filas, cursor de la página siguiente o None).
+    """
+    rows = kardex_queryset(product, start_date, end_date)
+    cursor = decode_cursor(before)
+    if cursor:
+        created_at, pk, balance = cursor
+        rows = rows.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, pk__lt=pk))
+    else:
+        balance = closing_balance(product, end_date)
+    rows = list(rows.order_by('-created_at', '-id')[:page_size + 1])
+    for row in rows[:page_size]:
+        row.balance = balance
+        balance -= row.signed_quantity
+    next_cursor = encode_cursor(rows[page_size - 1], balance) if len(rows) > page_size else None
+    return rows[:page_size], next_cursor
+
+
+def kardex_rows(product, start_date=None, end_date=None):
+    """Todas las filas del rango en orden cronológico con su saldo, leídas por bloques (para exportar)."""
+    balance = opening_balance(product, start_date)
+    for row in kardex_queryset(product, start_date, end_date).order_by('created_at', 'id').iterator(chunk_size=2000):
+        balance += row.signed_quantity
+        row.balance = balance
+        yield row
+
+
+EXPORT_HEADERS = ['Fecha', 'Tipo', 'Cantidad', 'Documento', 'Notas', 'Saldo']
+
+
+def export_row(movement):
+    return [
+        movement.created_at.strftime('%d/%m/%Y %H:%M'),
+        movement.get_movement_type_display(),
+        movement.signed_quantity,
+        movement.document_reference or '',
+        movement.notes or '',
+        movement.balance,
+    ]
+
+
+# --- XLSX mínimo (sin dependencias): una hoja, cadenas en línea ---
+
+def _column(index):
+    name = ''
+    index += 1
+    while index:
+        index, rest = divmod(index - 1, 26)
+        name = chr(65 + rest) + name
+    return name
+
+
+def _xlsx_cell(ref, value):
+    if isinstance(value, (int, float)) or hasattr(value, 'as_tuple'):
+        return f'<c r="{ref}"><v>{value}</v></c>'
+    return f'<c r="{ref}" t="inlineStr"><is><t xml:space="preserve">{escape(str(value))}</t></is></c>'
+
+
+def write_xlsx(rows, headers, sheet_name='Kardex'):
+    """
+    Escribe las filas en un .xlsx dentro de un archivo temporal (en disco si
+    crece) y lo devuelve posicionado al inicio, listo para un FileResponse.
+    """
+    output = SpooledTemporaryFile(max_size=5 * 1024 * 1024)
+    with zipfile.ZipFile(output, 'w', zipfile.ZIP_DEFLATED) as xlsx:
+        xlsx.writestr('[Content_Types].xml', (
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+            '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+            '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+            '<Default Extension="xml" ContentType="application/xml"/>'
+            '<Override PartName="/xl/workbook.xml" '
+            'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+            '<Override PartName="/xl/worksheets/sheet1.xml" '
+            'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+            '</Types>'
+        ))
+        xlsx.writestr('_rels/.rels', (
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+            '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+            '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+            'Target="xl/workbook.xml"/></Relationships>'
+        ))
+        xlsx.writestr('xl/workbook.xml', (
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+            '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+            'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+            f'<sheets><sheet name="{escape(sheet_name[:31])}" sheetId="1" r:id="rId1"/></sheets></workbook>'
+        ))
+        xlsx.writestr('xl/_rels/workbook.xml.rels', (
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+            '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+            '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" '
+            'Target="worksheets/sheet1.xml"/></Relationships>'
+        ))
+        # La hoja se escribe fila por fila, sin armarla completa en memoria
+        with xlsx.open('xl/worksheets/sheet1.xml', 'w', force_zip64=True) as sheet:
+            sheet.write(
+                b'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                b'<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>'
+            )
+            for number, row in enumerate(itertools.chain([headers], rows), start=1):
+                cells = ''.join(_xlsx_cell(f'{_column(i)}{number}', value) for i, value in enumerate(row))
+                sheet.write(f'<row r="{number}">{cells}</row>'.encode('utf-8'))
+            sheet.write(b'</sheetData></worksheet>')
+    output.seek(0)
+    return output
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+from inventory.posting import backfill_inventory_status
+
+
+class Command(BaseCommand):
+    help = (
+        'Crea el estado de inventario de los productos que no lo tienen y asienta '
+        'su stock inicial (Product.stock) como movimiento de entrada. '
+        'Ejecutar después de importar productos en bloque.'
+    )
+
+    def handle(self, *args, **options):
+        created = backfill_inventory_status()
+        self.stdout.write(self.style.SUCCESS(f'Se crearon {created} estado(s) de inventario.'))
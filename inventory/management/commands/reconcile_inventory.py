@@ -0,0 +1,48 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from inventory.models import InventoryStatus
+from inventory.posting import ledger_balances, ensure_inventory_status
+from inventory.alerts import detect_crossings
+
+
+class Command(BaseCommand):
+    help = (
+        'Compara el stock de cada producto con la suma de sus movimientos '
+        'confirmados desde el último corte (una consulta agrupada) y lista las '
+        'diferencias. Con --full suma todo el historial; con --fix deja el stock '
+        'igual al de los movimientos.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--fix', action='store_true', help='Corrige los estados que no cuadran.')
+        parser.add_argument('--full', action='store_true', help='Ignora los cortes y suma todo el historial.')
+
+    def handle(self, *args, **options):
+        balances = ledger_balances(full=options['full'])
+        statuses = list(InventoryStatus.objects.select_related('product').only(
+            'pk', 'product_id', 'product__name', 'current_stock'
+        ))
+        mismatched = []
+        for status in statuses:
+            expected = balances.get(status.product_id, 0)
+            if status.current_stock != expected:
+                self.stdout.write(
+                    f'{status.product.name}: stock {status.current_stock}, movimientos {expected}'
+                )
+                status.current_stock = expected
+                mismatched.append(status)
+        missing = set(balances) - {status.product_id for status in statuses}
+        if missing:
+            self.stdout.write(f'{len(missing)} producto(s) con movimientos y sin estado de inventario.')
+
+        if not options['fix']:
+            self.stdout.write(f'{len(mismatched)} diferencia(s). Use --fix para corregirlas.')
+            return
+        with transaction.atomic():
+            InventoryStatus.objects.bulk_update(mismatched, ['current_stock'], batch_size=500)
+            ensure_inventory_status(missing)
+            detect_crossings([status.product_id for status in mismatched] + list(missing))
+        self.stdout.write(self.style.SUCCESS(
+            f'Se corrigieron {len(mismatched)} estado(s) y se crearon {len(missing)}.'
+        ))
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+from inventory.alerts import send_low_stock_digest
+
+
+class Command(BaseCommand):
+    help = (
+        'Deja en la cola de correos un resumen de los productos que cruzaron su '
+        'stock mínimo desde el último aviso (cada cruce se avisa una vez). Pensado '
+        'para ejecutarse periódicamente (cron); el envío lo hace send_queued_emails.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--to', nargs='+', help='Destinatarios. Por defecto, INVENTORY_ALERT_RECIPIENTS o ADMINS.')
+
+    def handle(self, *args, **options):
+        included = send_low_stock_digest(recipients=options['to'])
+        if not included:
+            self.stdout.write('No hay alertas nuevas de stock bajo.')
+            return
+        self.stdout.write(self.style.SUCCESS(f'Resumen en cola con {included} producto(s) bajo el mínimo.'))
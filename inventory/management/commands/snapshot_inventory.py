@@ -0,0 +1,46 @@
+from datetime import datetime, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from inventory.snapshots import take_snapshots
+
+
+class Command(BaseCommand):
+    help = (
+        'Guarda el saldo de cierre de cada producto (cortes diarios o mensuales) en una '
+        'sola pasada agrupada sobre los movimientos. Sin --since completa desde el último '
+        'corte. Pensado para ejecutarse periódicamente (cron), pasada la medianoche.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--period', choices=['day', 'month'], default='day', help='Cortes diarios o de fin de mes.')
+        parser.add_argument('--date', help='Última fecha de cierre (YYYY-MM-DD). Por defecto, ayer o el último fin de mes.')
+        parser.add_argument('--since', help='Primera fecha de cierre a generar (YYYY-MM-DD), para reconstruir cortes pasados.')
+
+    def parse_date(self, value):
+        try:
+            return datetime.strptime(value, '%Y-%m-%d').date()
+        except ValueError:
+            raise CommandError('Formato de fecha inválido, use YYYY-MM-DD.')
+
+    def handle(self, *args, **options):
+        today = timezone.now().date()
+        if options['date']:
+            end_date = self.parse_date(options['date'])
+        elif options['period'] == 'month':
+            end_date = today.replace(day=1) - timedelta(days=1)
+        else:
+            end_date = today - timedelta(days=1)
+        start_date = self.parse_date(options['since']) if options['since'] else None
+
+        try:
+            dates, written = take_snapshots(end_date, period=options['period'], start_date=start_date)
+        except ValueError as e:
+            raise CommandError(str(e))
+        if not dates:
+            self.stdout.write('No hay fechas de cierre pendientes.')
+            return
+        self.stdout.write(self.style.SUCCESS(
+            f'Se guardaron {written} saldo(s) de {len(dates)} corte(s), '
+            f'del {dates[0]:%d/%m/%Y} al {dates[-1]:%d/%m/%Y}.'
+        ))
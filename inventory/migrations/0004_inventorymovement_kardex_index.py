@@ -0,0 +1,17 @@
+# Generated by Django 4.2.20 on 2026-10-18 09:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0003_alter_inventorymovement_table_and_more'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='inventorymovement',
+            index=models.Index(fields=['product', 'draft', 'created_at', 'id'], name='movimiento_kardex_idx'),
+        ),
+    ]
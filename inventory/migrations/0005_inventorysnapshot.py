@@ -0,0 +1,36 @@
+# Generated by Django 4.2.20 on 2026-10-18 09:45
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('services', '0015_service_duration'),
+        ('inventory', '0004_inventorymovement_kardex_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InventorySnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(verbose_name='Fecha de cierre')),
+                ('period', models.CharField(choices=[('day', 'Diario'), ('month', 'Mensual')], default='day', max_length=10, verbose_name='Periodo')),
+                ('closing_stock', models.DecimalField(decimal_places=2, max_digits=12, verbose_name='Saldo de cierre')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Fecha de registro')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='inventory_snapshots', to='services.product')),
+            ],
+            options={
+                'verbose_name': 'Corte de Inventario',
+                'verbose_name_plural': 'Cortes de Inventario',
+                'ordering': ('-date', 'product'),
+                'indexes': [models.Index(fields=['date'], name='corte_fecha_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='inventorysnapshot',
+            constraint=models.UniqueConstraint(fields=('product', 'date'), name='corte_producto_fecha_uniq'),
+        ),
+    ]
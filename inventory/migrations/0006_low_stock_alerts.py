@@ -0,0 +1,68 @@
+# Generated by Django 4.2.20 on 2026-10-18 09:49
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def flag_low_stock(apps, schema_editor):
+    """Marca los productos que ya están bajo el mínimo y les abre su alerta, para el primer resumen."""
+    InventoryStatus = apps.get_model('inventory', 'InventoryStatus')
+    LowStockAlert = apps.get_model('inventory', 'LowStockAlert')
+    low = list(
+        InventoryStatus.objects.filter(current_stock__lt=models.F('product__stock_min'))
+        .values_list('pk', 'product_id', 'current_stock', 'product__stock_min')
+    )
+    InventoryStatus.objects.filter(pk__in=[status_id for status_id, *_rest in low]).update(below_minimum=True)
+    LowStockAlert.objects.bulk_create(
+        [
+            LowStockAlert(product_id=product_id, stock_at_trigger=current_stock, stock_min=stock_min)
+            for _status_id, product_id, current_stock, stock_min in low
+        ],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('services', '0015_service_duration'),
+        ('inventory', '0005_inventorysnapshot'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LowStockAlert',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('stock_at_trigger', models.DecimalField(decimal_places=2, max_digits=10, verbose_name='Stock al cruzar')),
+                ('stock_min', models.DecimalField(decimal_places=2, max_digits=10, verbose_name='Stock mínimo')),
+                ('triggered_at', models.DateTimeField(auto_now_add=True, verbose_name='Fecha de alerta')),
+                ('resolved_at', models.DateTimeField(blank=True, null=True, verbose_name='Fecha de reposición')),
+                ('notified_at', models.DateTimeField(blank=True, null=True, verbose_name='Fecha de aviso')),
+            ],
+            options={
+                'verbose_name': 'Alerta de Stock Bajo',
+                'verbose_name_plural': 'Alertas de Stock Bajo',
+                'ordering': ('-triggered_at',),
+            },
+        ),
+        migrations.AddField(
+            model_name='inventorystatus',
+            name='below_minimum',
+            field=models.BooleanField(default=False, editable=False, help_text='Lo mantiene el registro de movimientos (ver alerts.py)', verbose_name='Bajo mínimo'),
+        ),
+        migrations.AddIndex(
+            model_name='inventorystatus',
+            index=models.Index(fields=['below_minimum', 'current_stock'], name='estado_bajo_minimo_idx'),
+        ),
+        migrations.AddField(
+            model_name='lowstockalert',
+            name='product',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='low_stock_alerts', to='services.product'),
+        ),
+        migrations.AddIndex(
+            model_name='lowstockalert',
+            index=models.Index(fields=['resolved_at', 'notified_at'], name='alerta_pendiente_idx'),
+        ),
+        migrations.RunPython(flag_low_stock, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,64 @@
+from django.db import migrations
+from django.db.models import Min, Q, Sum
+
+OPENING_REFERENCE = 'SALDO-INICIAL'
+
+
+def record_opening_stock(apps, schema_editor):
+    """
+    El estado de inventario se sembraba con Product.stock sin asentarlo en el
+    libro. Se registra esa diferencia (stock actual menos la suma de los
+    movimientos confirmados) como movimiento inicial, fechado antes del primer
+    movimiento del producto, y se borran los cortes, que no la incluían.
+    """
+    InventoryStatus = apps.get_model('inventory', 'InventoryStatus')
+    InventoryMovement = apps.get_model('inventory', 'InventoryMovement')
+    InventorySnapshot = apps.get_model('inventory', 'InventorySnapshot')
+
+    ledger = {
+        product_id: (balance, first)
+        for product_id, balance, first in InventoryMovement.objects.filter(draft=False)
+        .values('product_id')
+        .annotate(
+            balance=Sum('quantity', filter=Q(movement_type='entrada'), default=0)
+            - Sum('quantity', filter=Q(movement_type='salida'), default=0),
+            first=Min('created_at'),
+        )
+        .values_list('product_id', 'balance', 'first')
+    }
+    openings = []
+    for product_id, current_stock, product_created in InventoryStatus.objects.values_list(
+        'product_id', 'current_stock', 'product__created_at'
+    ):
+        balance, first = ledger.get(product_id, (0, None))
+        difference = current_stock - balance
+        if not difference:
+            continue
+        openings.append((
+            InventoryMovement(
+                product_id=product_id, quantity=abs(difference),
+                movement_type='entrada' if difference > 0 else 'salida',
+                document_reference=OPENING_REFERENCE, notes='Stock inicial del producto', draft=False,
+            ),
+            min(filter(None, [first, product_created])),
+        ))
+    if not openings:
+        return
+    InventoryMovement.objects.bulk_create([movement for movement, _date in openings], batch_size=500)
+    # created_at es auto_now_add: la fecha del saldo inicial se fija después
+    for movement, date in openings:
+        InventoryMovement.objects.filter(
+            product_id=movement.product_id, document_reference=OPENING_REFERENCE
+        ).update(created_at=date)
+    InventorySnapshot.objects.all().delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0006_low_stock_alerts'),
+    ]
+
+    operations = [
+        migrations.RunPython(record_opening_stock, migrations.RunPython.noop),
+    ]
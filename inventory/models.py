@@ -1,18 +1,31 @@
 # models.py
 from django.db import models
 from django.utils.translation import gettext_lazy as _
-from django.db.models import Sum
+from django.db.models import Q, Sum
 from services.models import Product
 
+# Saldo de un conjunto de movimientos: entradas menos salidas
+LEDGER_BALANCE = (
+    Sum('quantity', filter=Q(movement_type='entrada'), default=0)
+    - Sum('quantity', filter=Q(movement_type='salida'), default=0)
+)
+
+
 class InventoryStatus(models.Model):
     """Modelo para mantener el estado actual del inventario"""
     product = models.OneToOneField(Product, on_delete=models.CASCADE, related_name='inventory_status')
     current_stock = models.DecimalField(_('Stock Actual'), max_digits=10, decimal_places=2, default=0)
+    below_minimum = models.BooleanField(_('Bajo mínimo'), default=False, editable=False,
+                                        help_text=_('Lo mantiene el registro de movimientos (ver alerts.py)'))
     last_updated = models.DateTimeField(_('Última Actualización'), auto_now=True)
     
     class Meta:
         verbose_name = _('Estado de Inventario')
         verbose_name_plural = _('Estados de Inventario')
+        indexes = [
+            # Tablero: productos actualmente bajo el mínimo
+            models.Index(fields=['below_minimum', 'current_stock'], name='estado_bajo_minimo_idx'),
+        ]
     
     def __str__(self):
         return f"Inventario de {self.product.name}: {self.current_stock} {self.product.unit}"
@@ -22,24 +35,18 @@ class InventoryStatus(models.Model):
         return self.current_stock < self.product.stock_min
     
     def update_stock(self):
-        """Actualiza el stock basado en los movimientos de inventario"""
-        # Calcular entradas (excluyendo borradores)
-        entradas = InventoryMovement.objects.filter(
-            product=self.product,
-            movement_type='entrada',
-            draft=False
-        ).aggregate(total=Sum('quantity'))['total'] or 0
-        
-        # Calcular salidas (excluyendo borradores)
-        salidas = InventoryMovement.objects.filter(
-            product=self.product,
-            movement_type='salida',
-            draft=False
-        ).aggregate(total=Sum('quantity'))['total'] or 0
-        
-        # Actualizar stock
-        self.current_stock = entradas - salidas
+        """
+        Recalcula el stock desde todos los movimientos confirmados. Las señales
+        ya lo mantienen al día con deltas; esto queda para corregir a mano
+        (ver también el comando reconcile_inventory).
+        """
+        from .alerts import detect_crossings
+
+        self.current_stock = InventoryMovement.objects.filter(
+            product_id=self.product_id, draft=False
+        ).aggregate(balance=LEDGER_BALANCE)['balance']
         self.save()
+        detect_crossings([self.product_id])
         
         return self.current_stock
 
@@ -63,9 +70,84 @@ class InventoryMovement(models.Model):
     class Meta:
         verbose_name = _('Movimiento de Inventario')
         verbose_name_plural = _('Movimientos de Inventario')
+        indexes = [
+            # Kardex: movimientos confirmados de un producto en orden cronológico
+            models.Index(fields=['product', 'draft', 'created_at', 'id'], name='movimiento_kardex_idx'),
+        ]
     
     def __str__(self):
         return f"{self.get_movement_type_display()} de {self.quantity} de {self.product.name}"
+    
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Efecto del movimiento sobre el stock tal como está en la BD (para aplicar solo la diferencia)
+        if {'product_id', 'quantity', 'movement_type', 'draft'} <= set(field_names):
+            instance._stored_effect = instance.stock_effect()
+        return instance
+    
+    def stock_effect(self):
+        """(producto, cantidad con signo) que este movimiento aporta al stock; 0 si es borrador."""
+        if self.draft:
+            return self.product_id, 0
+        return self.product_id, self.quantity if self.movement_type == 'entrada' else -self.quantity
+
+
+class InventorySnapshot(models.Model):
+    """
+    Saldo de cierre de un producto al final de un día (o de un mes). Cada corte
+    guarda una fila por producto con historial, así el saldo a una fecha es el
+    último corte anterior más los movimientos posteriores (ver snapshots.py).
+    """
+    PERIOD_CHOICES = (
+        ('day', _('Diario')),
+        ('month', _('Mensual')),
+    )
+    
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='inventory_snapshots')
+    date = models.DateField(_('Fecha de cierre'))
+    period = models.CharField(_('Periodo'), max_length=10, choices=PERIOD_CHOICES, default='day')
+    closing_stock = models.DecimalField(_('Saldo de cierre'), max_digits=12, decimal_places=2)
+    created_at = models.DateTimeField(_('Fecha de registro'), auto_now_add=True)
+    
+    class Meta:
+        verbose_name = _('Corte de Inventario')
+        verbose_name_plural = _('Cortes de Inventario')
+        ordering = ('-date', 'product')
+        constraints = [
+            models.UniqueConstraint(fields=['product', 'date'], name='corte_producto_fecha_uniq'),
+        ]
+        indexes = [
+            models.Index(fields=['date'], name='corte_fecha_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.product.name} al {self.date:%d/%m/%Y}: {self.closing_stock}"
+
+
+class LowStockAlert(models.Model):
+    """
+    Cruce del stock de un producto por debajo de su mínimo. Se crea una sola
+    vez por cruce y se cierra cuando el stock vuelve al mínimo; el resumen
+    periódico (comando send_low_stock_digest) avisa de las abiertas no notificadas.
+    """
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='low_stock_alerts')
+    stock_at_trigger = models.DecimalField(_('Stock al cruzar'), max_digits=10, decimal_places=2)
+    stock_min = models.DecimalField(_('Stock mínimo'), max_digits=10, decimal_places=2)
+    triggered_at = models.DateTimeField(_('Fecha de alerta'), auto_now_add=True)
+    resolved_at = models.DateTimeField(_('Fecha de reposición'), null=True, blank=True)
+    notified_at = models.DateTimeField(_('Fecha de aviso'), null=True, blank=True)
+    
+    class Meta:
+        verbose_name = _('Alerta de Stock Bajo')
+        verbose_name_plural = _('Alertas de Stock Bajo')
+        ordering = ('-triggered_at',)
+        indexes = [
+            models.Index(fields=['resolved_at', 'notified_at'], name='alerta_pendiente_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.product.name}: {self.stock_at_trigger} (mínimo {self.stock_min})"
 
 
 # admin.py
@@ -198,41 +280,6 @@ from django.contrib.admin.views.decorators import staff_member_required
 # Implementaremos vistas básicas primero
 
 
-# signals.py
-from django.db.models.signals import post_save, post_delete
-from django.dispatch import receiver
-from services.models import Product
-from .models import InventoryMovement, InventoryStatus
-
-@receiver(post_save, sender=Product)
-def create_inventory_status(sender, instance, created, **kwargs):
-    """Crea un estado de inventario cuando se crea un nuevo producto"""
-    if created:
-        InventoryStatus.objects.get_or_create(
-            product=instance,
-            defaults={'current_stock': instance.stock}
-        )
-
-@receiver(post_save, sender=InventoryMovement)
-def update_inventory_after_movement(sender, instance, **kwargs):
-    """Actualiza el inventario después de un movimiento, si no es borrador"""
-    if not instance.draft:
-        inventory, created = InventoryStatus.objects.get_or_create(
-            product=instance.product,
-            defaults={'current_stock': 0}
-        )
-        inventory.update_stock()
-
-@receiver(post_delete, sender=InventoryMovement)
-def update_inventory_after_movement_delete(sender, instance, **kwargs):
-    """Actualiza el inventario después de eliminar un movimiento"""
-    try:
-        inventory = InventoryStatus.objects.get(product=instance.product)
-        inventory.update_stock()
-    except InventoryStatus.DoesNotExist:
-        pass
-
-
 # apps.py
 from django.apps import AppConfig
 from django.utils.translation import gettext_lazy as _
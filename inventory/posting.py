@@ -0,0 +1,213 @@
+# inventory/posting.py
+"""
+Registro de movimientos de inventario y mantenimiento del stock.
+
+El stock de un producto es siempre la suma de sus movimientos confirmados: el
+stock inicial que se carga en Product.stock entra al libro como un movimiento
+de entrada (SALDO-INICIAL), así los cortes, el Kardex, reconcile_inventory y
+update_stock cuentan lo mismo que InventoryStatus.
+
+El stock de InventoryStatus se mantiene con deltas: cada alta, cambio o baja
+de un movimiento suma su diferencia con un UPDATE current_stock =
+current_stock + delta, en vez de recalcular todo el historial del producto.
+Para varias boletas o productos a la vez los movimientos se insertan con un
+bulk_create y un UPDATE por producto, todo en una transacción. Tras cada
+cambio se revisa el cruce del stock mínimo de los productos tocados (alerts.py).
+"""
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import F, Min
+from django.utils import timezone
+
+from services.models import Product
+from .models import LEDGER_BALANCE, InventoryMovement, InventoryStatus
+from .snapshots import balances_as_of, invalidate_snapshots
+from .alerts import detect_crossings
+
+OPENING_REFERENCE = 'SALDO-INICIAL'
+
+
+def signed_quantity(movement_type, quantity):
+    return quantity if movement_type == 'entrada' else -quantity
+
+
+def ledger_balances(product_ids=None, full=False):
+    """
+    {product_id: saldo} de los movimientos confirmados: desde el último corte
+    (ver snapshots.py) o, con full=True, desde todo el historial en una consulta agrupada.
+    """
+    if not full:
+        return balances_as_of(product_ids=product_ids)
+    movements = InventoryMovement.objects.filter(draft=False)
+    if product_ids is not None:
+        movements = movements.filter(product_id__in=product_ids)
+    return dict(
+        movements.values('product_id').annotate(balance=LEDGER_BALANCE).values_list('product_id', 'balance')
+    )
+
+
+def ensure_inventory_status(product_ids):
+    """
+    Crea el InventoryStatus que falte, con el saldo de sus movimientos
+    confirmados (una consulta agrupada y un bulk_create).
+    """
+    product_ids = set(product_ids)
+    missing = product_ids - set(
+        InventoryStatus.objects.filter(product_id__in=product_ids).values_list('product_id', flat=True)
+    )
+    if not missing:
+        return
+    balances = ledger_balances(product_ids=missing)
+    InventoryStatus.objects.bulk_create(
+        [InventoryStatus(product_id=product_id, current_stock=balances.get(product_id, 0)) for product_id in missing],
+        ignore_conflicts=True,
+    )
+
+
+def post_opening_stock(opening):
+    """
+    Registra el stock inicial {product_id: Product.stock} de productos sin
+    estado como un movimiento de entrada confirmado y crea su estado desde el
+    libro (un bulk_create de movimientos y un UPDATE por producto con stock).
+    """
+    with transaction.atomic():
+        ensure_inventory_status(opening)
+        post_movements([
+            InventoryMovement(
+                product_id=product_id, quantity=stock, movement_type='entrada',
+                document_reference=OPENING_REFERENCE, notes='Stock inicial del producto', draft=False,
+            )
+            for product_id, stock in opening.items() if stock > 0
+        ])
+        detect_crossings(list(opening))
+
+
+def backfill_inventory_status():
+    """
+    Crea el estado de inventario de los productos que no lo tienen (p. ej. tras
+    una importación con bulk_create, que no dispara la señal de Product), con
+    su stock inicial asentado en el libro. Devuelve cuántos faltaban.
+    """
+    missing = dict(Product.objects.filter(inventory_status__isnull=True).values_list('pk', 'stock'))
+    post_opening_stock(missing)
+    return len(missing)
+
+
+def apply_stock_deltas(deltas):
+    """
+    Suma {product_id: delta} al stock actual con un UPDATE atómico por producto
+    y revisa si alguno cruzó su mínimo (una consulta por lote, ver alerts.py).
+    """
+    now = timezone.now()
+    changed = [product_id for product_id, delta in deltas.items() if delta]
+    for product_id in changed:
+        InventoryStatus.objects.filter(product_id=product_id).update(
+            current_stock=F('current_stock') + deltas[product_id], last_updated=now,
+        )
+    detect_crossings(changed)
+
+
+def apply_movement_change(before, after):
+    """
+    Aplica al stock la diferencia entre dos efectos (producto, cantidad con
+    signo) de un mismo movimiento: alta, baja, cambio de cantidad o de tipo,
+    paso borrador <-> confirmado o cambio de producto.
+    """
+    deltas = defaultdict(int)
+    if before and before[0] is not None:
+        deltas[before[0]] -= before[1]
+    if after and after[0] is not None:
+        deltas[after[0]] += after[1]
+    changed = [product_id for product_id, delta in deltas.items() if delta]
+    for product_id in changed:
+        updated = InventoryStatus.objects.filter(product_id=product_id).update(
+            current_stock=F('current_stock') + deltas[product_id], last_updated=timezone.now(),
+        )
+        if not updated and after is not None:
+            # Sin estado todavía: se crea desde el libro, que ya incluye este cambio.
+            # En una baja no: puede ser el borrado en cascada del propio producto
+            ensure_inventory_status([product_id])
+    detect_crossings(changed)
+
+
+def set_movements_draft(queryset, draft):
+    """
+    Marca movimientos como borrador (o los confirma) en bloque y ajusta el
+    stock de sus productos con un UPDATE por producto. Devuelve cuántos cambiaron.
+    """
+    with transaction.atomic():
+        ids = list(queryset.filter(draft=not draft).select_for_update().values_list('pk', flat=True))
+        if not ids:
+            return 0
+        grouped = list(
+            InventoryMovement.objects.filter(pk__in=ids)
+            .values('product_id').annotate(balance=LEDGER_BALANCE, since=Min('created_at'))
+            .values_list('product_id', 'balance', 'since')
+        )
+        balances = {product_id: balance for product_id, balance, _since in grouped}
+        # Movimientos de días ya cortados: esos cortes dejan de valer
+        invalidate_snapshots(min(since for _product_id, _balance, since in grouped).date())
+        if not draft:
+            ensure_inventory_status(balances)
+        InventoryMovement.objects.filter(pk__in=ids).update(draft=draft)
+        apply_stock_deltas({
+            product_id: -balance if draft else balance for product_id, balance in balances.items()
+        })
+    return len(ids)
+
+
+def post_movements(movements):
+    """Inserta movimientos confirmados y ajusta el stock de sus productos. Devuelve los creados."""
+    if not movements:
+        return []
+    deltas = defaultdict(int)
+    for movement in movements:
+        if not movement.draft:
+            deltas[movement.product_id] += signed_quantity(movement.movement_type, movement.quantity)
+    with transaction.atomic():
+        # Antes del insert: el saldo inicial de un estado nuevo no debe incluir estos movimientos
+        ensure_inventory_status(deltas)
+        created = InventoryMovement.objects.bulk_create(movements)
+        apply_stock_deltas(deltas)
+    return created
+
+
+def post_invoice_inventory(invoices):
+    """
+    Descuenta del inventario los productos de las boletas pagadas que aún no
+    se procesaron. Devuelve cuántas boletas se procesaron.
+    """
+    from invoices.models import Invoice, InvoiceItem
+
+    invoice_ids = [invoice.pk for invoice in invoices]
+    with transaction.atomic():
+        # Bloquear las boletas evita que dos procesos descuenten la misma dos veces
+        pending = list(
+            Invoice.objects.select_for_update()
+            .filter(pk__in=invoice_ids, inventory_processed=False)
+            .values_list('pk', flat=True)
+        )
+        if not pending:
+            return 0
+        items = InvoiceItem.objects.filter(
+            invoice_id__in=pending, item_type='product', product__isnull=False
+        ).select_related('invoice')
+        post_movements([
+            InventoryMovement(
+                product_id=item.product_id,
+                quantity=item.quantity,
+                movement_type='salida',
+                document_reference=f"{item.invoice.series}-{item.invoice.number or '(borrador)'}",
+                invoice_item=item,
+                notes=f"Venta de producto en {item.invoice.invoice_type} - Boleta pagada",
+                draft=False,  # Movimiento confirmado
+            )
+            for item in items
+        ])
+        Invoice.objects.filter(pk__in=pending).update(inventory_processed=True, updated_at=timezone.now())
+
+    for invoice in invoices:
+        if invoice.pk in pending:
+            invoice.inventory_processed = True
+    return len(pending)
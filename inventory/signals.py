@@ -2,31 +2,50 @@ from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
 from services.models import Product
 from .models import InventoryMovement, InventoryStatus
+from .posting import apply_movement_change, post_opening_stock
+from .snapshots import invalidate_snapshots
+from .alerts import detect_crossings
 
 @receiver(post_save, sender=Product)
 def create_inventory_status(sender, instance, created, **kwargs):
     """Crea un estado de inventario cuando se crea un nuevo producto"""
     if created:
-        InventoryStatus.objects.get_or_create(
-            product=instance,
-            defaults={'current_stock': instance.stock}
-        )
+        # El stock inicial entra al libro como movimiento (ver posting.py)
+        post_opening_stock({instance.pk: instance.stock})
+    elif instance.stock_min != getattr(instance, '_loaded_stock_min', None) and (
+        kwargs.get('update_fields') is None or 'stock_min' in kwargs['update_fields']
+    ):
+        # Solo un cambio de stock mínimo puede cruzar el umbral sin mover el stock
+        detect_crossings([instance.pk])
+    instance._loaded_stock_min = instance.stock_min
 
 @receiver(post_save, sender=InventoryMovement)
-def update_inventory_after_movement(sender, instance, **kwargs):
-    """Actualiza el inventario después de un movimiento, si no es borrador"""
-    if not instance.draft:
-        inventory, created = InventoryStatus.objects.get_or_create(
-            product=instance.product,
-            defaults={'current_stock': 0}
-        )
+def update_inventory_after_movement(sender, instance, created, **kwargs):
+    """Aplica al stock solo la diferencia del movimiento (alta, edición o confirmación)"""
+    before = None if created else getattr(instance, '_stored_effect', None)
+    if before is None and not created:
+        # Instancia que no vino de la BD: no se sabe qué había, se recalcula el producto
+        inventory, _created = InventoryStatus.objects.get_or_create(product_id=instance.product_id)
         inventory.update_stock()
+    else:
+        apply_movement_change(before, instance.stock_effect())
+    if not created and before != instance.stock_effect():
+        # Cambió un movimiento ya registrado: los cortes desde su día quedan desactualizados
+        invalidate_snapshots(instance.created_at.date())
+    instance._stored_effect = instance.stock_effect()
 
 @receiver(post_delete, sender=InventoryMovement)
-def update_inventory_after_movement_delete(sender, instance, **kwargs):
-    """Actualiza el inventario después de eliminar un movimiento"""
-    try:
-        inventory = InventoryStatus.objects.get(product=instance.product)
-        inventory.update_stock()
-    except InventoryStatus.DoesNotExist:
-        pass
\ No newline at end of file
+def update_inventory_after_movement_delete(sender, instance, origin=None, **kwargs):
+    """Resta del stock lo que aportaba el movimiento eliminado"""
+    if _deleting_products(origin):
+        # Borrado en cascada del producto: su estado, alertas y cortes se van con él
+        return
+    effect = getattr(instance, '_stored_effect', None) or instance.stock_effect()
+    apply_movement_change(effect, None)
+    if effect[1]:
+        invalidate_snapshots(instance.created_at.date())
+
+
+def _deleting_products(origin):
+    """True si el borrado empezó en un producto (instancia o queryset de Product)."""
+    return isinstance(origin, Product) or getattr(origin, 'model', None) is Product
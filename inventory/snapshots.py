@@ -0,0 +1,173 @@
+# inventory/snapshots.py
+"""
+Cortes de inventario: saldo de cierre por producto al final de un día o mes.
+
+Cada corte guarda una fila por cada producto con historial hasta esa fecha, así
+el saldo de un producto a cualquier fecha D es su último corte <= D más los
+movimientos confirmados posteriores, sin recorrer todo el historial. Los cortes
+solo se toman de días ya cerrados; si luego cambia un movimiento de un día ya
+cortado (p. ej. se confirma un borrador antiguo), se borran los cortes desde
+ese día y el siguiente corte los vuelve a generar.
+"""
+import datetime
+
+from django.db import transaction
+from django.db.models import Max
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import LEDGER_BALANCE, InventoryMovement, InventorySnapshot
+
+BATCH_SIZE = 1000
+
+
+def day_end(date):
+    """Inicio del día siguiente: los movimientos del día son los created_at < day_end(date)."""
+    return datetime.datetime.combine(date + datetime.timedelta(days=1), datetime.time.min)
+
+
+def month_end(date):
+    next_month = date.replace(day=28) + datetime.timedelta(days=4)
+    return next_month - datetime.timedelta(days=next_month.day)
+
+
+def closing_dates(start_date, end_date, period='day'):
+    """Fechas de cierre entre start_date y end_date: cada día, o cada fin de mes."""
+    if period == 'month':
+        dates = []
+        current = month_end(start_date)
+        while current <= end_date:
+            dates.append(current)
+            current = month_end(current + datetime.timedelta(days=1))
+        return dates
+    return [start_date + datetime.timedelta(days=n) for n in range((end_date - start_date).days + 1)]
+
+
+def latest_snapshot_date(until=None):
+    snapshots = InventorySnapshot.objects.all()
+    if until:
+        snapshots = snapshots.filter(date__lte=until)
+    return snapshots.aggregate(date=Max('date'))['date']
+
+
+def take_snapshots(end_date, period='day', start_date=None):
+    """
+    Genera los cortes de las fechas de cierre hasta end_date (por defecto desde
+    el día siguiente al último corte) en una sola pasada agrupada: parte del
+    corte anterior y suma los movimientos agrupados por día y producto.
+    Devuelve (fechas de cierre, filas escritas).
+    """
+    if end_date >= timezone.now().date():
+        raise ValueError('Solo se pueden cortar días ya cerrados.')
+    if start_date is None:
+        last = latest_snapshot_date()
+        start_date = last + datetime.timedelta(days=1) if last else end_date
+    dates = closing_dates(start_date, end_date, period)
+    if not dates:
+        return [], 0
+
+    base_date = latest_snapshot_date(until=dates[0] - datetime.timedelta(days=1))
+    movements = InventoryMovement.objects.filter(draft=False, created_at__lt=day_end(dates[-1]))
+    running = {}
+    if base_date:
+        running.update(
+            InventorySnapshot.objects.filter(date=base_date).values_list('product_id', 'closing_stock')
+        )
+        movements = movements.filter(created_at__gte=day_end(base_date))
+    daily = (
+        movements.annotate(day=TruncDate('created_at'))
+        .values('day', 'product_id').annotate(delta=LEDGER_BALANCE).order_by('day')
+    )
+
+    written = 0
+    pending = []
+
+    def flush():
+        nonlocal written
+        InventorySnapshot.objects.bulk_create(
+            pending, batch_size=BATCH_SIZE, update_conflicts=True,
+            unique_fields=['product', 'date'], update_fields=['closing_stock', 'period'],
+        )
+        written += len(pending)
+        pending.clear()
+
+    def close(date):
+        pending.extend(
+            InventorySnapshot(product_id=product_id, date=date, period=period, closing_stock=balance)
+            for product_id, balance in running.items()
+        )
+        if len(pending) >= BATCH_SIZE:
+            flush()
+
+    with transaction.atomic():
+        remaining = iter(dates)
+        current = next(remaining)
+        for row in daily.iterator():
+            while current is not None and row['day'] > current:
+                close(current)
+                current = next(remaining, None)
+            running[row['product_id']] = running.get(row['product_id'], 0) + row['delta']
+        while current is not None:
+            close(current)
+            current = next(remaining, None)
+        flush()
+    return dates, written
+
+
+def invalidate_snapshots(since_date):
+    """Borra los cortes desde since_date (un movimiento de ese día cambió después del corte)."""
+    if since_date < timezone.now().date():
+        InventorySnapshot.objects.filter(date__gte=since_date).delete()
+
+
+def balances_as_of(as_of=None, product_ids=None):
+    """
+    {product_id: saldo} al cierre de as_of (o al momento si es None): el último
+    corte más una consulta agrupada de los movimientos posteriores.
+    """
+    base_date = latest_snapshot_date(until=as_of)
+    movements = InventoryMovement.objects.filter(draft=False)
+    snapshots = InventorySnapshot.objects.filter(date=base_date)
+    if as_of:
+        movements = movements.filter(created_at__lt=day_end(as_of))
+    if product_ids is not None:
+        movements = movements.filter(product_id__in=product_ids)
+        snapshots = snapshots.filter(product_id__in=product_ids)
+    balances = {}
+    if base_date:
+        balances.update(snapshots.values_list('product_id', 'closing_stock'))
+        movements = movements.filter(created_at__gte=day_end(base_date))
+    for product_id, delta in movements.values('product_id').annotate(delta=LEDGER_BALANCE).values_list('product_id', 'delta'):
+        balances[product_id] = balances.get(product_id, 0) + delta
+    return balances
+
+
+def _since_snapshot(product_id, as_of):
+    """Último corte del producto hasta as_of y los movimientos confirmados posteriores."""
+    snapshot = InventorySnapshot.objects.filter(product_id=product_id, date__lte=as_of).order_by('-date').first()
+    movements = InventoryMovement.objects.filter(product_id=product_id, draft=False, created_at__lt=day_end(as_of))
+    if snapshot:
+        movements = movements.filter(created_at__gte=day_end(snapshot.date))
+    return snapshot, movements
+
+
+def balance_as_of(product_id, as_of):
+    """Saldo de un producto al cierre de as_of."""
+    snapshot, movements = _since_snapshot(product_id, as_of)
+    opening = snapshot.closing_stock if snapshot else 0
+    return opening + movements.aggregate(balance=LEDGER_BALANCE)['balance']
+
+
+def stock_as_of(product_id, as_of):
+    """
+    Stock de un producto al cierre de as_of: el corte más cercano, los
+    movimientos desde ese corte y el saldo resultante.
+    """
+    snapshot, movements = _since_snapshot(product_id, as_of)
+    movements = list(movements.order_by('created_at', 'id'))
+    opening = snapshot.closing_stock if snapshot else 0
+    return {
+        'snapshot': snapshot,
+        'movements': movements,
+        'stock': opening + sum(movement.stock_effect()[1] for movement in movements),
+    }
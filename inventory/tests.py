@@ -1,3 +1,358 @@
-from django.test import TestCase
+import datetime
+import io
+import zipfile
+from decimal import Decimal
+from io import StringIO
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from appointments.models import OutboundEmail
+from invoices.models import Invoice, InvoiceItem
+from services.models import Product
+from .alerts import detect_crossings, send_low_stock_digest
+from .kardex import EXPORT_HEADERS, kardex_page, kardex_rows, opening_balance
+from .models import InventoryMovement, InventorySnapshot, InventoryStatus, LowStockAlert
+from .posting import (
+    OPENING_REFERENCE, backfill_inventory_status, ledger_balances, post_movements, set_movements_draft,
+)
+from .snapshots import balances_as_of, stock_as_of, take_snapshots
+
+
+def make_product(name='Globos', stock=10, stock_min=0):
+    return Product.objects.create(
+        name=name, price_per_unit=Decimal('5.00'), unit='u', stock=stock, stock_min=Decimal(stock_min),
+    )
+
+
+def current_stock(product):
+    return InventoryStatus.objects.get(product=product).current_stock
+
+
+class OpeningStockTests(TestCase):
+    """El stock inicial del producto entra al libro: estado y movimientos siempre cuadran."""
+
+    def test_new_product_posts_its_opening_stock(self):
+        product = make_product(stock=10)
+        opening = InventoryMovement.objects.get(product=product)
+        self.assertEqual((opening.movement_type, opening.quantity), ('entrada', Decimal('10.00')))
+        self.assertEqual(opening.document_reference, OPENING_REFERENCE)
+        self.assertEqual(current_stock(product), Decimal('10.00'))
+        self.assertEqual(ledger_balances(full=True), {product.pk: Decimal('10.00')})
+
+    def test_product_without_stock_has_no_movement(self):
+        product = make_product(stock=0)
+        self.assertFalse(InventoryMovement.objects.exists())
+        self.assertEqual(current_stock(product), 0)
+
+    def test_backfill_posts_opening_stock(self):
+        Product.objects.bulk_create([
+            Product(name='Importado', slug='importado', price_per_unit=Decimal('5.00'), unit='u', stock=4),
+            Product(name='Sin stock', slug='sin-stock', price_per_unit=Decimal('5.00'), unit='u', stock=0),
+        ])
+        self.assertEqual(backfill_inventory_status(), 2)
+        stocks = dict(InventoryStatus.objects.values_list('product__name', 'current_stock'))
+        self.assertEqual(stocks, {'Importado': Decimal('4.00'), 'Sin stock': Decimal('0.00')})
+        self.assertEqual(backfill_inventory_status(), 0)
+
+    def test_reconcile_reports_no_drift_after_posting(self):
+        first, second = make_product('Globos', stock=10), make_product('Cintas', stock=3)
+        post_movements([
+            InventoryMovement(product=first, movement_type='salida', quantity=4),
+            InventoryMovement(product=second, movement_type='entrada', quantity=2),
+        ])
+        InventoryMovement.objects.create(product=first, movement_type='salida', quantity=1)
+        InventoryMovement.objects.create(product=second, movement_type='salida', quantity=1, draft=True)
+
+        for full in (False, True):
+            out = StringIO()
+            call_command('reconcile_inventory', full=full, stdout=out)
+            self.assertIn('0 diferencia(s)', out.getvalue())
+
+        # Recalcular desde el libro (acción del admin) no borra el stock inicial
+        status = InventoryStatus.objects.get(product=first)
+        self.assertEqual(status.update_stock(), Decimal('5.00'))
+        self.assertEqual(current_stock(second), Decimal('5.00'))
+
+
+class ProductDeletionTests(TestCase):
+    """Borrar un producto se lleva su libro sin recrear su estado ni tocar a los demás."""
+
+    def test_delete_product_with_confirmed_movements(self):
+        product, other = make_product('Globos', stock=10, stock_min=5), make_product('Cintas', stock=3)
+        InventoryMovement.objects.create(product=product, movement_type='salida', quantity=2)
+        InventoryMovement.objects.create(product=product, movement_type='entrada', quantity=4, draft=True)
+        InventoryMovement.objects.filter(product=other).update(created_at=datetime.datetime(2025, 3, 1, 12))
+        take_snapshots(datetime.date(2025, 3, 2), start_date=datetime.date(2025, 3, 1))
+
+        product.delete()
+
+        self.assertFalse(InventoryMovement.objects.filter(product_id=product.pk).exists())
+        self.assertFalse(InventoryStatus.objects.filter(product_id=product.pk).exists())
+        self.assertFalse(LowStockAlert.objects.exists())
+        self.assertEqual(current_stock(other), Decimal('3.00'))
+        self.assertEqual(InventorySnapshot.objects.filter(product=other).count(), 2)
+
+        # Igual desde un queryset (acción de borrado del admin)
+        InventoryMovement.objects.create(product=other, movement_type='salida', quantity=1)
+        Product.objects.filter(pk=other.pk).delete()
+        self.assertFalse(InventoryStatus.objects.exists())
+
+    def test_deleting_a_movement_without_status_does_not_create_it(self):
+        product = make_product(stock=5)
+        InventoryStatus.objects.filter(product=product).delete()
+        InventoryMovement.objects.get(product=product).delete()
+        self.assertFalse(InventoryStatus.objects.filter(product=product).exists())
+
+
+class KardexTests(TestCase):
+    """Kardex: páginas por keyset con el saldo en el cursor, saldo de apertura y exportación."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.product = make_product(stock=0)
+        # Dos movimientos por día del 1 al 4 de marzo: +10, -1, +10, -1...
+        base = datetime.datetime(2025, 3, 1, 9)
+        for day in range(4):
+            for hour, (movement_type, quantity) in enumerate((('entrada', 10), ('salida', 1))):
+                movement = InventoryMovement.objects.create(
+                    product=cls.product, movement_type=movement_type, quantity=quantity,
+                    document_reference=f'D{day}{hour}',
+                )
+                InventoryMovement.objects.filter(pk=movement.pk).update(
+                    created_at=base + datetime.timedelta(days=day, hours=hour)
+                )
+        InventoryMovement.objects.create(product=cls.product, movement_type='entrada', quantity=50, draft=True)
+
+    def all_pages(self, **kwargs):
+        rows, cursor, pages = [], None, 0
+        while True:
+            page, cursor = kardex_page(self.product, before=cursor, page_size=3, **kwargs)
+            rows.extend((row.document_reference, row.balance) for row in page)
+            pages += 1
+            if not cursor:
+                return rows, pages
+
+    def test_pages_carry_the_balance(self):
+        rows, pages = self.all_pages()
+        self.assertEqual(pages, 3)
+        self.assertEqual(rows[0], ('D31', Decimal('36.00')))
+        self.assertEqual(rows[-1], ('D00', Decimal('10.00')))
+        # Las mismas filas y saldos que el recorrido cronológico de la exportación
+        chronological = [(row.document_reference, row.balance) for row in kardex_rows(self.product)]
+        self.assertEqual(rows, chronological[::-1])
+
+    def test_next_page_is_one_query(self):
+        _page, cursor = kardex_page(self.product, page_size=3)
+        with self.assertNumQueries(1):
+            page, _cursor = kardex_page(self.product, before=cursor, page_size=3)
+        self.assertEqual(page[0].document_reference, 'D20')
+
+    def test_range_uses_opening_and_closing_balance(self):
+        start, end = datetime.date(2025, 3, 2), datetime.date(2025, 3, 3)
+        self.assertEqual(opening_balance(self.product, start), Decimal('9.00'))
+        rows, _pages = self.all_pages(start_date=start, end_date=end)
+        self.assertEqual(rows, [('D21', Decimal('27.00')), ('D20', Decimal('28.00')),
+                                ('D11', Decimal('18.00')), ('D10', Decimal('19.00'))])
+        exported = [(row.document_reference, row.balance) for row in kardex_rows(self.product, start, end)]
+        self.assertEqual(exported, rows[::-1])
+
+    def test_invalid_cursor_starts_over(self):
+        first, _cursor = kardex_page(self.product, page_size=3)
+        again, _cursor = kardex_page(self.product, before='no-es-un-cursor', page_size=3)
+        self.assertEqual([row.pk for row in again], [row.pk for row in first])
+
+    def login(self):
+        admin = get_user_model().objects.create_superuser('admin', 'admin@example.com', 'x')
+        self.client.force_login(admin)
+
+    def test_history_view_follows_the_cursor(self):
+        self.login()
+        url = reverse('admin:inventory_inventorystatus_product_kardex', args=[self.product.pk])
+        _page, cursor = kardex_page(self.product)
+        self.assertIsNone(cursor)
+        _page, cursor = kardex_page(self.product, page_size=3)
+        response = self.client.get(url, {'before': cursor})
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'D20')
+        self.assertNotContains(response, 'D31')
+
+    def test_history_view_does_not_write(self):
+        self.login()
+        product = Product.objects.bulk_create([
+            Product(name='Importado', slug='importado', price_per_unit=Decimal('5.00'), unit='u', stock=0),
+        ])[0]
+        InventoryMovement.objects.bulk_create([
+            InventoryMovement(product=product, movement_type='entrada', quantity=6),
+        ])
+        url = reverse('admin:inventory_inventorystatus_product_kardex', args=[product.pk])
+        response = self.client.get(url)
+        self.assertEqual(response.context['current_balance'], Decimal('6.00'))
+        self.assertFalse(InventoryStatus.objects.filter(product=product).exists())
+
+    def test_exports(self):
+        self.login()
+        url = reverse('admin:inventory_inventorystatus_product_kardex_export', args=[self.product.pk])
+        response = self.client.get(url, {'format': 'csv', 'start': '2025-03-04'})
+        lines = b''.join(response.streaming_content).decode('utf-8').splitlines()
+        self.assertEqual(lines[0], ','.join(EXPORT_HEADERS))
+        self.assertEqual([Decimal(line.split(',')[-1]) for line in lines[1:]], [37, 36])
+
+        response = self.client.get(url, {'format': 'xlsx'})
+        with zipfile.ZipFile(io.BytesIO(b''.join(response.streaming_content))) as xlsx:
+            sheet = xlsx.read('xl/worksheets/sheet1.xml').decode('utf-8')
+        self.assertEqual(sheet.count('<row '), 9)
+        self.assertRegex(sheet, r'<c r="F9"><v>36(\.00)?</v></c>')
+
+
+class SnapshotTests(TestCase):
+    """Cortes de inventario: saldos a una fecha y borrado de cortes desactualizados."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.first, cls.second = make_product('Globos', stock=0), make_product('Cintas', stock=0)
+        for product, day, movement_type, quantity, draft in (
+            (cls.first, 1, 'entrada', 10, False),
+            (cls.first, 2, 'salida', 3, False),
+            (cls.second, 2, 'entrada', 7, False),
+            (cls.first, 2, 'entrada', 4, True),
+            (cls.first, 4, 'entrada', 5, False),
+        ):
+            movement = InventoryMovement.objects.create(
+                product=product, movement_type=movement_type, quantity=quantity, draft=draft,
+            )
+            InventoryMovement.objects.filter(pk=movement.pk).update(created_at=datetime.datetime(2025, 3, day, 12))
+            if draft:
+                cls.draft_id = movement.pk
+
+    def day(self, number):
+        return datetime.date(2025, 3, number)
+
+    def test_take_snapshots_writes_each_closing_date(self):
+        dates, written = take_snapshots(self.day(3), start_date=self.day(1))
+        self.assertEqual(dates, [self.day(1), self.day(2), self.day(3)])
+        # El 1 solo hay historial de Globos; desde el 2, de los dos productos
+        self.assertEqual(written, 5)
+        self.assertEqual(
+            dict(InventorySnapshot.objects.filter(date=self.day(3)).values_list('product_id', 'closing_stock')),
+            {self.first.pk: Decimal('7.00'), self.second.pk: Decimal('7.00')},
+        )
+        # Sin --since sigue desde el último corte
+        self.assertEqual(take_snapshots(self.day(4))[0], [self.day(4)])
+        with self.assertRaises(ValueError):
+            take_snapshots(datetime.date.today())
+
+    def test_balances_as_of_across_a_snapshot(self):
+        take_snapshots(self.day(2), start_date=self.day(1))
+        expected = {
+            1: {self.first.pk: 10},
+            2: {self.first.pk: 7, self.second.pk: 7},
+            3: {self.first.pk: 7, self.second.pk: 7},
+            4: {self.first.pk: 12, self.second.pk: 7},
+        }
+        for number, balances in expected.items():
+            self.assertEqual(balances_as_of(self.day(number)), balances, number)
+        self.assertEqual(balances_as_of(), ledger_balances(full=True))
+        self.assertEqual(balances_as_of(self.day(4), product_ids=[self.second.pk]), {self.second.pk: 7})
+
+        result = stock_as_of(self.first.pk, self.day(4))
+        self.assertEqual(result['snapshot'].date, self.day(2))
+        self.assertEqual([movement.quantity for movement in result['movements']], [Decimal('5.00')])
+        self.assertEqual(result['stock'], Decimal('12.00'))
+
+    def test_confirming_an_old_draft_invalidates_later_snapshots(self):
+        take_snapshots(self.day(3), start_date=self.day(1))
+        set_movements_draft(InventoryMovement.objects.filter(pk=self.draft_id), draft=False)
+        self.assertEqual(list(InventorySnapshot.objects.values_list('date', flat=True).distinct()), [self.day(1)])
+        self.assertEqual(balances_as_of(self.day(3))[self.first.pk], Decimal('11.00'))
+        # El siguiente corte rehace los días borrados con el borrador ya confirmado
+        take_snapshots(self.day(3))
+        self.assertEqual(
+            InventorySnapshot.objects.get(product=self.first, date=self.day(3)).closing_stock, Decimal('11.00'),
+        )
+
+    def test_editing_an_old_movement_invalidates_later_snapshots(self):
+        take_snapshots(self.day(3), start_date=self.day(1))
+        movement = InventoryMovement.objects.get(product=self.second)
+        movement.quantity = 8
+        movement.save()
+        self.assertFalse(InventorySnapshot.objects.filter(date__gte=self.day(2)).exists())
+        self.assertEqual(balances_as_of(self.day(3))[self.second.pk], Decimal('8.00'))
+
+
+class LowStockAlertTests(TestCase):
+    """Alertas de stock bajo: un cruce abre una sola alerta, reponer la cierra, el resumen avisa una vez."""
+
+    def set_stock(self, product, stock):
+        # Sin pasar por posting: la revisión del cruce se llama a mano
+        InventoryStatus.objects.filter(product=product).update(current_stock=stock)
+
+    def test_detect_crossings_opens_once_and_resolves(self):
+        product = make_product(stock=10, stock_min=5)
+        self.set_stock(product, 4)
+        self.assertEqual(detect_crossings([product.pk]), 1)
+        self.assertEqual(detect_crossings([product.pk]), 0)
+        alert = LowStockAlert.objects.get()
+        self.assertEqual((alert.stock_at_trigger, alert.stock_min), (Decimal('4.00'), Decimal('5.00')))
+        self.assertTrue(InventoryStatus.objects.get(product=product).below_minimum)
+
+        self.set_stock(product, 5)
+        self.assertEqual(detect_crossings([product.pk]), 0)
+        alert.refresh_from_db()
+        self.assertIsNotNone(alert.resolved_at)
+        self.assertFalse(InventoryStatus.objects.get(product=product).below_minimum)
+        self.assertEqual(detect_crossings([]), 0)
+
+    def test_paid_invoice_below_minimum_opens_one_alert(self):
+        user = get_user_model().objects.create_user(username='cliente', password='x')
+        product = make_product(stock=10, stock_min=9)
+        for _ in range(2):
+            invoice = Invoice.objects.create(client=user, series='B001')
+            InvoiceItem.objects.create(
+                invoice=invoice, item_type='product', product=product, description=product.name,
+                quantity=1, unit_price=Decimal('5.00'), subtotal=0,
+            )
+            invoice.save()
+            invoice.status = 'pagada'
+            invoice.save()
+
+        # 10 -> 9 no cruza; 9 -> 8 cruza una vez
+        alert = LowStockAlert.objects.get(product=product)
+        self.assertEqual(alert.stock_at_trigger, Decimal('8.00'))
+        self.assertTrue(InventoryStatus.objects.get(product=product).below_minimum)
+
+        # Reponer cierra la alerta
+        InventoryMovement.objects.create(product=product, movement_type='entrada', quantity=5)
+        alert.refresh_from_db()
+        self.assertIsNotNone(alert.resolved_at)
+        self.assertFalse(InventoryStatus.objects.get(product=product).below_minimum)
+
+    def test_product_save_checks_only_stock_min_changes(self):
+        product = Product.objects.get(pk=make_product(stock=10, stock_min=5).pk)
+        product.description = 'Solo otra descripción'
+        # Solo el UPDATE del producto: sin revisión de alertas
+        with self.assertNumQueries(1):
+            product.save()
+        product.stock_min = Decimal('12.00')
+        product.save()
+        self.assertEqual(LowStockAlert.objects.get(product=product).stock_min, Decimal('12.00'))
+
+    @override_settings(INVENTORY_ALERT_RECIPIENTS=['bodega@example.com'])
+    def test_digest_queues_one_email_and_marks_alerts(self):
+        products = [make_product(f'Producto {n}', stock=1, stock_min=5) for n in range(3)]
+        self.set_stock(products[2], 10)
+        detect_crossings([product.pk for product in products])
+        # Una alerta ya repuesta no entra en el resumen
+        self.set_stock(products[1], 10)
+        detect_crossings([products[1].pk])
+
+        self.assertEqual(send_low_stock_digest(), 1)
+        email = OutboundEmail.objects.get()
+        self.assertEqual(email.recipients, ['bodega@example.com'])
+        self.assertIn('Producto 0', email.body)
+        self.assertIsNotNone(LowStockAlert.objects.get(product=products[0]).notified_at)
+        # Ya avisadas: la siguiente ejecución no manda otro correo
+        self.assertEqual(send_low_stock_digest(), 0)
+        self.assertEqual(OutboundEmail.objects.count(), 1)
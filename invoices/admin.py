@@ -1,7 +1,11 @@
 from django.contrib import admin
+from django.core.paginator import Paginator
+from django.utils.functional import cached_property
 from django.utils.html import format_html
 from django.utils.translation import gettext_lazy as _
-from .models import Invoice, InvoiceItem
+from .models import Invoice, InvoiceItem, InvoicePayment, InvoiceSequence
+from .numbering import issue_invoices, number_gaps
+from inventory.posting import post_invoice_inventory
 from django.urls import reverse
 from django import forms
 from django.contrib import messages
@@ -13,6 +17,21 @@ from appointments.utils import (
     send_full_payment_confirmation_email
 )
 
+class BoundedCountPaginator(Paginator):
+    """
+    Paginador del listado de boletas sin COUNT(*) completo en cada carga:
+    cuenta como mucho COUNT_LIMIT filas (COUNT sobre una subconsulta con
+    LIMIT), así el conteo es exacto hasta el tope y nunca recorre toda la tabla.
+    Por encima del tope se paginan las primeras COUNT_LIMIT boletas; el resto
+    se alcanza filtrando (fecha, estado, búsqueda).
+    """
+    COUNT_LIMIT = 10000
+
+    @cached_property
+    def count(self):
+        return self.object_list.order_by()[:self.COUNT_LIMIT].count()
+
+
 class InvoiceItemInline(admin.TabularInline):
     model = InvoiceItem
     extra = 1
@@ -43,6 +62,17 @@ class InvoiceItemInline(admin.TabularInline):
             """
         return formfield
 
+class InvoicePaymentInline(admin.TabularInline):
+    """Pagos de la boleta (solo lectura: se registran con el botón Registrar Pago)"""
+    model = InvoicePayment
+    extra = 0
+    can_delete = False
+    fields = ['paid_at', 'amount', 'payment_method', 'reference', 'created_by']
+    readonly_fields = fields
+
+    def has_add_permission(self, request, obj=None):
+        return False
+
 @admin.register(Invoice)
 class InvoiceAdmin(admin.ModelAdmin):
     list_display = ('get_invoice_number', 'date_issued', 'client', 'total', 
@@ -50,8 +80,13 @@ class InvoiceAdmin(admin.ModelAdmin):
                     'inventory_status', 'register_payment_button')
 
     list_filter = ('invoice_type','status', 'payment_method', 'date_issued', 'inventory_processed')
+    # El cliente (su __str__ usa el usuario) viene en la misma consulta del listado
+    list_select_related = ('client',)
+    paginator = BoundedCountPaginator
+    show_full_result_count = False
     search_fields = ('series', 'number', 'client__first_name', 'client__last_name', 'client__dni')
-    readonly_fields = ('subtotal', 'igv', 'total', 'pending_balance', 'inventory_processed')
+    # Adelanto y saldo solo cambian con Registrar Pago (libro de pagos, ver payments.py)
+    readonly_fields = ('subtotal', 'igv', 'total', 'advance_payment', 'pending_balance', 'inventory_processed')
     
     fieldsets = (
         (_('Información del Documento'), {
@@ -75,14 +110,24 @@ class InvoiceAdmin(admin.ModelAdmin):
         }),
     )
     
-    inlines = [InvoiceItemInline]
-    actions = ['reprocess_inventory', 'mark_inventory_processed']
+    inlines = [InvoiceItemInline, InvoicePaymentInline]
+    actions = ['issue_drafts', 'reprocess_inventory', 'mark_inventory_processed']
     
     # --- MÉTODO SAVE_MODEL ROBUSTECIDO ---
     def save_model(self, request, obj, form, change):
         # 1. Asignar creador si es nuevo
         if not change:
             obj.created_by = request.user
+        else:
+            # El admin guarda la fila completa: se relee el adelanto con la boleta
+            # bloqueada (el changeform ya es atómico) para no pisar un pago
+            # registrado mientras el formulario estaba abierto
+            fresh_advance = Invoice.objects.select_for_update().values_list(
+                'advance_payment', flat=True
+            ).get(pk=obj.pk)
+            obj.advance_payment = fresh_advance
+            if getattr(obj, '_loaded_values', None) is not None:
+                obj._loaded_values['advance_payment'] = fresh_advance
             
         # --- A. CÁLCULOS PREVIOS ---
         current_total = float(obj.total) if obj.total else 0.0
@@ -108,22 +153,19 @@ class InvoiceAdmin(admin.ModelAdmin):
         send_advance_mail = False
         
         if change:
-            try:
-                old_obj = Invoice.objects.get(pk=obj.pk)
-                old_advance = float(old_obj.advance_payment) if old_obj.advance_payment else 0.0
-                was_paid = (old_obj.status == 'pagada')
-                
-                # CORRECCIÓN: Miramos el ESTADO REAL (obj.status), no solo el cálculo matemático.
-                # Si ahora dice 'pagada' y antes no lo decía -> ENVÍA EL CORREO.
-                if obj.status == 'pagada' and not was_paid:
-                    send_full_mail = True
-                
-                # Para el adelanto, mantenemos la lógica matemática para evitar falsos positivos
-                elif is_advance_payment and old_advance < 50 and obj.status != 'pagada':
-                    send_advance_mail = True
-                    
-            except Invoice.DoesNotExist:
-                pass
+            # Valores tal como se leyeron de la BD (Invoice.from_db), sin volver a consultarla
+            loaded = getattr(obj, '_loaded_values', None) or {}
+            old_advance = float(loaded.get('advance_payment') or 0)
+            was_paid = (loaded.get('status') == 'pagada')
+            
+            # CORRECCIÓN: Miramos el ESTADO REAL (obj.status), no solo el cálculo matemático.
+            # Si ahora dice 'pagada' y antes no lo decía -> ENVÍA EL CORREO.
+            if obj.status == 'pagada' and not was_paid:
+                send_full_mail = True
+            
+            # Para el adelanto, mantenemos la lógica matemática para evitar falsos positivos
+            elif is_advance_payment and old_advance < 50 and obj.status != 'pagada':
+                send_advance_mail = True
         else:
             # Nueva boleta
             if obj.status == 'pagada': # Corrección aquí también
@@ -146,17 +188,23 @@ class InvoiceAdmin(admin.ModelAdmin):
             if send_full_mail:
                 try:
                     send_full_payment_confirmation_email(request, obj)
-                    self.message_user(request, "🎉 Deuda saldada: Correo final enviado.", level=messages.SUCCESS)
+                    self.message_user(request, "🎉 Deuda saldada: Correo final en cola de envío.", level=messages.SUCCESS)
                 except Exception as e:
                     self.message_user(request, f"⚠️ Boleta guardada, pero falló el correo: {e}", level=messages.ERROR)
             
             elif send_advance_mail:
                 try:
                     send_advance_payment_confirmation_email(request, obj)
-                    self.message_user(request, "✅ Adelanto registrado: Correo enviado.", level=messages.INFO)
+                    self.message_user(request, "✅ Adelanto registrado: Correo en cola de envío.", level=messages.INFO)
                 except Exception as e:
                     self.message_user(request, f"⚠️ Adelanto guardado, pero falló el correo: {e}", level=messages.ERROR)
 
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+        # Los ítems del inline se guardan después de la boleta: un solo recálculo al final
+        if getattr(form.instance, '_items_changed', False):
+            form.instance.update_totals()
+
     def get_invoice_number(self, obj):
         return f"{obj.series}-{obj.number or '(borrador)'}"
     get_invoice_number.short_description = _('Número de Boleta')
@@ -194,12 +242,17 @@ class InvoiceAdmin(admin.ModelAdmin):
     register_payment_button.short_description = "Acciones"
     register_payment_button.allow_tags = True
     
+    def issue_drafts(self, request, queryset):
+        issued = issue_invoices(queryset.filter(status='borrador', number__isnull=True))
+        if issued:
+            self.message_user(request, f'Se emitieron {issued} boleta(s) con numeración correlativa.')
+        else:
+            self.message_user(request, 'No se encontraron borradores sin número para emitir.', level='warning')
+    issue_drafts.short_description = _('Emitir borradores seleccionados')
+
     def reprocess_inventory(self, request, queryset):
-        processed_count = 0
-        for invoice in queryset.filter(status='pagada'):
-            if not invoice.inventory_processed:
-                invoice.process_inventory()
-                processed_count += 1
+        # Todas las boletas elegibles en una sola pasada (ver inventory/posting.py)
+        processed_count = post_invoice_inventory(queryset.filter(status='pagada', inventory_processed=False))
         
         if processed_count > 0:
             self.message_user(request, f'Se procesó el inventario para {processed_count} boleta(s).')
@@ -241,4 +294,45 @@ class InvoiceAdmin(admin.ModelAdmin):
             }
         }
         </script>
-        """
\ No newline at end of file
+        """
+
+
+@admin.register(InvoiceSequence)
+class InvoiceSequenceAdmin(admin.ModelAdmin):
+    """Solo lectura: editar last_number a mano volvería a emitir números ya usados"""
+    list_display = ('series', 'last_number', 'gaps', 'updated_at')
+    readonly_fields = ('series', 'last_number', 'updated_at')
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+    def gaps(self, obj):
+        missing = number_gaps(obj.series)
+        if not missing:
+            return '-'
+        shown = ', '.join(str(number) for number in missing[:10])
+        return f"{shown}{'…' if len(missing) > 10 else ''} ({len(missing)})"
+    gaps.short_description = _('Números sin boleta')
+
+
+@admin.register(InvoicePayment)
+class InvoicePaymentAdmin(admin.ModelAdmin):
+    """Flujo de caja: pagos por fecha, directamente desde el libro"""
+    list_display = ('paid_at', 'invoice', 'amount', 'payment_method', 'reference', 'created_by')
+    list_filter = ('payment_method', 'paid_at')
+    search_fields = ('invoice__series', 'invoice__number', 'reference')
+    date_hierarchy = 'paid_at'
+    list_select_related = ('invoice__client', 'created_by')
+    readonly_fields = ('invoice', 'amount', 'payment_method', 'reference', 'paid_at', 'idempotency_key', 'created_by')
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
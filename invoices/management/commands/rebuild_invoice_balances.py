@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from invoices.payments import rebuild_balances
+
+
+class Command(BaseCommand):
+    help = (
+        'Recalcula el adelanto y el saldo pendiente de las boletas sumando el '
+        'libro de pagos, y corrige las que no cuadran.'
+    )
+
+    def handle(self, *args, **options):
+        fixed = rebuild_balances()
+        self.stdout.write(self.style.SUCCESS(f'Se corrigieron {fixed} boleta(s).'))
@@ -0,0 +1,42 @@
+# Generated by Django 4.2.20 on 2026-10-18 09:30
+
+from django.db import migrations, models
+
+
+def seed_sequences(apps, schema_editor):
+    """Cada serie existente parte del mayor número ya emitido (una consulta agrupada)."""
+    Invoice = apps.get_model('invoices', 'Invoice')
+    InvoiceSequence = apps.get_model('invoices', 'InvoiceSequence')
+    rows = (
+        Invoice.objects.filter(number__isnull=False)
+        .values('series').annotate(last=models.Max('number')).values_list('series', 'last')
+    )
+    InvoiceSequence.objects.bulk_create(
+        [InvoiceSequence(series=series, last_number=last) for series, last in rows]
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('invoices', '0005_alter_invoice_options'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InvoiceSequence',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('series', models.CharField(max_length=4, unique=True, verbose_name='Serie')),
+                ('last_number', models.PositiveIntegerField(default=0, verbose_name='Último número')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Fecha de Actualización')),
+            ],
+            options={
+                'verbose_name': 'Secuencia de Numeración',
+                'verbose_name_plural': 'Secuencias de Numeración',
+                'db_table': 'secuencia_boleta',
+                'ordering': ['series'],
+            },
+        ),
+        migrations.RunPython(seed_sequences, migrations.RunPython.noop),
+    ]
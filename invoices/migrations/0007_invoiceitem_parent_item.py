@@ -0,0 +1,48 @@
+# Generated by Django 4.2.20 on 2026-10-18 09:32
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def link_generated_items(apps, schema_editor):
+    """
+    Enlaza los ítems de producto generados antes de existir el campo (se
+    reconocían por el texto "Usado en <servicio>") con la línea de servicio
+    de la misma boleta.
+    """
+    InvoiceItem = apps.get_model('invoices', 'InvoiceItem')
+    service_lines = {}
+    for pk, invoice_id, name in (
+        InvoiceItem.objects.filter(item_type='service', service__isnull=False)
+        .order_by('pk').values_list('pk', 'invoice_id', 'service__name')
+    ):
+        service_lines.setdefault((invoice_id, name), pk)
+
+    generated = list(
+        InvoiceItem.objects.filter(item_type='product', parent_item__isnull=True, description__contains=' - Usado en ')
+        .only('pk', 'invoice_id', 'description')
+    )
+    linked = []
+    for item in generated:
+        service_name = item.description.split(' - Usado en ', 1)[1]
+        parent_id = service_lines.get((item.invoice_id, service_name))
+        if parent_id:
+            item.parent_item_id = parent_id
+            linked.append(item)
+    InvoiceItem.objects.bulk_update(linked, ['parent_item'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('invoices', '0006_invoice_sequence'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='invoiceitem',
+            name='parent_item',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='component_items', to='invoices.invoiceitem', verbose_name='Generado por'),
+        ),
+        migrations.RunPython(link_generated_items, migrations.RunPython.noop),
+    ]
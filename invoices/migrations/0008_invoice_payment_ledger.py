@@ -0,0 +1,57 @@
+# Generated by Django 4.2.20 on 2026-10-18 09:35
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+
+def open_ledger(apps, schema_editor):
+    """El adelanto acumulado de cada boleta existente pasa al libro como un pago inicial."""
+    Invoice = apps.get_model('invoices', 'Invoice')
+    InvoicePayment = apps.get_model('invoices', 'InvoicePayment')
+    InvoicePayment.objects.bulk_create(
+        [
+            InvoicePayment(
+                invoice_id=invoice.pk, amount=invoice.advance_payment, payment_method=invoice.payment_method,
+                reference=invoice.payment_reference or '', paid_at=invoice.updated_at,
+            )
+            for invoice in Invoice.objects.exclude(advance_payment=0).only(
+                'pk', 'advance_payment', 'payment_method', 'payment_reference', 'updated_at'
+            )
+        ],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('invoices', '0007_invoiceitem_parent_item'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InvoicePayment',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=10, verbose_name='Monto')),
+                ('payment_method', models.CharField(choices=[('efectivo', 'Efectivo'), ('tarjeta', 'Tarjeta'), ('transferencia', 'Transferencia'), ('yape', 'Yape'), ('plin', 'Plin'), ('otro', 'Otro')], max_length=15, verbose_name='Método de Pago')),
+                ('reference', models.CharField(blank=True, max_length=50, verbose_name='Referencia de Pago')),
+                ('paid_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Fecha de Pago')),
+                ('idempotency_key', models.UUIDField(blank=True, editable=False, null=True, unique=True, verbose_name='Clave de idempotencia')),
+                ('created_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='registered_payments', to=settings.AUTH_USER_MODEL, verbose_name='Registrado por')),
+                ('invoice', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='payments', to='invoices.invoice', verbose_name='Boleta')),
+            ],
+            options={
+                'verbose_name': 'Pago de Boleta',
+                'verbose_name_plural': 'Pagos de Boletas',
+                'db_table': 'pagos_boleta',
+                'ordering': ['-paid_at'],
+                'indexes': [models.Index(fields=['paid_at'], name='pago_fecha_idx'), models.Index(fields=['invoice', 'paid_at'], name='pago_boleta_fecha_idx')],
+            },
+        ),
+        migrations.RunPython(open_ledger, migrations.RunPython.noop),
+    ]
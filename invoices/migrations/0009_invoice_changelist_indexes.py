@@ -0,0 +1,25 @@
+# Generated by Django 4.2.20 on 2026-10-18 09:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('invoices', '0008_invoice_payment_ledger'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='invoice',
+            index=models.Index(fields=['date_issued', 'number'], name='boleta_fecha_numero_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='invoice',
+            index=models.Index(fields=['status', 'date_issued'], name='boleta_estado_fecha_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='invoice',
+            index=models.Index(fields=['payment_method', 'date_issued'], name='boleta_metodo_fecha_idx'),
+        ),
+    ]
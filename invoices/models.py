@@ -6,7 +6,8 @@ from services.models import Service, Product
 from django.utils import timezone
 import datetime
 from django.core.exceptions import ValidationError
-from django.db.models import Sum
+from django.db import transaction
+from django.db.models import F, Sum
 from decimal import Decimal
 from appointments.models import Appointment
 
@@ -108,64 +109,167 @@ class Invoice(models.Model):
         ordering = ['-date_issued', '-number']
         # Restricción única para serie y número
         unique_together = ['series', 'number']
+        # Para el orden y los filtros del listado del admin
+        indexes = [
+            models.Index(fields=['date_issued', 'number'], name='boleta_fecha_numero_idx'),
+            models.Index(fields=['status', 'date_issued'], name='boleta_estado_fecha_idx'),
+            models.Index(fields=['payment_method', 'date_issued'], name='boleta_metodo_fecha_idx'),
+        ]
     
     def __str__(self):
         return f"{self.series}-{self.number or '(borrador)'} - {self.client.get_full_name() or self.client.username}"
     
-    def save(self, *args, **kwargs):
-        # Detectar si el estado cambió a 'pagada'
-        old_status = None
-        if self.pk:
-            try:
-                old_status = Invoice.objects.get(pk=self.pk).status
-            except Invoice.DoesNotExist:
-                old_status = None
-        
-        # Asignar automáticamente el siguiente número en la serie si está en borrador y se cambia a emitida
-        if self.status == 'emitida' and not self.number:
-            last_invoice = Invoice.objects.filter(series=self.series).order_by('-number').first()
-            self.number = 1 if not last_invoice or not last_invoice.number else last_invoice.number + 1
-        
-        # Calcular totales SOLO si la instancia ya tiene un ID
-        if self.pk is not None and self.invoiceitem_set.exists():
-            self.subtotal = self.invoiceitem_set.aggregate(Sum('subtotal'))['subtotal__sum'] or Decimal('0.00')
+    # Campos cuyo valor leído de la BD se recuerda para saber qué cambió al guardar
+    TRACKED_FIELDS = ('status', 'advance_payment', 'appointment_id')
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_values = {
+            name: value for name, value in zip(field_names, values) if name in cls.TRACKED_FIELDS
+        }
+        return instance
+
+    def _remember_values(self, fields=None):
+        loaded = getattr(self, '_loaded_values', None) or {}
+        for name in self.TRACKED_FIELDS:
+            if fields is None or name in fields or name.removesuffix('_id') in fields:
+                loaded[name] = getattr(self, name)
+        self._loaded_values = loaded
+        self._items_changed = False
+
+    def field_changed(self, name):
+        """True si el campo cambió desde que se leyó de la BD (o no se sabe)."""
+        loaded = getattr(self, '_loaded_values', None)
+        if not loaded or name not in loaded:
+            return True
+        return loaded[name] != getattr(self, name)
+
+    def mark_items_changed(self):
+        """Lo llaman los ítems al guardarse o borrarse: el próximo guardado recalcula totales."""
+        self._items_changed = True
+
+    def _compute_totals(self):
+        """Un solo aggregate; sin ítems se conservan los totales actuales."""
+        subtotal = self.invoiceitem_set.aggregate(Sum('subtotal'))['subtotal__sum']
+        if subtotal is not None:
+            self.subtotal = subtotal
             self.igv = self.subtotal * Decimal('0.18')
             self.total = self.subtotal + self.igv
-        
         self.pending_balance = self.total - self.advance_payment
-        
-        # Si es una boleta asociada a una cita y hay un adelanto de al menos 50 soles,
-        # cambiar el estado de la cita a confirmada
-        if self.appointment and self.appointment.status == 'pending' and self.advance_payment >= 50:
+
+    def update_totals(self):
+        """Recalcula y guarda solo los totales (para cuando los ítems se guardan después de la boleta)."""
+        self._compute_totals()
+        # El saldo se calcula en la BD con el adelanto vigente (un pago pudo llegar entretanto)
+        Invoice.objects.filter(pk=self.pk).update(
+            subtotal=self.subtotal, igv=self.igv, total=self.total,
+            pending_balance=self.total - F('advance_payment'),
+        )
+        self._items_changed = False
+
+    def confirm_appointment_if_advanced(self):
+        """Con un adelanto de al menos 50 soles la cita pendiente pasa a confirmada."""
+        if self.appointment_id and self.advance_payment >= 50 and self.appointment.status == 'pending':
             self.appointment.status = 'confirmed'
             self.appointment.save(update_fields=['status'])
+
+    def save(self, *args, **kwargs):
+        loaded = getattr(self, '_loaded_values', None)
+
+        # Estado anterior, para detectar el paso a 'pagada' (sin consulta si la boleta vino de la BD)
+        old_status = None
+        if loaded and 'status' in loaded:
+            old_status = loaded['status']
+        elif self.pk:
+            old_status = Invoice.objects.filter(pk=self.pk).values_list('status', flat=True).first()
         
-        super().save(*args, **kwargs)
+        # Calcular totales solo si cambiaron los ítems (o no se sabe, p. ej. instancia armada a mano)
+        if self.pk is not None and (getattr(self, '_items_changed', False) or loaded is None):
+            self._compute_totals()
+        else:
+            self.pending_balance = self.total - self.advance_payment
+        
+        # Si es una boleta asociada a una cita y hay un adelanto de al menos 50 soles,
+        # cambiar el estado de la cita a confirmada (solo se revisa si cambió el adelanto o la cita)
+        if self.field_changed('advance_payment') or self.field_changed('appointment_id'):
+            self.confirm_appointment_if_advanced()
+        
+        # Asignar automáticamente el siguiente número de la serie al pasar a emitida.
+        # Se reserva en la misma transacción que guarda la boleta: si el guardado
+        # falla, el número vuelve a la secuencia (ver numbering.py)
+        if self.status == 'emitida' and not self.number:
+            from .numbering import next_number
+            with transaction.atomic():
+                self.number = next_number(self.series)
+                super().save(*args, **kwargs)
+        else:
+            super().save(*args, **kwargs)
+        self._remember_values(kwargs.get('update_fields'))
         
         # NUEVO: Procesar inventario solo cuando se marca como pagada
         if (old_status != 'pagada' and self.status == 'pagada' and not self.inventory_processed):
             self.process_inventory()
     
     def process_inventory(self):
-        """Procesa el inventario cuando la boleta se marca como pagada"""
-        from inventory.models import InventoryMovement
-        
-        # Procesar cada item de producto en la boleta
-        for item in self.invoiceitem_set.filter(item_type='product', product__isnull=False):
-            # Crear movimiento de salida de inventario
-            InventoryMovement.objects.create(
-                product=item.product,
-                quantity=item.quantity,
-                movement_type='salida',
-                document_reference=f"{self.series}-{self.number or '(borrador)'}",
-                invoice_item=item,
-                notes=f"Venta de producto en {self.invoice_type} - Boleta pagada",
-                draft=False  # Movimiento confirmado
-            )
-        
-        # Marcar como procesado para evitar duplicados
-        self.inventory_processed = True
-        self.save(update_fields=['inventory_processed'])
+        """Procesa el inventario cuando la boleta se marca como pagada (ver inventory/posting.py)"""
+        from inventory.posting import post_invoice_inventory
+        post_invoice_inventory([self])
+
+
+class InvoicePayment(models.Model):
+    """
+    Libro de pagos: una fila por pago recibido, nunca se edita. El adelanto y
+    el saldo de la boleta se mantienen con incrementos atómicos y pueden
+    reconstruirse sumando este libro (ver payments.py).
+    """
+    invoice = models.ForeignKey(Invoice, on_delete=models.CASCADE, related_name='payments', verbose_name=_('Boleta'))
+    amount = models.DecimalField(_('Monto'), max_digits=10, decimal_places=2)
+    payment_method = models.CharField(_('Método de Pago'), max_length=15, choices=Invoice.PAYMENT_METHOD_CHOICES)
+    reference = models.CharField(_('Referencia de Pago'), max_length=50, blank=True)
+    paid_at = models.DateTimeField(_('Fecha de Pago'), default=timezone.now)
+    # Clave enviada con el formulario: un doble envío no registra el pago dos veces
+    idempotency_key = models.UUIDField(_('Clave de idempotencia'), unique=True, null=True, blank=True, editable=False)
+    created_by = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='registered_payments',
+        verbose_name=_('Registrado por')
+    )
+
+    class Meta:
+        db_table = 'pagos_boleta'
+        verbose_name = _('Pago de Boleta')
+        verbose_name_plural = _('Pagos de Boletas')
+        ordering = ['-paid_at']
+        indexes = [
+            models.Index(fields=['paid_at'], name='pago_fecha_idx'),
+            models.Index(fields=['invoice', 'paid_at'], name='pago_boleta_fecha_idx'),
+        ]
+
+    def __str__(self):
+        return f"S/ {self.amount} - {self.get_payment_method_display()} ({self.paid_at:%d/%m/%Y})"
+
+
+class InvoiceSequence(models.Model):
+    """
+    Último número emitido por serie. Se incrementa de forma atómica al emitir
+    (ver numbering.py), así dos boletas simultáneas nunca reciben el mismo número.
+    """
+    series = models.CharField(_('Serie'), max_length=4, unique=True)
+    last_number = models.PositiveIntegerField(_('Último número'), default=0)
+    updated_at = models.DateTimeField(_('Fecha de Actualización'), auto_now=True)
+
+    class Meta:
+        db_table = 'secuencia_boleta'
+        verbose_name = _('Secuencia de Numeración')
+        verbose_name_plural = _('Secuencias de Numeración')
+        ordering = ['series']
+
+    def __str__(self):
+        return f"{self.series}: {self.last_number}"
 
 
 class InvoiceItem(models.Model):
@@ -217,6 +321,16 @@ class InvoiceItem(models.Model):
         default=0
     )
     
+    # Línea de servicio que generó este ítem (productos que componen el servicio)
+    parent_item = models.ForeignKey(
+        'self',
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='component_items',
+        verbose_name=_('Generado por')
+    )
+    
     class Meta:
         db_table = 'detalle_boleta'
         verbose_name = _('Detalle de Boleta')
@@ -260,6 +374,66 @@ class InvoiceItem(models.Model):
         # Auto-calcular el subtotal
         self.subtotal = (self.unit_price * self.quantity) - self.discount
     
+    def _notify_invoice(self):
+        """
+        Avisa a la boleta que sus totales cambiaron. Si la boleta está cargada
+        (inline del admin, creación desde código) basta marcarla y el próximo
+        guardado recalcula; si no, se recalcula ahora.
+        """
+        if InvoiceItem.invoice.is_cached(self):
+            self.invoice.mark_items_changed()
+        elif self.invoice_id:
+            Invoice.objects.get(pk=self.invoice_id).update_totals()
+
+    def _expand_components(self, check_existing=True):
+        """
+        Crea un ítem de producto por cada componente del servicio que aún no
+        tenga uno generado por esta línea: una consulta de componentes, una de
+        existentes (solo si la línea ya existía) y un bulk_create.
+        """
+        from services.models import ServiceComponent
+        
+        components = list(ServiceComponent.objects.filter(service_id=self.service_id).select_related('product'))
+        if not components:
+            return
+        
+        existing = set()
+        if check_existing:
+            existing = set(
+                InvoiceItem.objects.filter(invoice_id=self.invoice_id, parent_item=self)
+                .values_list('product_id', flat=True)
+            )
+        
+        service_name = self.service.name
+        new_items = []
+        for component in components:
+            if component.product_id in existing:
+                continue
+            product = component.product
+            quantity = component.quantity * self.quantity
+            subtotal = product.price_per_unit * quantity
+            new_items.append(InvoiceItem(
+                invoice_id=self.invoice_id,
+                parent_item=self,
+                item_type='product',
+                product=product,
+                description=f"{product.name} - Usado en {service_name}",
+                quantity=quantity,
+                unit_price=product.price_per_unit,
+                subtotal=subtotal,
+                pending_balance=subtotal,
+                appointment_id=self.appointment_id,
+            ))
+            # Un componente repetido en el servicio genera un solo ítem, como antes
+            existing.add(component.product_id)
+        if new_items:
+            InvoiceItem.objects.bulk_create(new_items)
+
+    def delete(self, *args, **kwargs):
+        result = super().delete(*args, **kwargs)
+        self._notify_invoice()
+        return result
+
     def save(self, *args, **kwargs):
         if (self.unit_price is None or self.unit_price == 0) and self.product:
             self.unit_price = self.product.price_per_unit
@@ -287,37 +461,13 @@ class InvoiceItem(models.Model):
             self.appointment.save(update_fields=['status'])
         
         # Guardar el item actual primero
+        adding = self._state.adding
         super().save(*args, **kwargs)
         
         # Si es un servicio, agregar los productos relacionados automáticamente
-        if self.item_type == 'service' and self.service:
-            from services.models import ServiceComponent
-            
-            # Buscar todos los componentes (productos) asociados a este servicio
-            components = ServiceComponent.objects.filter(service=self.service)
-            
-            # Para cada componente, crear un nuevo InvoiceItem de tipo producto
-            for component in components:
-                # Verificar si ya existe un ítem para este componente en la misma factura
-                product_item_exists = InvoiceItem.objects.filter(
-                    invoice=self.invoice,
-                    item_type='product',
-                    product=component.product,
-                    description__contains=f"Usado en {self.service.name}"
-                ).exists()
-                
-                # Si no existe, crearlo
-                if not product_item_exists:
-                    InvoiceItem.objects.create(
-                        invoice=self.invoice,
-                        item_type='product',
-                        product=component.product,
-                        description=f"{component.product.name} - Usado en {self.service.name}",
-                        quantity=component.quantity * self.quantity,
-                        unit_price=component.product.price_per_unit,
-                        subtotal=component.product.price_per_unit * component.quantity * self.quantity,
-                        appointment=self.appointment
-                    )
+        if self.item_type == 'service' and self.service_id:
+            self._expand_components(check_existing=not adding)
+        self._notify_invoice()
         
         # REMOVIDO: Ya no creamos movimientos de inventario aquí
         # El inventario se procesa solo cuando la boleta se marca como pagada
\ No newline at end of file
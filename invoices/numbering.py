@@ -0,0 +1,82 @@
+# invoices/numbering.py
+"""
+Numeración correlativa de boletas por serie.
+
+El último número de cada serie vive en InvoiceSequence y se incrementa con un
+UPDATE ... SET last_number = last_number + n, que bloquea la fila hasta el
+final de la transacción. Las emisiones simultáneas de una misma serie esperan
+su turno en vez de leer el mismo máximo y chocar con unique_together.
+
+Los números no se reutilizan: una boleta anulada conserva el suyo y los
+números reservados en lote que no llegan a usarse quedan como huecos
+(ver number_gaps). Si la transacción que reservó se revierte, la reserva
+también se revierte y no queda hueco.
+"""
+from django.db import IntegrityError, transaction
+from django.db.models import F, Max
+from django.utils import timezone
+
+from .models import Invoice, InvoiceSequence
+
+
+def _ensure_sequence(series):
+    """Crea la secuencia de una serie nueva partiendo del mayor número ya emitido."""
+    start = Invoice.objects.filter(series=series).aggregate(last=Max('number'))['last'] or 0
+    try:
+        with transaction.atomic():
+            InvoiceSequence.objects.create(series=series, last_number=start)
+    except IntegrityError:
+        # Otra emisión la creó al mismo tiempo
+        pass
+
+
+def reserve_numbers(series, count=1):
+    """
+    Reserva `count` números consecutivos de la serie y devuelve el rango.
+    Llamar dentro de la transacción que guarda las boletas para que la
+    reserva se revierta junto con ellas.
+    """
+    if count < 1:
+        raise ValueError('count debe ser al menos 1')
+    with transaction.atomic():
+        sequences = InvoiceSequence.objects.filter(series=series)
+        if not sequences.update(last_number=F('last_number') + count, updated_at=timezone.now()):
+            _ensure_sequence(series)
+            sequences.update(last_number=F('last_number') + count, updated_at=timezone.now())
+        # La fila queda bloqueada por el UPDATE: este valor es el nuestro
+        last = sequences.values_list('last_number', flat=True).get()
+    return range(last - count + 1, last + 1)
+
+
+def next_number(series):
+    return reserve_numbers(series, 1)[0]
+
+
+def issue_invoices(invoices):
+    """
+    Emite en bloque las boletas en borrador: reserva un lote de números por
+    serie y guarda estado y número con un solo UPDATE por lote.
+    Devuelve la cantidad de boletas emitidas.
+    """
+    drafts = [invoice for invoice in invoices if invoice.status == 'borrador' and not invoice.number]
+    by_series = {}
+    for invoice in drafts:
+        by_series.setdefault(invoice.series, []).append(invoice)
+
+    with transaction.atomic():
+        for series, group in by_series.items():
+            # Orden estable: por fecha de emisión y luego por id
+            group.sort(key=lambda invoice: (invoice.date_issued, invoice.pk))
+            for invoice, number in zip(group, reserve_numbers(series, len(group))):
+                invoice.number = number
+                invoice.status = 'emitida'
+                invoice.updated_at = timezone.now()
+        Invoice.objects.bulk_update(drafts, ['number', 'status', 'updated_at'])
+    return len(drafts)
+
+
+def number_gaps(series):
+    """Números de la serie que nunca llegaron a una boleta (para auditoría)."""
+    last = InvoiceSequence.objects.filter(series=series).values_list('last_number', flat=True).first() or 0
+    used = set(Invoice.objects.filter(series=series, number__isnull=False).values_list('number', flat=True))
+    return [number for number in range(1, last + 1) if number not in used]
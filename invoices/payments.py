@@ -0,0 +1,78 @@
+# invoices/payments.py
+"""
+Registro de pagos de boletas.
+
+Cada pago es una fila de InvoicePayment. El adelanto y el saldo de la boleta
+se actualizan con un UPDATE ... SET advance_payment = advance_payment + monto
+condicionado a que el saldo alcance, así dos pagos simultáneos no se pisan ni
+pueden pagar de más. La clave de idempotencia del formulario evita registrar
+dos veces el mismo envío. En el admin el adelanto y el saldo son de solo
+lectura: todo cambio pasa por record_payment y queda en el libro.
+"""
+from django.db import IntegrityError, transaction
+from django.db.models import F, Sum
+from django.utils import timezone
+
+from .models import Invoice, InvoicePayment
+
+
+class PaymentRejected(Exception):
+    """El pago no se registró (monto inválido o mayor que el saldo pendiente)."""
+
+
+def record_payment(invoice, amount, payment_method, reference='', idempotency_key=None, user=None):
+    """
+    Registra un pago y actualiza adelanto, saldo, método y referencia de la boleta.
+    Devuelve (pago, creado); con una clave ya usada devuelve el pago existente.
+    Refresca en `invoice` los campos de pago.
+    """
+    if amount <= 0:
+        raise PaymentRejected('El monto debe ser mayor que cero.')
+
+    with transaction.atomic():
+        try:
+            with transaction.atomic():
+                payment = InvoicePayment.objects.create(
+                    invoice=invoice, amount=amount, payment_method=payment_method,
+                    reference=reference or '', idempotency_key=idempotency_key, created_by=user,
+                )
+        except IntegrityError:
+            if idempotency_key is None:
+                raise
+            return InvoicePayment.objects.get(idempotency_key=idempotency_key), False
+
+        changes = {
+            'advance_payment': F('advance_payment') + amount,
+            'pending_balance': F('pending_balance') - amount,
+            'payment_method': payment_method,
+            'updated_at': timezone.now(),
+        }
+        if reference:
+            changes['payment_reference'] = reference
+        if not Invoice.objects.filter(pk=invoice.pk, pending_balance__gte=amount).update(**changes):
+            # Revierte también la fila del libro
+            raise PaymentRejected('El monto a pagar no puede ser mayor que el saldo pendiente.')
+
+    invoice.refresh_from_db(fields=['advance_payment', 'pending_balance', 'payment_method', 'payment_reference'])
+    return payment, True
+
+
+def rebuild_balances(invoices=None):
+    """
+    Recalcula adelanto y saldo desde el libro (una consulta agrupada) y
+    corrige las boletas que no cuadran. Devuelve cuántas se corrigieron.
+    """
+    invoices = Invoice.objects.all() if invoices is None else invoices
+    paid = dict(
+        InvoicePayment.objects.filter(invoice__in=invoices)
+        .values('invoice_id').annotate(total=Sum('amount')).values_list('invoice_id', 'total')
+    )
+    fixed = []
+    for invoice in invoices.only('pk', 'total', 'advance_payment', 'pending_balance'):
+        advance = paid.get(invoice.pk, 0)
+        if invoice.advance_payment != advance or invoice.pending_balance != invoice.total - advance:
+            invoice.advance_payment = advance
+            invoice.pending_balance = invoice.total - advance
+            fixed.append(invoice)
+    Invoice.objects.bulk_update(fixed, ['advance_payment', 'pending_balance'], batch_size=500)
+    return len(fixed)
@@ -1,3 +1,331 @@
+import datetime
+import uuid
+from decimal import Decimal
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.db import transaction
 from django.test import TestCase
+from django.urls import reverse
+
+from inventory.models import InventoryMovement, InventoryStatus
+from services.models import Product, Service, ServiceCategory, ServiceComponent
+from .admin import BoundedCountPaginator
+from .models import Invoice, InvoiceItem, InvoicePayment, InvoiceSequence
+from .numbering import issue_invoices, next_number, number_gaps, reserve_numbers
+from .payments import PaymentRejected, rebuild_balances, record_payment
+
+
+class InvoiceSaveQueryBudgetTests(TestCase):
+    """Invoice.save no debe repetir consultas cuando no cambió nada relevante."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.client_user = get_user_model().objects.create_user(username='cliente', password='x')
+        invoice = Invoice.objects.create(client=cls.client_user, series='B001')
+        InvoiceItem.objects.create(
+            invoice=invoice, item_type='other', description='Decoración',
+            quantity=2, unit_price=Decimal('50.00'), subtotal=0,
+        )
+        invoice.save()
+        cls.invoice_id = invoice.pk
+
+    def load(self):
+        return Invoice.objects.get(pk=self.invoice_id)
+
+    def test_totals_from_items(self):
+        invoice = self.load()
+        self.assertEqual(invoice.subtotal, Decimal('100.00'))
+        self.assertEqual(invoice.total, Decimal('118.00'))
+
+    def test_save_without_changes_is_one_update(self):
+        invoice = self.load()
+        invoice.notes = 'Solo una nota'
+        with self.assertNumQueries(1):
+            invoice.save()
+
+    def test_item_change_recomputes_totals_with_one_aggregate(self):
+        invoice = self.load()
+        InvoiceItem.objects.create(
+            invoice=invoice, item_type='other', description='Globos',
+            quantity=1, unit_price=Decimal('20.00'), subtotal=0,
+        )
+        # aggregate + UPDATE
+        with self.assertNumQueries(2):
+            invoice.save()
+        self.assertEqual(self.load().subtotal, Decimal('120.00'))
+        # Ya recalculado: el siguiente guardado no vuelve a sumar
+        with self.assertNumQueries(1):
+            invoice.save()
+
+    def test_paid_transition_is_detected_without_refetch(self):
+        invoice = self.load()
+        invoice.status = 'pagada'
+        # UPDATE + (savepoint) bloqueo de la boleta + ítems de producto (ninguno)
+        # + UPDATE de inventory_processed (fin del savepoint)
+        with self.assertNumQueries(6):
+            invoice.save()
+        self.assertTrue(self.load().inventory_processed)
+        with self.assertNumQueries(1):
+            invoice.save()
+
+
+class InvoiceNumberingTests(TestCase):
+    """Numeración por serie desde InvoiceSequence: correlativa, en lote y con huecos auditables."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.client_user = get_user_model().objects.create_user(username='cliente', password='x')
+
+    def issue(self, series='B001', **kwargs):
+        return Invoice.objects.create(client=self.client_user, series=series, status='emitida', **kwargs)
+
+    def test_numbers_follow_across_saves(self):
+        first, second = self.issue(), self.issue()
+        draft = Invoice.objects.create(client=self.client_user, series='B001')
+        self.assertEqual((first.number, second.number, draft.number), (1, 2, None))
+        self.assertEqual(self.issue(series='F001').number, 1)
+        # Volver a guardar una emitida no la renumera
+        first.notes = 'Editada'
+        first.save()
+        first.refresh_from_db()
+        self.assertEqual(first.number, 1)
+        draft.status = 'emitida'
+        draft.save()
+        self.assertEqual(draft.number, 3)
+        self.assertEqual(InvoiceSequence.objects.get(series='B001').last_number, 3)
+
+    def test_new_sequence_starts_after_existing_numbers(self):
+        Invoice.objects.bulk_create([Invoice(client=self.client_user, series='B002', number=7, status='emitida')])
+        self.assertEqual(self.issue(series='B002').number, 8)
+
+    def test_batch_reservation_is_contiguous(self):
+        self.issue()
+        self.issue()
+        self.assertEqual(reserve_numbers('B001', 5), range(3, 8))
+        self.assertEqual(next_number('B001'), 8)
+        with self.assertRaises(ValueError):
+            reserve_numbers('B001', 0)
+
+    def test_issue_invoices_numbers_drafts_in_order(self):
+        self.issue()
+        later = Invoice.objects.create(client=self.client_user, series='B001', date_issued=datetime.date(2025, 3, 2))
+        earlier = Invoice.objects.create(client=self.client_user, series='B001', date_issued=datetime.date(2025, 3, 1))
+        same_day = Invoice.objects.create(client=self.client_user, series='B001', date_issued=datetime.date(2025, 3, 2))
+        other_series = Invoice.objects.create(client=self.client_user, series='F001')
+        cancelled = Invoice.objects.create(client=self.client_user, series='B001', status='anulada')
+        invoices = [later, same_day, other_series, cancelled, earlier]
+
+        with mock.patch('invoices.numbering.reserve_numbers', wraps=reserve_numbers) as reserve:
+            self.assertEqual(issue_invoices(invoices), 4)
+        # Un solo lote por serie
+        self.assertEqual(sorted(call.args for call in reserve.call_args_list), [('B001', 3), ('F001', 1)])
+        numbers = dict(Invoice.objects.values_list('pk', 'number'))
+        self.assertEqual([numbers[invoice.pk] for invoice in (earlier, later, same_day)], [2, 3, 4])
+        self.assertEqual(numbers[other_series.pk], 1)
+        self.assertIsNone(numbers[cancelled.pk])
+        self.assertEqual(set(Invoice.objects.filter(number__isnull=False).values_list('status', flat=True)), {'emitida'})
+        self.assertEqual(number_gaps('B001'), [])
+
+    def test_gaps_report_skipped_numbers(self):
+        self.issue()
+        reserve_numbers('B001', 2)
+        annulled = self.issue()
+        annulled.status = 'anulada'
+        annulled.save()
+        # Una reserva revertida no deja hueco
+        with self.assertRaises(RuntimeError), transaction.atomic():
+            reserve_numbers('B001', 3)
+            raise RuntimeError
+        self.assertEqual(number_gaps('B001'), [2, 3])
+        self.assertEqual(next_number('B001'), 5)
+        self.assertEqual(number_gaps('B001'), [2, 3, 5])
+
+    def test_sequence_is_read_only_in_the_admin(self):
+        self.issue()
+        admin = get_user_model().objects.create_superuser('admin', 'admin@example.com', 'x')
+        self.client.force_login(admin)
+        sequence = InvoiceSequence.objects.get(series='B001')
+        url = reverse('admin:invoices_invoicesequence_change', args=[sequence.pk])
+        self.assertEqual(self.client.get(url).status_code, 200)
+        self.client.post(url, {'series': 'B001', 'last_number': 0})
+        sequence.refresh_from_db()
+        self.assertEqual(sequence.last_number, 1)
+        self.assertEqual(self.client.get(reverse('admin:invoices_invoicesequence_add')).status_code, 403)
+
+
+class InvoiceInventoryPostingTests(TestCase):
+    """El paso a pagada descuenta el inventario en lote, sin recalcular desde el historial."""
+
+    def test_paid_invoice_posts_products_in_one_pass(self):
+        user = get_user_model().objects.create_user(username='cliente', password='x')
+        products = [
+            Product.objects.create(name=f'Producto {i}', price_per_unit=Decimal('5.00'), unit='u', stock=10)
+            for i in range(3)
+        ]
+        invoice = Invoice.objects.create(client=user, series='B001')
+        for product in products:
+            InvoiceItem.objects.create(
+                invoice=invoice, item_type='product', product=product, description=product.name,
+                quantity=2, unit_price=Decimal('5.00'), subtotal=0,
+            )
+        invoice.save()
+        invoice.status = 'pagada'
+        # Lo mismo que sin productos (6) + savepoint de post_movements (2) + estados existentes
+        # + bulk_create + un UPDATE de stock por producto + revisión del mínimo de los
+        # productos tocados; nada recorre el historial
+        with self.assertNumQueries(11 + len(products)):
+            invoice.save()
+
+        self.assertEqual(InventoryMovement.objects.filter(invoice_item__invoice=invoice).count(), 3)
+        for product in products:
+            self.assertEqual(InventoryStatus.objects.get(product=product).current_stock, Decimal('8.00'))
+        # Volver a procesar no duplica movimientos
+        invoice.process_inventory()
+        self.assertEqual(InventoryMovement.objects.filter(invoice_item__invoice=invoice).count(), 3)
+
+
+class ServiceComponentExpansionTests(TestCase):
+    """Una línea de servicio genera sus productos en un solo bulk_create, enlazados por parent_item."""
+
+    COMPONENTS = 15
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.client_user = get_user_model().objects.create_user(username='cliente', password='x')
+        category = ServiceCategory.objects.create(name='Eventos')
+        cls.service = Service.objects.create(
+            category=category, name='Decoración', description='-', base_price=100, duration=60,
+        )
+        for i in range(cls.COMPONENTS):
+            product = Product.objects.create(name=f'Insumo {i}', price_per_unit=Decimal('2.00'), unit='u', stock=0)
+            ServiceComponent.objects.create(service=cls.service, product=product, quantity=2)
+
+    def setUp(self):
+        self.invoice = Invoice.objects.create(client=self.client_user, series='B001')
+
+    def components(self, line):
+        return InvoiceItem.objects.filter(invoice=self.invoice, parent_item=line)
+
+    def test_expansion_is_one_bulk_insert(self):
+        line = InvoiceItem(
+            invoice=self.invoice, item_type='service', service=self.service,
+            quantity=3, unit_price=Decimal('100.00'), subtotal=0,
+        )
+        # INSERT de la línea + componentes + bulk_create (sin consultar existentes: la línea es nueva)
+        with self.assertNumQueries(3):
+            line.save()
+        generated = self.components(line)
+        self.assertEqual(generated.count(), self.COMPONENTS)
+        self.assertEqual(set(generated.values_list('quantity', 'subtotal')), {(Decimal('6.00'), Decimal('12.00'))})
+        self.assertTrue(all(item.item_type == 'product' for item in generated))
+
+    def test_resave_does_not_duplicate_components(self):
+        line = InvoiceItem.objects.create(
+            invoice=self.invoice, item_type='service', service=self.service,
+            quantity=1, unit_price=Decimal('100.00'), subtotal=0,
+        )
+        line.quantity = 2
+        # UPDATE de la línea + componentes + existentes; nada que insertar
+        with self.assertNumQueries(3):
+            line.save()
+        self.assertEqual(self.components(line).count(), self.COMPONENTS)
+
+        # Un componente nuevo del servicio se agrega una sola vez al volver a guardar
+        extra = Product.objects.create(name='Insumo extra', price_per_unit=Decimal('1.00'), unit='u', stock=0)
+        ServiceComponent.objects.create(service=self.service, product=extra, quantity=1)
+        line.save()
+        line.save()
+        self.assertEqual(self.components(line).count(), self.COMPONENTS + 1)
+        self.assertEqual(self.components(line).filter(product=extra).count(), 1)
+
+        # Otra línea del mismo servicio tiene sus propios componentes
+        other = InvoiceItem.objects.create(
+            invoice=self.invoice, item_type='service', service=self.service,
+            quantity=1, unit_price=Decimal('100.00'), subtotal=0,
+        )
+        self.assertEqual(self.components(other).count(), self.COMPONENTS + 1)
+
+
+class InvoicePaymentTests(TestCase):
+    """Pagos en el libro: idempotencia, tope del saldo y reconstrucción de saldos."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.client_user = get_user_model().objects.create_user(username='cliente', password='x')
+        invoice = Invoice.objects.create(client=cls.client_user, series='B001', total=Decimal('100.00'))
+        cls.invoice_id = invoice.pk
+
+    def load(self):
+        return Invoice.objects.get(pk=self.invoice_id)
+
+    def test_same_key_is_recorded_once(self):
+        invoice = self.load()
+        key = uuid.uuid4()
+        first, created = record_payment(invoice, Decimal('30.00'), 'yape', idempotency_key=key)
+        self.assertTrue(created)
+        again, created = record_payment(self.load(), Decimal('30.00'), 'yape', idempotency_key=key)
+        self.assertFalse(created)
+        self.assertEqual(again.pk, first.pk)
+        invoice = self.load()
+        self.assertEqual((invoice.advance_payment, invoice.pending_balance), (Decimal('30.00'), Decimal('70.00')))
+
+    def test_overpayment_is_rejected_without_ledger_row(self):
+        record_payment(self.load(), Decimal('80.00'), 'efectivo')
+        with self.assertRaises(PaymentRejected):
+            record_payment(self.load(), Decimal('20.01'), 'efectivo')
+        with self.assertRaises(PaymentRejected):
+            record_payment(self.load(), Decimal('0'), 'efectivo')
+        self.assertEqual(InvoicePayment.objects.count(), 1)
+        self.assertEqual(self.load().pending_balance, Decimal('20.00'))
+
+    def test_rebuild_balances_from_ledger(self):
+        record_payment(self.load(), Decimal('40.00'), 'efectivo')
+        record_payment(self.load(), Decimal('10.00'), 'plin')
+        Invoice.objects.filter(pk=self.invoice_id).update(advance_payment=0, pending_balance=Decimal('100.00'))
+        self.assertEqual(rebuild_balances(), 1)
+        invoice = self.load()
+        self.assertEqual((invoice.advance_payment, invoice.pending_balance), (Decimal('50.00'), Decimal('50.00')))
+        self.assertEqual(rebuild_balances(), 0)
+
+    def test_admin_save_keeps_concurrent_payment(self):
+        admin = get_user_model().objects.create_superuser('admin', 'admin@example.com', 'x')
+        self.client.force_login(admin)
+        url = reverse('admin:invoices_invoice_change', args=[self.invoice_id])
+        form = self.client.get(url).context['adminform'].form
+        self.assertNotIn('advance_payment', form.fields)
+
+        # Se registra un pago mientras el formulario del admin sigue abierto
+        record_payment(self.load(), Decimal('25.00'), 'yape')
+        data = {name: value for name, value in form.initial.items() if value is not None}
+        data.update({
+            'notes': 'Editada en el admin', 'date_issued': '2030-01-07', 'client': self.client_user.pk,
+            'invoiceitem_set-TOTAL_FORMS': 0, 'invoiceitem_set-INITIAL_FORMS': 0,
+            'payments-TOTAL_FORMS': 1, 'payments-INITIAL_FORMS': 1,
+            'payments-0-id': InvoicePayment.objects.get().pk, 'payments-0-invoice': self.invoice_id,
+        })
+        response = self.client.post(url, data)
+        self.assertEqual(response.status_code, 302)
+        invoice = self.load()
+        self.assertEqual(invoice.notes, 'Editada en el admin')
+        self.assertEqual((invoice.advance_payment, invoice.pending_balance), (Decimal('25.00'), Decimal('75.00')))
+        self.assertEqual(InvoicePayment.objects.count(), 1)
+
+
+class InvoiceChangelistCountTests(TestCase):
+    """El listado de boletas cuenta con tope, siempre al día."""
+
+    def test_count_is_exact_below_the_limit_and_capped_above(self):
+        user = get_user_model().objects.create_user(username='cliente', password='x')
+        Invoice.objects.bulk_create([Invoice(client=user, series='B001', status='emitida') for _ in range(3)])
+        emitted = Invoice.objects.filter(status='emitida').order_by('-date_issued')
+        self.assertEqual(BoundedCountPaginator(emitted, 2).count, 3)
+        # Una boleta nueva se ve en el siguiente conteo (nada cacheado)
+        Invoice.objects.create(client=user, series='B001', status='emitida')
+        paginator = BoundedCountPaginator(emitted, 2)
+        self.assertEqual((paginator.count, paginator.num_pages), (4, 2))
 
-# Create your tests here.
+        with mock.patch.object(BoundedCountPaginator, 'COUNT_LIMIT', 3):
+            paginator = BoundedCountPaginator(emitted, 2)
+            self.assertEqual((paginator.count, paginator.num_pages), (3, 2))
+            self.assertEqual(len(paginator.page(2).object_list), 1)
@@ -7,7 +7,9 @@ from django.contrib import messages
 from django.contrib import admin
 from django.contrib.auth.decorators import login_required
 from decimal import Decimal
+import uuid
 from .models import Invoice
+from .payments import record_payment, PaymentRejected
 
 # --- IMPORTANTE: Importamos la función de envío de correo ---
 # Asegúrate de que este import apunte correctamente a donde definiste la función
@@ -28,6 +30,24 @@ def print_invoice(request, invoice_id):
         'print_view': True, 
     })
 
+def _render_payment_form(request, invoice, idempotency_key, error_message=None):
+    context = {
+        'invoice': invoice,
+        'payments': invoice.payments.all(),
+        'idempotency_key': idempotency_key,
+        'title': f'Registrar pago para boleta #{invoice.number or "(borrador)"}',
+        'site_header': 'Administración',
+        'has_permission': True,
+        'is_popup': False,
+        'is_nav_sidebar_enabled': True,
+        'available_apps': admin.site.get_app_list(request),
+        'opts': invoice._meta,
+    }
+    if error_message:
+        context['error_message'] = error_message
+    return render(request, 'admin/invoices/register_payment.html', context)
+
+
 @staff_member_required
 def register_pending_payment(request, invoice_id):
     """Vista para registrar el pago pendiente de una boleta"""
@@ -40,36 +60,31 @@ def register_pending_payment(request, invoice_id):
         amount_paid = Decimal(request.POST.get('amount_paid', 0))
         payment_method = request.POST.get('payment_method', 'efectivo')
         payment_reference = request.POST.get('payment_reference', '')
+        try:
+            idempotency_key = uuid.UUID(request.POST.get('idempotency_key', ''))
+        except ValueError:
+            idempotency_key = None
         
-        # Validar que el monto no sea mayor que el saldo pendiente
-        if amount_paid > invoice.pending_balance:
+        # 1. Asentar el pago en el libro y actualizar adelanto/saldo de forma atómica
+        try:
+            payment, created = record_payment(
+                invoice, amount_paid, payment_method, payment_reference,
+                idempotency_key=idempotency_key, user=request.user,
+            )
+        except PaymentRejected as e:
             messages.error(
                 request,
-                f"El monto a pagar (S/ {amount_paid}) no puede ser mayor que el saldo pendiente (S/ {invoice.pending_balance})."
+                f"{e} Monto: S/ {amount_paid}, saldo pendiente: S/ {invoice.pending_balance}."
             )
-            # Re-renderizamos el formulario con el error
-            return render(request, 'admin/invoices/register_payment.html', {
-                'invoice': invoice,
-                'title': f'Registrar pago para boleta #{invoice.number or "(borrador)"}',
-                'site_header': 'Administración',
-                'has_permission': True,
-                'is_popup': False,
-                'is_nav_sidebar_enabled': True,
-                'available_apps': admin.site.get_app_list(request),
-                'opts': invoice._meta,
-                'error_message': f"El monto a pagar no puede ser mayor que el saldo pendiente."
-            })
+            # Re-renderizamos el formulario con el error (misma clave: sigue siendo el mismo intento)
+            return _render_payment_form(request, invoice, idempotency_key or uuid.uuid4(), error_message=str(e))
         
-        # 1. Actualizar adelanto y saldo pendiente
-        invoice.advance_payment += amount_paid
-        invoice.pending_balance = invoice.total - invoice.advance_payment
+        if not created:
+            # Doble envío del mismo formulario: el pago ya estaba registrado
+            messages.info(request, f"El pago de S/ {payment.amount} ya estaba registrado.")
+            return redirect('admin:invoices_invoice_change', invoice.id)
         
-        # 2. Actualizar método de pago y referencia
-        invoice.payment_method = payment_method
-        if payment_reference:
-            invoice.payment_reference = payment_reference
-        
-        # 3. VERIFICAR PAGO TOTAL
+        # 2. VERIFICAR PAGO TOTAL
         email_sent_success = False
         email_error_msg = ""
         
@@ -88,8 +103,9 @@ def register_pending_payment(request, invoice_id):
                      invoice.appointment.status = 'completed'
                      invoice.appointment.save(update_fields=['status'])
 
-            # Guardamos para asegurar que el estado 'pagada' esté en BD antes de enviar correo
-            invoice.save()
+            # Guardamos para asegurar que el estado 'pagada' esté en BD antes de enviar correo.
+            # Solo el estado: adelanto y saldo ya los actualizó record_payment
+            invoice.save(update_fields=['status', 'updated_at'])
             
             # --- AQUÍ ESTÁ LA MAGIA: ENVÍO DE CORREO ---
             try:
@@ -100,10 +116,10 @@ def register_pending_payment(request, invoice_id):
                 print(f"❌ Error enviando correo: {e}")
                 email_error_msg = str(e)
         else:
-            # Si no es pago total, solo guardamos
-            invoice.save()
+            # Pago parcial: con 50 soles o más de adelanto se confirma la cita
+            invoice.confirm_appointment_if_advanced()
         
-        # 4. Mensajes informativos
+        # 3. Mensajes informativos
         success_message = f"Pago de S/ {amount_paid} registrado correctamente mediante {dict(Invoice.PAYMENT_METHOD_CHOICES).get(payment_method, payment_method)}."
         
         # Mensaje sobre inventario
@@ -122,17 +138,8 @@ def register_pending_payment(request, invoice_id):
         messages.success(request, success_message)
         return redirect('admin:invoices_invoice_change', invoice.id)
     
-    # GET Request
-    return render(request, 'admin/invoices/register_payment.html', {
-        'invoice': invoice,
-        'title': f'Registrar pago para boleta #{invoice.number or "(borrador)"}',
-        'site_header': 'Administración',
-        'has_permission': True,
-        'is_popup': False,
-        'is_nav_sidebar_enabled': True,
-        'available_apps': admin.site.get_app_list(request),
-        'opts': invoice._meta,
-    })
+    # GET Request: cada formulario lleva su propia clave de idempotencia
+    return _render_payment_form(request, invoice, uuid.uuid4())
 
 @login_required
 def client_print_invoice(request, invoice_id):
@@ -145,7 +145,7 @@ class ServiceAdmin(admin.ModelAdmin):
     inlines = [ServiceComponentInline,ServiceImageInline, ServiceVideoInline]
     fieldsets = (
         (_('Información básica'), {
-            'fields': ('name', 'slug', 'category', 'description', 'base_price')
+            'fields': ('name', 'slug', 'category', 'description', 'base_price', 'duration')
         }),
         (_('Estado'), {
             'fields': ('is_active',)
@@ -64,7 +64,7 @@ class ServiceForm(forms.ModelForm):
     """
     class Meta:
         model = Service
-        fields = ['name', 'slug', 'category', 'description', 'base_price', 'is_active']
+        fields = ['name', 'slug', 'category', 'description', 'base_price', 'duration', 'is_active']
         widgets = {
             'description': forms.Textarea(attrs={'rows': 5, 'cols': 80}),
         }
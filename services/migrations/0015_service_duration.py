@@ -0,0 +1,18 @@
+# Generated by Django 4.2.20 on 2026-10-18 09:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('services', '0014_alter_product_slug'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='service',
+            name='duration',
+            field=models.PositiveIntegerField(default=60, help_text='Tiempo que ocupa una cita de este servicio', verbose_name='Duración (minutos)'),
+        ),
+    ]
@@ -22,6 +22,7 @@ class Service(models.Model):
     name = models.CharField(_("Name"), max_length=100)
     description = models.TextField(_("Description"))
     base_price = models.DecimalField(_("Base Price"), max_digits=10, decimal_places=2)
+    duration = models.PositiveIntegerField(_("Duración (minutos)"), default=60, help_text=_("Tiempo que ocupa una cita de este servicio"))
     is_active = models.BooleanField(_("Is active"), default=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -164,6 +165,14 @@ class Product(models.Model):
     def __str__(self):
         return self.name
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Stock mínimo tal como está en la BD: inventory solo revisa las alertas si cambia
+        if 'stock_min' in field_names:
+            instance._loaded_stock_min = values[field_names.index('stock_min')]
+        return instance
+
     def save(self, *args, **kwargs):
         if not self.slug:
             self.slug = slugify(self.name)